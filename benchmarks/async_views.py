@@ -0,0 +1,223 @@
+"""
+Concurrent requests to the async search APIs, tools page and item detail
+vs. their previous sync implementations, both served by mysite/asgi.py.
+
+Migrates and seeds a throwaway SQLite database, then drives the ASGI
+application in-process (no server, so nothing but Django is measured) with
+``--concurrency`` requests in flight until ``--requests`` have completed per
+route. The sync views are mounted under /sync/ next to the real URLs. Caching
+is disabled so every request reaches the database; ``--db-latency`` adds a
+sleep to every query to stand in for the network round trip to Postgres.
+
+    python -m benchmarks.async_views [--requests 400] [--concurrency 32] [--db-latency 2]
+
+Runs with DEBUG=True so plain HTTP isn't redirected to HTTPS.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+SCRATCH = tempfile.mkdtemp(prefix="toolhub-async-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(SCRATCH, 'async.sqlite3')}"
+os.environ["DEBUG"] = "True"
+
+import benchmarks.utils  # noqa: E402,F401  (sets up Django)
+
+from django.conf import settings  # noqa: E402
+from django.core.asgi import get_asgi_application  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connections  # noqa: E402
+from django.db.backends.signals import connection_created  # noqa: E402
+from django.http import JsonResponse  # noqa: E402
+from django.shortcuts import get_object_or_404, render  # noqa: E402
+from django.test import Client, override_settings  # noqa: E402
+from django.urls import include, path  # noqa: E402
+
+from toolhub import cache  # noqa: E402
+from toolhub.forms import ItemReviewForm  # noqa: E402
+from toolhub.models import CustomUser, Item, ItemReview  # noqa: E402
+from toolhub.pagination import paginate  # noqa: E402
+from toolhub.search import typeahead  # noqa: E402
+from toolhub.views.api import _typeahead_query  # noqa: E402
+
+ITEMS = 500
+
+
+# The sync implementations these views replaced, for comparison.
+
+def sync_search_items(request):
+    q = _typeahead_query(request)
+
+    def build():
+        items = (
+            typeahead(Item.objects.only("id", "name", "status", "borrower"), ["name"], q)
+            .order_by("name", "pk")
+            .with_user_status(request.user)[: settings.TOOLHUB_TYPEAHEAD_LIMIT]
+        )
+        return [{"id": i.id, "name": i.name, "status": i.status, "status_display": i.user_status} for i in items]
+
+    viewer = cache.viewer_key(request.user, per_user=True)
+    return JsonResponse(cache.cached(cache.ITEM_SEARCH, q, viewer, build), safe=False)
+
+
+def sync_search_users(request):
+    q = _typeahead_query(request)
+
+    def build():
+        users = (
+            typeahead(CustomUser.objects.all(), ["username", "email"], q)
+            .order_by("username", "pk")
+            .values("id", "username", "email")[: settings.TOOLHUB_TYPEAHEAD_LIMIT]
+        )
+        return list(users)
+
+    return JsonResponse(cache.cached(cache.USER_SEARCH, q, cache.viewer_key(request.user), build), safe=False)
+
+
+def sync_tools_page(request):
+    items = paginate(request, Item.objects.all().with_user_status(request.user))
+    return render(request, "toolhub/items/tools_page.html", {"items": items, "query": ""})
+
+
+def sync_view_item(request, item_id):
+    item = get_object_or_404(Item, pk=item_id)
+    item.user_status = item.status_for_user(request.user)
+    context = {
+        "item": item,
+        "reviews": item.reviews.select_related("user").order_by("-created_at"),
+        "form": ItemReviewForm(),
+    }
+    return render(request, "toolhub/items/view_item.html", context)
+
+
+urlpatterns = [
+    path("sync/api/search-items/", sync_search_items),
+    path("sync/api/search-users/", sync_search_users),
+    path("sync/tools/", sync_tools_page),
+    path("sync/items/<int:item_id>/", sync_view_item),
+    path("", include("mysite.urls")),
+]
+
+ROUTES = {
+    "search_items": ("/api/search-items/", "q=tool"),
+    "search_users": ("/api/search-users/", "q=user"),
+    "tools_page": ("/tools/", ""),
+    "view_item": ("/items/1/", ""),
+}
+
+
+def seed():
+    call_command("migrate", verbosity=0)
+    patron = CustomUser.objects.create_user(username="user0", email="user0@bench.test", role="patron")
+    CustomUser.objects.bulk_create(
+        CustomUser(username=f"user{i}", email=f"user{i}@bench.test", role="patron") for i in range(1, 50)
+    )
+    Item.objects.bulk_create(
+        Item(name=f"Tool {i}", identifier=f"tool-{i}", description="A tool for benchmarking") for i in range(ITEMS)
+    )
+    ItemReview.objects.bulk_create(
+        ItemReview(item_id=1, user=user, rating=4, comment="Fine") for user in CustomUser.objects.all()[:20]
+    )
+    client = Client()
+    client.force_login(patron)
+    cookie = f"sessionid={client.cookies['sessionid'].value}"
+    connections.close_all()
+    return cookie
+
+
+async def call(app, path, query, cookie):
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(b"host", b"127.0.0.1"), (b"cookie", cookie.encode())],
+        "client": ("127.0.0.1", 50000),
+        "server": ("127.0.0.1", 80),
+    }
+    body = [{"type": "http.request", "body": b"", "more_body": False}]
+    status = []
+
+    async def receive():
+        if body:
+            return body.pop()
+        await asyncio.Future()  # the client never disconnects
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    await app(scope, receive, send)
+    return status[0]
+
+
+async def hammer(app, path, query, cookie, args):
+    slots = asyncio.Semaphore(args.concurrency)
+    latencies, errors = [], []
+
+    async def one():
+        async with slots:
+            start = time.perf_counter()
+            status = await call(app, path, query, cookie)
+            if status == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors.append(status)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(args.requests)))
+    return time.perf_counter() - start, latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--db-latency", type=float, default=2.0, help="ms added to every query")
+    args = parser.parse_args()
+
+    def delay(execute, sql, params, many, context):
+        time.sleep(args.db_latency / 1000)
+        return execute(sql, params, many, context)
+
+    def add_delay(connection, **kwargs):
+        connection.execute_wrappers.append(delay)
+
+    try:
+        cookie = seed()
+        connection_created.connect(add_delay)
+        app = get_asgi_application()
+        dummy = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+        with override_settings(ROOT_URLCONF=sys.modules[__name__], CACHES=dummy):
+            print(
+                f"\n{args.requests} requests per route, {args.concurrency} in flight, "
+                f"{args.db_latency:g} ms per query"
+            )
+            print(f"{'':<8}{'route':<14}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'errors':>8}")
+            for route, (path, query) in ROUTES.items():
+                for label, prefix in (("sync", "/sync"), ("async", "")):
+                    asyncio.run(call(app, prefix + path, query, cookie))  # warm up
+                    elapsed, latencies, errors = asyncio.run(hammer(app, prefix + path, query, cookie, args))
+                    quantiles = statistics.quantiles(latencies, n=100)
+                    print(
+                        f"{label:<8}{route:<14}{len(latencies) / elapsed:>10.1f}"
+                        f"{quantiles[49] * 1000:>10.1f}{quantiles[94] * 1000:>10.1f}{len(errors):>8}"
+                    )
+    finally:
+        connection_created.disconnect(add_delay)
+        connections.close_all()
+        shutil.rmtree(SCRATCH, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+BorrowRequest hot predicates with and without the composite/partial indexes.
+
+Seeds a large BorrowRequest table (1,000,000 rows by default; pass a smaller
+count as the first argument for a quick run), prints the query plan for each
+access path, times it, then drops the Meta.indexes and repeats.
+
+    python -m benchmarks.borrow_indexes [rows]
+"""
+import random
+import sys
+from datetime import timedelta
+
+from benchmarks.utils import scratch_database, measure, report
+
+from django.db import connection
+from django.utils import timezone
+
+from toolhub.models import BorrowRequest, CustomUser, Item
+
+ITEMS = 10_000
+USERS = 2_000
+STATUSES = ["returned_on_time"] * 80 + ["returned_overdue"] * 5 + ["denied"] * 5 + ["pending"] * 5 + ["approved"] * 5
+
+
+def seed(rows):
+    CustomUser.objects.bulk_create(
+        CustomUser(username=f"user{i}", email=f"user{i}@bench.test") for i in range(USERS)
+    )
+    Item.objects.bulk_create(Item(name=f"Tool {i}", identifier=f"tool-{i}") for i in range(ITEMS))
+    user_ids = list(CustomUser.objects.values_list("pk", flat=True))
+    item_ids = list(Item.objects.values_list("pk", flat=True))
+
+    rng = random.Random(42)
+    start = timezone.now() - timedelta(days=3 * 365)
+    table = BorrowRequest._meta.db_table
+    sql = f"INSERT INTO {table} (item_id, user_id, status, request_date) VALUES (%s, %s, %s, %s)"
+    with connection.cursor() as cursor:
+        for offset in range(0, rows, 50_000):
+            cursor.executemany(sql, [
+                (
+                    rng.choice(item_ids),
+                    rng.choice(user_ids),
+                    rng.choice(STATUSES),
+                    start + timedelta(seconds=rng.randrange(3 * 365 * 86400)),
+                )
+                for _ in range(min(50_000, rows - offset))
+            ])
+        if connection.vendor == "sqlite":
+            cursor.execute("ANALYZE")
+        else:
+            cursor.execute(f"ANALYZE {table}")
+
+    # A patron with the median number of requests, and an item they requested.
+    sample = BorrowRequest.objects.filter(status="approved").order_by("pk").first()
+    return sample.user, sample.item
+
+
+def access_paths(user, item):
+    newest = BorrowRequest.objects.order_by("-request_date", "-pk")[25]
+    return {
+        "active request exists": lambda: BorrowRequest.objects.filter(
+            item=item, user=user, status__in=["pending", "approved"]
+        ),
+        "return_item latest approved": lambda: BorrowRequest.objects.filter(
+            item=item, user=user, status="approved"
+        ).order_by("-request_date")[:1],
+        "overview page 1": lambda: BorrowRequest.objects.order_by("-request_date", "-pk")[:25],
+        "overview next page": lambda: BorrowRequest.objects.filter(
+            request_date__lt=newest.request_date
+        ).order_by("-request_date", "-pk")[:25],
+        "patron history page": lambda: BorrowRequest.objects.filter(user=user).order_by(
+            "-request_date", "-pk"
+        )[:25],
+        "user's active item ids": lambda: BorrowRequest.objects.filter(
+            user=user, status__in=["pending", "approved"]
+        ).values_list("item_id", flat=True),
+        "tools page statuses": lambda: Item.objects.order_by("pk").with_user_status(user)[:24],
+    }
+
+
+def run(label, user, item):
+    rows = []
+    for name, build in access_paths(user, item).items():
+        print(f"\n[{label}] {name}\n{build().explain()}")
+        ms, queries = measure(lambda: list(build()), repeat=20)
+        rows.append((name, ms, queries))
+    report(f"{label}", rows)
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    with scratch_database():
+        print(f"Seeding {rows:,} borrow requests...")
+        user, item = seed(rows)
+        run("with indexes", user, item)
+
+        with connection.schema_editor() as editor:
+            for index in BorrowRequest._meta.indexes:
+                editor.remove_index(BorrowRequest, index)
+        run("without indexes", user, item)
+
+
+if __name__ == "__main__":
+    main()
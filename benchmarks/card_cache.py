@@ -0,0 +1,65 @@
+"""
+Listing render time with and without the card fragment cache.
+
+Seeds 100 items with image derivatives and renders the tools page (one page of
+100 cards) for a patron with the cache disabled, then cold and warm with a
+local-memory cache. Warm renders only fetch the fragments with one get_many.
+
+    python -m benchmarks.card_cache
+"""
+from benchmarks.utils import scratch_database, measure, report
+
+from django.core.cache import cache
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from toolhub.models import CustomUser, Item
+
+CARDS = 100
+LOCMEM = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "bench"}}
+DUMMY = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+
+
+def seed():
+    patron = CustomUser.objects.create_user(username="patron", email="patron@bench.test")
+    variants = {
+        variant: {ext: {str(w): f"items/{{}}.{variant}-{w}.{ext}" for w in widths} for ext in ("webp", "jpeg")}
+        for variant, widths in {"card": (400, 800), "detail": (800, 1600)}.items()
+    }
+    Item.objects.bulk_create(
+        Item(
+            name=f"Tool {i}",
+            identifier=f"tool-{i}",
+            description="A well-used tool with a fairly ordinary description of what it does " * 2,
+            image=f"items/{i}.jpg",
+            image_derivatives={"source": f"items/{i}.jpg", "variants": variants},
+        )
+        for i in range(CARDS)
+    )
+    return patron
+
+
+def main():
+    settings = dict(SECURE_SSL_REDIRECT=False, SESSION_COOKIE_SECURE=False, TOOLHUB_PAGE_SIZE=CARDS)
+    with scratch_database(), override_settings(**settings):
+        patron = seed()
+        client = Client()
+        client.force_login(patron)
+        url = reverse("tools_page")
+
+        with override_settings(CACHES=DUMMY):
+            rows = [("no card cache", *measure(lambda: client.get(url)))]
+        with override_settings(CACHES=LOCMEM):
+            def cold():
+                cache.clear()
+                client.get(url)
+
+            rows += [
+                ("card cache, cold", *measure(cold)),
+                ("card cache, warm", *measure(lambda: client.get(url))),
+            ]
+        report(f"tools_page with {CARDS} cards", rows)
+
+
+if __name__ == "__main__":
+    main()
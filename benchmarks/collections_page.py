@@ -0,0 +1,79 @@
+"""
+collections_page data loading: per-item queries vs. the annotated Prefetch.
+
+Seeds 200 collections x 50 items and compares the original nested loop
+(status_for_user + exists() per item, items.count() per card) with the
+prefetch pipeline the view uses now. Also times the real view at its
+default page size.
+
+    python -m benchmarks.collections_page
+"""
+from benchmarks.utils import scratch_database, measure, report
+
+from django.db.models import Prefetch
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from toolhub.models import BorrowRequest, Collection, CustomUser, Item
+
+COLLECTIONS = 200
+ITEMS_PER_COLLECTION = 50
+
+
+def seed():
+    librarian = CustomUser.objects.create_user(username="librarian", email="librarian@bench.test", role="librarian")
+    patron = CustomUser.objects.create_user(username="patron", email="patron@bench.test", password="pass")
+    items = Item.objects.bulk_create(
+        Item(name=f"Tool {i}", identifier=f"tool-{i}") for i in range(COLLECTIONS * ITEMS_PER_COLLECTION)
+    )
+    collections = Collection.objects.bulk_create(
+        Collection(title=f"Kit {i}", description="Kit", creator=librarian) for i in range(COLLECTIONS)
+    )
+    Through = Collection.items.through
+    Through.objects.bulk_create(
+        Through(collection_id=collection.pk, item_id=items[c * ITEMS_PER_COLLECTION + i].pk)
+        for c, collection in enumerate(collections)
+        for i in range(ITEMS_PER_COLLECTION)
+    )
+    Collection.objects.refresh_item_counts()
+    BorrowRequest.objects.bulk_create(BorrowRequest(item=item, user=patron) for item in items[::7])
+    return patron
+
+
+def per_item_queries(user):
+    for collection in Collection.objects.all():
+        for item in collection.items.all():
+            item.user_status = item.status_for_user(user)
+            item.already_requested = BorrowRequest.objects.filter(
+                item=item, user=user, status__in=["pending", "approved"]
+            ).exists()
+        collection.items.count()
+
+
+def prefetch_pipeline(user):
+    collections = Collection.objects.prefetch_related(
+        Prefetch("items", queryset=Item.objects.with_user_status(user))
+    )
+    for collection in collections:
+        for item in collection.items.all():
+            item.user_status
+        collection.item_count
+
+
+def main():
+    with scratch_database(), override_settings(SECURE_SSL_REDIRECT=False, SESSION_COOKIE_SECURE=False):
+        patron = seed()
+        client = Client()
+        client.force_login(patron)
+        url = reverse("collections_page")
+
+        rows = [
+            ("per-item queries", *measure(lambda: per_item_queries(patron), repeat=1)),
+            ("annotated Prefetch", *measure(lambda: prefetch_pipeline(patron))),
+            ("collections_page view", *measure(lambda: client.get(url))),
+        ]
+        report(f"{COLLECTIONS} collections x {ITEMS_PER_COLLECTION} items", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Throughput of home and tools_page under gunicorn: sync workers vs. gthread.
+
+Migrates and seeds a throwaway SQLite database, then for each worker model
+starts gunicorn with gunicorn.conf.py (same number of worker processes) and
+keeps ``--clients`` concurrent keep-alive clients requesting each route for
+``--seconds``. Reports requests per second and latency percentiles.
+
+    python -m benchmarks.load_test [--workers 2] [--clients 16] [--seconds 10]
+
+Runs with DEBUG=True so plain HTTP isn't redirected to HTTPS; templates and
+database settings don't depend on DEBUG.
+"""
+import argparse
+import os
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+SCRATCH = tempfile.mkdtemp(prefix="toolhub-load-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(SCRATCH, 'load.sqlite3')}"
+os.environ["DEBUG"] = "True"
+
+import benchmarks.utils  # noqa: E402,F401  (sets up Django)
+
+import requests  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connections  # noqa: E402
+
+from toolhub.models import Collection, CustomUser, Item  # noqa: E402
+
+ITEMS = 500
+COLLECTIONS = 50
+ROUTES = {"home": "/", "tools_page": "/tools/"}
+PORT = 8765
+
+MODELS = {
+    "sync": ["--worker-class", "sync", "--threads", "1"],
+    "gthread x4": ["--worker-class", "gthread", "--threads", "4"],
+}
+
+
+def seed():
+    call_command("migrate", verbosity=0)
+    librarian = CustomUser.objects.create_user(username="librarian", email="librarian@load.test", role="librarian")
+    Item.objects.bulk_create(
+        Item(name=f"Tool {i}", identifier=f"tool-{i}", description="A tool for load testing") for i in range(ITEMS)
+    )
+    Collection.objects.bulk_create(
+        Collection(title=f"Kit {i}", description="Kit", creator=librarian) for i in range(COLLECTIONS)
+    )
+    connections.close_all()
+
+
+def wait_until_up(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn did not start")
+
+
+def hammer(url, clients, seconds):
+    latencies, errors = [], []
+    stop = time.monotonic() + seconds
+
+    def client():
+        session = requests.Session()
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            response = session.get(url)
+            elapsed = time.perf_counter() - start
+            if response.status_code == 200:
+                latencies.append(elapsed)
+            else:
+                errors.append(response.status_code)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors
+
+
+def run(label, flags, args):
+    env = {**os.environ, "WEB_CONCURRENCY": str(args.workers), "PORT": str(PORT)}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "--config", "gunicorn.conf.py", "--access-logfile", "/dev/null", *flags],
+        env=env,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_up(f"http://127.0.0.1:{PORT}/")
+        for route, path in ROUTES.items():
+            latencies, errors = hammer(f"http://127.0.0.1:{PORT}{path}", args.clients, args.seconds)
+            quantiles = statistics.quantiles(latencies, n=100)
+            print(
+                f"{label:<12}{route:<12}{len(latencies) / args.seconds:>10.1f}"
+                f"{quantiles[49] * 1000:>10.1f}{quantiles[94] * 1000:>10.1f}{len(errors):>8}"
+            )
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--seconds", type=int, default=10)
+    args = parser.parse_args()
+
+    try:
+        seed()
+        print(f"\n{args.workers} workers, {args.clients} clients, {ITEMS} items")
+        print(f"{'':<12}{'route':<12}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'errors':>8}")
+        for label, flags in MODELS.items():
+            run(label, flags, args)
+    finally:
+        shutil.rmtree(SCRATCH, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
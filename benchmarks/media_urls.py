@@ -0,0 +1,48 @@
+"""
+Per-card media URL cost: S3Boto3Storage.url() vs. the cached toolhub.media layer.
+
+Builds a 1000-item page of cards with images and resolves every card's image
+URL through the storage backend, which presigns each one, then through
+toolhub.media cold and warm. Presigning is local, so
+dummy credentials are used and nothing is sent to S3.
+
+    python -m benchmarks.media_urls
+"""
+import os
+
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+
+from benchmarks.utils import measure, report  # noqa: E402
+
+from toolhub import media  # noqa: E402
+from toolhub.models import Item  # noqa: E402
+
+CARDS = 1000
+
+
+def storage_urls(items):
+    return [item.image.url for item in items]
+
+
+def media_urls(items, cold=False):
+    if cold:
+        media.url.cache_clear()
+    return [item.image_url for item in items]
+
+
+def main():
+    items = [Item(name=f"Tool {i}", identifier=f"tool-{i}", image=f"items/{i:032x}.jpg") for i in range(CARDS)]
+
+    rows = [
+        ("storage.url() (signed)", *measure(lambda: storage_urls(items))),
+        ("media.url() cold", *measure(lambda: media_urls(items, cold=True))),
+        ("media.url() warm", *measure(lambda: media_urls(items))),
+    ]
+    report(f"{CARDS} card image URLs", rows)
+    for label, ms, _ in rows:
+        print(f"{label:<28}{ms * 1000 / CARDS:>12.2f} us/card")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+home render time under each template configuration.
+
+Seeds a page worth of items and collections and renders ``home`` for a patron:
+  * uncached loaders with debug info: every request re-reads and re-parses
+    every template;
+  * Django's DEBUG=True defaults: cached loader, but templates compiled with
+    debug info, and each worker's first request compiles them;
+  * the production configuration from settings.py: cached loader, no debug
+    info, warmed at boot by toolhub.templating.
+
+"first" is the best first render of five fresh engines, "steady" the best of
+twenty renders after it.
+
+    python -m benchmarks.template_loading
+"""
+import copy
+
+from benchmarks.utils import scratch_database, measure, report
+
+from django.conf import settings
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from toolhub import templating
+from toolhub.models import Collection, CustomUser, Item
+
+ITEMS = 24
+COLLECTIONS = 24
+FRESH_ENGINES = 5
+DUMMY_CACHE = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+
+
+def seed():
+    patron = CustomUser.objects.create_user(username="patron", email="patron@bench.test")
+    Item.objects.bulk_create(Item(name=f"Tool {i}", identifier=f"tool-{i}") for i in range(ITEMS))
+    Collection.objects.bulk_create(
+        Collection(title=f"Kit {i}", description="Kit", creator=patron) for i in range(COLLECTIONS)
+    )
+    return patron
+
+
+def templates(loaders, debug):
+    config = copy.deepcopy(settings.TEMPLATES)
+    config[0]["OPTIONS"].update(loaders=loaders, debug=debug)
+    return config
+
+
+UNCACHED = ["django.template.loaders.filesystem.Loader", "django.template.loaders.app_directories.Loader"]
+CACHED = [("django.template.loaders.cached.Loader", UNCACHED)]
+
+
+def main():
+    # The card fragment cache is off so every card is rendered from templates.
+    base = dict(SECURE_SSL_REDIRECT=False, SESSION_COOKIE_SECURE=False, CACHES=DUMMY_CACHE)
+    with scratch_database(), override_settings(**base):
+        patron = seed()
+        client = Client()
+        client.force_login(patron)
+        url = reverse("home")
+
+        rows = []
+        for label, loaders, debug, warm in [
+            ("uncached+debug", UNCACHED, True, False),
+            ("DEBUG default", CACHED, True, False),
+            ("production", CACHED, False, True),
+        ]:
+            firsts = []
+            for _ in range(FRESH_ENGINES):
+                with override_settings(TEMPLATES=templates(loaders, debug)):
+                    if warm:
+                        templating.warm()
+                    firsts.append(measure(lambda: client.get(url), repeat=1))
+                    steady = measure(lambda: client.get(url), repeat=20)
+            rows.append((f"{label}, first", *min(firsts)))
+            rows.append((f"{label}, steady", *steady))
+        report(f"home with {ITEMS} items and {COLLECTIONS} collections", rows)
+
+
+if __name__ == "__main__":
+    main()
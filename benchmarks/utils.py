@@ -0,0 +1,59 @@
+"""
+Shared helpers for the benchmark scripts in this directory.
+
+Run a benchmark from the project root, e.g. ``python -m benchmarks.collections_page``.
+Each one seeds its own throwaway test database, so the development database is
+never touched.
+"""
+import contextlib
+import os
+import time
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mysite.settings")
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test.utils import setup_test_environment, teardown_test_environment  # noqa: E402
+
+
+@contextlib.contextmanager
+def scratch_database():
+    """Create a migrated test database for the duration of the block."""
+    setup_test_environment()
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def measure(fn, repeat=5):
+    """Run ``fn`` ``repeat`` times; return (best wall time in ms, queries per run)."""
+    best = float("inf")
+    queries = 0
+    for _ in range(repeat):
+        executed = []
+
+        def count(execute, sql, params, many, context):
+            executed.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            start = time.perf_counter()
+            fn()
+            elapsed = (time.perf_counter() - start) * 1000
+        best = min(best, elapsed)
+        queries = len(executed)
+    return best, queries
+
+
+def report(title, rows):
+    """Print a small table of (label, ms, queries) rows."""
+    print(f"\n{title}")
+    print(f"{'':<28}{'best ms':>12}{'queries':>10}")
+    for label, ms, queries in rows:
+        print(f"{label:<28}{ms:>12.1f}{queries:>10}")
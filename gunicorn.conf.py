@@ -0,0 +1,57 @@
+"""
+Gunicorn settings, loaded from the project root by ``gunicorn mysite.wsgi``.
+
+Requests spend much of their time waiting on Postgres, S3 and row locks, so
+each worker process runs ``GUNICORN_THREADS`` request threads (``gthread``)
+instead of one. ``WEB_CONCURRENCY`` (set by Heroku per dyno size) picks the
+number of processes, defaulting to 2 x cores + 1. mysite/database.py sizes
+each worker's connection pool from the same thread count.
+
+To serve mysite/asgi.py instead, install uvicorn and set
+``GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker`` and
+``GUNICORN_APP=mysite.asgi:application``. The search APIs, tools page and
+item detail are async views; under WSGI each of those requests runs them in
+its own event loop (``python -m benchmarks.async_views`` compares the two).
+
+Benchmark with ``python -m benchmarks.load_test``.
+"""
+import multiprocessing
+import os
+
+wsgi_app = os.environ.get("GUNICORN_APP", "mysite.wsgi:application")
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+# Settings are imported after this file; make the pool size follow the threads.
+os.environ["GUNICORN_THREADS"] = str(threads)
+
+# Load Django and warm the templates once in the master, then fork.
+preload_app = True
+
+# Recycle workers now and then so slow leaks can't build up; the jitter keeps
+# them from all restarting at once.
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 100))
+
+# Heroku's router gives up after 30s.
+timeout = 30
+graceful_timeout = 25
+keepalive = 5
+
+accesslog = "-"
+
+
+def post_fork(server, worker):
+    # Connections opened while preloading belong to the master; never share them.
+    from django.db import connections
+
+    connections.close_all()
+
+
+def post_worker_init(worker):
+    # Replay upload jobs that a killed or recycled worker on this dyno lost.
+    from toolhub import uploads
+
+    uploads.schedule_recovery()
@@ -0,0 +1,97 @@
+"""
+Database configuration for every environment, used by settings.py.
+
+* Heroku, or anywhere ``DATABASE_URL`` is set: that database.
+* GitHub Actions: the Postgres service from .github/workflows.
+* Otherwise: the local SQLite file.
+
+Postgres connections are never opened per request. With psycopg 3 and
+psycopg_pool installed, Django's native pool is used (``OPTIONS["pool"]``);
+with psycopg2, connections persist for ``DB_CONN_MAX_AGE`` seconds with health
+checks. ``DB_POOL=False`` forces persistent connections.
+
+A pool belongs to one gunicorn worker process, so it is sized for that
+worker's request threads (``GUNICORN_THREADS``) plus the background threads
+that also query (``DB_POOL_EXTRA``, e.g. the TOOLHUB_UPLOAD_WORKERS upload
+threads). Across the dyno that makes ``WEB_CONCURRENCY`` x ``max_size``
+connections at most, which must fit under the database's connection limit.
+"""
+import importlib.util
+import os
+import dj_database_url
+
+
+def _int(environ, name, default):
+    return int(environ.get(name, default))
+
+
+def pool_size(environ=os.environ):
+    """(min_size, max_size) of one worker process's pool."""
+    max_size = _int(environ, "DB_POOL_MAX_SIZE", _int(environ, "GUNICORN_THREADS", 1) + _int(environ, "DB_POOL_EXTRA", 2))
+    return min(_int(environ, "DB_POOL_MIN_SIZE", 2), max_size), max_size
+
+
+def _use_pool(environ):
+    return environ.get("DB_POOL", "True") == "True" and importlib.util.find_spec("psycopg_pool") is not None
+
+
+def _connection_reuse(database, environ):
+    if database["ENGINE"] != "django.db.backends.postgresql":
+        return database
+    if _use_pool(environ):
+        min_size, max_size = pool_size(environ)
+        # Pooled connections are returned at the end of each request; Django
+        # requires CONN_MAX_AGE = 0 with a pool.
+        database["CONN_MAX_AGE"] = 0
+        database.setdefault("OPTIONS", {})["pool"] = {
+            "min_size": min_size,
+            "max_size": max_size,
+            "timeout": _int(environ, "DB_POOL_TIMEOUT", 10),
+        }
+    else:
+        database["CONN_MAX_AGE"] = _int(environ, "DB_CONN_MAX_AGE", 600)
+        database["CONN_HEALTH_CHECKS"] = True
+    return database
+
+
+def config(base_dir, environ=os.environ):
+    """The ``default`` database for this environment."""
+    if "DATABASE_URL" in environ:
+        database = dj_database_url.parse(environ["DATABASE_URL"], ssl_require="HEROKU" in environ)
+    elif "GITHUB_ACTIONS" in environ:
+        database = {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": "postgres",  # default DB
+            "USER": "testuser",
+            "PASSWORD": "testpass",
+            "HOST": "localhost",
+            "PORT": "5432",
+        }
+    else:
+        # For local development, always use SQLite
+        database = {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": base_dir / "db.sqlite3",
+        }
+    return _connection_reuse(database, environ)
+
+
+def pool_stats(alias="default"):
+    """Connection reuse statistics of this process for monitoring."""
+    from django.db import connections
+
+    connection = connections[alias]
+    pool = getattr(connection, "pool", None)
+    if pool is not None:
+        return {
+            "mode": "pool",
+            "min_size": pool.min_size,
+            "max_size": pool.max_size,
+            **pool.get_stats(),
+        }
+    return {
+        "mode": "persistent" if connection.settings_dict["CONN_MAX_AGE"] else "per_request",
+        "conn_max_age": connection.settings_dict["CONN_MAX_AGE"],
+        "health_checks": connection.settings_dict["CONN_HEALTH_CHECKS"],
+        "connected": connection.connection is not None,
+    }
@@ -11,9 +11,10 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 import os
-import dj_database_url
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
+from mysite import database
 # from google.auth.environment_vars import AWS_ACCESS_KEY_ID, AWS_DEFAULT_REGION
 
 load_dotenv()
@@ -99,11 +100,16 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'mysite.urls'
 
+# Templates are always served by the cached loader and compiled without debug
+# info, whatever DEBUG is; mysite/wsgi.py warms the cache at worker boot. Set
+# TEMPLATE_DEBUG=True locally for template error pages (edits are still picked
+# up by runserver's autoreloader).
+TEMPLATE_DEBUG = os.environ.get('TEMPLATE_DEBUG', 'False') == 'True'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [str(BASE_DIR / 'toolhub'  / 'templates')],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -111,6 +117,13 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
+            'debug': TEMPLATE_DEBUG,
         },
     },
 ]
@@ -121,37 +134,40 @@ WSGI_APPLICATION = 'mysite.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-if 'HEROKU' in os.environ:
-    # When running on Heroku, use DATABASE_URL from Heroku's config variable
-    DATABASES = {
-        'default': dj_database_url.config(
-            default=os.environ.get('DATABASE_URL'),
-            conn_max_age=600,
-            conn_health_checks=True,
-            ssl_require=True,
-        )
-    }
-elif "GITHUB_ACTIONS" in os.environ:  
-    # Running in GitHub Actions CI
-    DATABASES = {
+# Heroku/DATABASE_URL, GitHub Actions or local SQLite, with pooled or persistent
+# Postgres connections; see mysite/database.py.
+DATABASES = {
+    'default': database.config(BASE_DIR),
+}
+
+
+# Cache
+# Heroku Redis (REDIS_URL) is shared by every dyno and evicts with allkeys-lru;
+# otherwise fall back to the per-process LRU LocMemCache.
+
+if 'REDIS_URL' in os.environ:
+    CACHES = {
         'default': {
-            'ENGINE': 'django.db.backends.postgresql',
-            'NAME': 'postgres', # default DB
-            'USER': 'testuser',
-            'PASSWORD': 'testpass',
-            'HOST': 'localhost',
-            'PORT': '5432',
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
         }
     }
 else:
-    # For local development, always use SQLite
-    DATABASES = {
+    CACHES = {
         'default': {
-            'ENGINE': 'django.db.backends.sqlite3',
-            'NAME': BASE_DIR / 'db.sqlite3',
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 5000},
         }
     }
 
+# Seconds a cached typeahead response may be served
+TOOLHUB_API_CACHE_TIMEOUT = 300
+# Rendered item/collection card fragments; keys change with the card's content
+TOOLHUB_CARD_CACHE_TIMEOUT = 24 * 60 * 60
+# Identifies the deploy, so cached fragments don't outlive it. Heroku sets
+# HEROKU_RELEASE_VERSION with `heroku labs:enable runtime-dyno-metadata`.
+TOOLHUB_RELEASE = os.environ.get('HEROKU_RELEASE_VERSION') or os.environ.get('SOURCE_VERSION', '')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -208,6 +224,22 @@ AWS_MEDIA_LOCATION = ''
 DEFAULT_FILE_STORAGE = 'mysite.storage_backends.MediaStorage'
 # even in development environment, Profile Pictures will be stored in S3
 MEDIA_URL = f'https://{AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com/'
+# Base of every media URL built by toolhub/media.py; point it at a CDN in front of the bucket
+TOOLHUB_MEDIA_BASE_URL = os.environ.get('TOOLHUB_MEDIA_BASE_URL', MEDIA_URL)
+
+# Image uploads are staged on local disk and pushed to S3 by background threads
+# (toolhub/uploads.py); EAGER runs the job inline at commit instead.
+TOOLHUB_UPLOAD_STAGING_DIR = os.environ.get('TOOLHUB_UPLOAD_STAGING_DIR', os.path.join(tempfile.gettempdir(), 'toolhub-uploads'))
+TOOLHUB_UPLOAD_WORKERS = int(os.environ.get('TOOLHUB_UPLOAD_WORKERS', 2))
+TOOLHUB_UPLOADS_EAGER = False
+# Jobs still queued after RECOVER_AFTER seconds were lost with their process;
+# each web worker looks for them every RECOVER_INTERVAL seconds.
+TOOLHUB_UPLOAD_RECOVER_AFTER = int(os.environ.get('TOOLHUB_UPLOAD_RECOVER_AFTER', 15 * 60))
+TOOLHUB_UPLOAD_RECOVER_INTERVAL = int(os.environ.get('TOOLHUB_UPLOAD_RECOVER_INTERVAL', 5 * 60))
+# Browsers may upload straight to the bucket with a presigned POST instead;
+# the bucket's CORS rules must allow POST from the site's origin.
+TOOLHUB_MAX_UPLOAD_SIZE = 20 * 1024 * 1024
+TOOLHUB_DIRECT_UPLOAD_EXPIRES = 600
 
 # Use S3 for static files in production, WhiteNoise in development
 if 'HEROKU' in os.environ:
@@ -222,6 +254,14 @@ else:
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Listing pages (tools, home, collections, borrow requests) are keyset-paginated
+TOOLHUB_PAGE_SIZE = int(os.environ.get('TOOLHUB_PAGE_SIZE', 24))
+TOOLHUB_MAX_PAGE_SIZE = 100
+
+# Typeahead APIs ignore shorter queries and return at most this many rows
+TOOLHUB_TYPEAHEAD_MIN_LENGTH = 2
+TOOLHUB_TYPEAHEAD_LIMIT = 10
+
 
 # Configure Django App for Heroku.
 try:
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
 
 application = get_wsgi_application()
+
+# Compile every template now rather than during this worker's first requests.
+from toolhub import templating  # noqa: E402
+
+templating.warm()
@@ -0,0 +1,230 @@
+"""
+Borrow request state transitions.
+
+Approving a request is a race between librarians: two approvals for the same
+tool must not both succeed. ``approve_request`` serializes them on a row lock
+of the item and only claims it with a conditional ``UPDATE ... WHERE
+status = 'available'``, so the loser sees zero rows updated and rolls back
+even on databases without ``SELECT ... FOR UPDATE`` (SQLite).
+
+``bulk_process`` applies the same rules to a whole batch of the librarian
+queue in one transaction, and ``mark_overdue`` moves loans past their due
+date to ``overdue``.
+"""
+from datetime import timedelta
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils.timezone import now
+from .models import BorrowRequest, Item
+from . import cache, notifications, stats
+
+LOAN_DAYS = 14
+
+# Per-request outcomes reported by bulk_process
+APPROVED = "approved"
+DENIED = "denied"
+NOT_FOUND = "not_found"
+NOT_PENDING = "not_pending"
+UNAVAILABLE = "unavailable"
+
+
+def default_due_date():
+    return now().date() + timedelta(days=LOAN_DAYS)
+
+
+def approve_request(request_id, due_date):
+    """
+    Approve a pending borrow request, hand the item to its requester and deny
+    every other pending request for that item. Returns the approved request
+    and the number of requests denied; raises ``ValidationError`` if the
+    request is no longer pending or the item is not available.
+    """
+    if not due_date:
+        raise ValidationError("A due date must be set when approving a borrow request.")
+
+    with transaction.atomic():
+        borrow_request = BorrowRequest.objects.select_related("user").get(pk=request_id)
+        # Every approval for this item queues on the item's row lock.
+        item = Item.objects.select_for_update().get(pk=borrow_request.item_id)
+
+        claimed = Item.objects.filter(pk=item.pk, status="available").update(
+            status="currently_borrowed", borrower_id=borrow_request.user_id
+        )
+        if not claimed:
+            raise ValidationError(f"Item '{item.name}' is not available.")
+
+        approved = BorrowRequest.objects.filter(pk=borrow_request.pk, status="pending").update(
+            status="approved", return_due_date=due_date
+        )
+        if not approved:
+            # Raising inside atomic() also rolls back the item claim above.
+            raise ValidationError("Only pending requests can be approved.")
+
+        denied = (
+            BorrowRequest.objects.filter(item_id=item.pk, status="pending")
+            .exclude(pk=borrow_request.pk)
+            .update(status="denied")
+        )
+        # Queryset updates skip post_save: count the transitions and invalidate
+        # the item typeahead here.
+        stats.record([(item.pk, item.location, "approved")] + [(item.pk, item.location, "denied")] * denied)
+        transaction.on_commit(lambda: cache.bump_version(cache.ITEM_SEARCH))
+
+    item.status = "currently_borrowed"
+    item.borrower = borrow_request.user
+    borrow_request.item = item
+    borrow_request.status = "approved"
+    borrow_request.return_due_date = due_date
+    return borrow_request, denied
+
+
+def bulk_process(request_ids, action, due_date=None):
+    """
+    Approve or deny (``action`` is ``"approve"`` or ``"deny"``) many borrow
+    requests at once, inside a single transaction. The requests are validated in
+    one query; denials are written with one conditional ``UPDATE`` and each
+    approval with conditional ``UPDATE``s like ``approve_request``, so only rows
+    still pending and items still available change. Returns
+    ``{request_id: outcome}`` for every id passed in.
+
+    Approvals are taken in id order; once an item is claimed, later requests for
+    it in the batch, like any other pending request for it, are denied.
+    """
+    if action not in ("approve", "deny"):
+        raise ValueError(f"Unknown borrow action: {action!r}")
+    request_ids = list(dict.fromkeys(int(pk) for pk in request_ids))
+    due_date = due_date or default_due_date()
+    results = dict.fromkeys(request_ids, NOT_FOUND)
+
+    with transaction.atomic():
+        # Lock the items before reading the requests, in the same order as
+        # approve_request, so the two paths can't deadlock and no approval for
+        # these items can run until this batch commits.
+        locked = Item.objects.select_for_update().filter(
+            pk__in=BorrowRequest.objects.filter(pk__in=request_ids).values("item_id")
+        )
+        items = {item.pk: item for item in locked}
+        requests = BorrowRequest.objects.select_related("item").filter(pk__in=request_ids).order_by("pk")
+
+        changed, claimed_ids = [], set()
+        for borrow_request in requests:
+            if borrow_request.status != "pending":
+                results[borrow_request.pk] = NOT_PENDING
+                continue
+            if action == "deny":
+                changed.append(borrow_request)
+                continue
+
+            item = items[borrow_request.item_id]
+            if item.pk in claimed_ids:
+                results[borrow_request.pk] = DENIED  # lost to an earlier request in the batch
+            elif item.status != "available":
+                results[borrow_request.pk] = UNAVAILABLE
+            else:
+                results[borrow_request.pk] = _approve(borrow_request, due_date)
+                if results[borrow_request.pk] == APPROVED:
+                    claimed_ids.add(item.pk)
+                    changed.append(borrow_request)
+
+        if action == "deny":
+            changed = _deny(changed, results)
+        transitions = [(r.item_id, r.item.location, r.status) for r in changed]
+        if claimed_ids:
+            competing = BorrowRequest.objects.filter(item_id__in=claimed_ids, status="pending")
+            transitions += [
+                (item_id, location, "denied")
+                for item_id, location in competing.values_list("item_id", "item__location")
+            ]
+            competing.update(status="denied")
+        stats.record(transitions)
+        if changed:
+            transaction.on_commit(lambda: cache.bump_version(cache.ITEM_SEARCH))
+
+    return results
+
+
+def _approve(borrow_request, due_date):
+    """
+    Claim the request's item and approve the request with conditional
+    ``UPDATE``s, as ``approve_request`` does, so neither write lands on a row
+    that changed since it was read, even where ``SELECT ... FOR UPDATE`` is a
+    no-op. Runs in a savepoint: a request that is no longer pending gives the
+    item back. Returns the outcome.
+    """
+    with transaction.atomic():
+        claimed = Item.objects.filter(pk=borrow_request.item_id, status="available").update(
+            status="currently_borrowed", borrower_id=borrow_request.user_id
+        )
+        if not claimed:
+            return UNAVAILABLE
+        approved = BorrowRequest.objects.filter(pk=borrow_request.pk, status="pending").update(
+            status="approved", return_due_date=due_date
+        )
+        if not approved:
+            transaction.set_rollback(True)
+            return NOT_PENDING
+    borrow_request.status = "approved"
+    borrow_request.return_due_date = due_date
+    return APPROVED
+
+
+def _deny(pending, results):
+    """
+    Deny requests read as pending, with a conditional ``UPDATE`` so a request
+    that was approved (or otherwise moved on) since it was read is left alone.
+    Returns the requests actually denied.
+    """
+    ids = [borrow_request.pk for borrow_request in pending]
+    denied = BorrowRequest.objects.filter(pk__in=ids, status="pending").update(status="denied")
+    if denied < len(ids):
+        # Rare: find out which rows the UPDATE skipped.
+        now_denied = set(BorrowRequest.objects.filter(pk__in=ids, status="denied").values_list("pk", flat=True))
+        pending = [borrow_request for borrow_request in pending if borrow_request.pk in now_denied]
+    for borrow_request in pending:
+        borrow_request.status = "denied"
+        results[borrow_request.pk] = DENIED
+    for pk in ids:
+        if results[pk] != DENIED:
+            results[pk] = NOT_PENDING
+    return pending
+
+
+def _mark_overdue_batch(request_ids):
+    with transaction.atomic():
+        # Rows another worker holds are skipped, rows it already marked no
+        # longer match status="approved"; each loan is marked (and notified) once.
+        batch = list(
+            BorrowRequest.objects.select_for_update(skip_locked=True, of=("self",))
+            .select_related("item")
+            .filter(pk__in=request_ids, status="approved")
+        )
+        for borrow_request in batch:
+            borrow_request.status = "overdue"
+        BorrowRequest.objects.bulk_update(batch, ["status"])
+        notifications.queue_overdue(batch)
+        stats.record((r.item_id, r.item.location, "overdue") for r in batch)
+    return len(batch)
+
+
+def mark_overdue(today=None, batch_size=500):
+    """
+    Mark approved requests whose ``return_due_date`` has passed as overdue and
+    queue a notification for each, ``batch_size`` rows per transaction. Ids are
+    streamed with ``iterator()``, so memory stays flat however many loans are
+    late. Safe to run from several processes at once. Returns the number marked.
+    """
+    today = today or now().date()
+    due = (
+        BorrowRequest.objects.filter(status="approved", return_due_date__lt=today)
+        .order_by("return_due_date", "pk")
+        .values_list("pk", flat=True)
+    )
+    marked, batch = 0, []
+    for request_id in due.iterator(chunk_size=batch_size):
+        batch.append(request_id)
+        if len(batch) == batch_size:
+            marked += _mark_overdue_batch(batch)
+            batch = []
+    if batch:
+        marked += _mark_overdue_batch(batch)
+    return marked
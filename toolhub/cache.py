@@ -0,0 +1,103 @@
+"""
+Versioned response caching.
+
+Cached entries live under a namespace whose version number is part of every
+key. Writes that could change a cached result bump the namespace version (see
+signals.py), which orphans the old entries at once; the cache backend's LRU
+eviction and the TTL then reclaim them.
+"""
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import cache
+
+# Namespaces for the typeahead APIs
+ITEM_SEARCH = "item-search"
+USER_SEARCH = "user-search"
+
+# Namespaces for rendered listing cards (see templatetags/card_tags.py)
+ITEM_CARD = "item-card"
+COLLECTION_CARD = "collection-card"
+
+
+def _version_key(namespace):
+    return f"toolhub:version:{namespace}"
+
+
+def get_version(namespace):
+    # Seeded from the clock so a version that was evicted never restarts at a
+    # number whose entries may still be cached.
+    return cache.get_or_set(_version_key(namespace), time.time_ns, timeout=None)
+
+
+def bump_version(namespace):
+    try:
+        cache.incr(_version_key(namespace))
+    except ValueError:
+        cache.set(_version_key(namespace), time.time_ns(), timeout=None)
+
+
+def viewer_key(user, per_user=False):
+    """Identify the viewer: always by role, and by user id when results are per user."""
+    if user is None or not user.is_authenticated:
+        return "anonymous"
+    if per_user:
+        return f"{user.role}:{user.pk}"
+    return user.role
+
+
+def _entry_key(namespace, version, viewer, query):
+    digest = hashlib.md5(query.encode()).hexdigest()
+    return f"toolhub:{namespace}:v{version}:{viewer}:{digest}"
+
+
+def cached(namespace, query, viewer, build):
+    """
+    Return the cached result of ``build()`` for this namespace, normalized
+    query and viewer, computing and storing it on a miss.
+    """
+    key = _entry_key(namespace, get_version(namespace), viewer, query)
+    result = cache.get(key)
+    if result is None:
+        result = build()
+        cache.set(key, result, settings.TOOLHUB_API_CACHE_TIMEOUT)
+    return result
+
+
+async def acached(namespace, query, viewer, build):
+    """``cached()`` for async views; ``build`` is a coroutine function."""
+    version = await cache.aget_or_set(_version_key(namespace), time.time_ns, timeout=None)
+    key = _entry_key(namespace, version, viewer, query)
+    result = await cache.aget(key)
+    if result is None:
+        result = await build()
+        await cache.aset(key, result, settings.TOOLHUB_API_CACHE_TIMEOUT)
+    return result
+
+
+def cached_fragments(namespace, objects, version, viewer, render):
+    """
+    Return ``{pk: render(obj)}`` for ``objects``, cached per pk, ``version(obj)``
+    and viewer. Hits cost one ``get_many`` for the whole list, misses one
+    ``set_many``. A changed version is a new key, so nothing needs deleting.
+    """
+    keys = _fragment_keys(namespace, objects, version, viewer)
+    found = cache.get_many(keys)
+    missing = {key: render(obj) for key, obj in keys.items() if key not in found}
+    if missing:
+        cache.set_many(missing, settings.TOOLHUB_CARD_CACHE_TIMEOUT)
+    return {obj.pk: found[key] if key in found else missing[key] for key, obj in keys.items()}
+
+
+async def acached_fragments(namespace, objects, version, viewer, render):
+    """``cached_fragments()`` for async views."""
+    keys = _fragment_keys(namespace, objects, version, viewer)
+    found = await cache.aget_many(keys)
+    missing = {key: render(obj) for key, obj in keys.items() if key not in found}
+    if missing:
+        await cache.aset_many(missing, settings.TOOLHUB_CARD_CACHE_TIMEOUT)
+    return {obj.pk: found[key] if key in found else missing[key] for key, obj in keys.items()}
+
+
+def _fragment_keys(namespace, objects, version, viewer):
+    return {f"toolhub:{namespace}:{obj.pk}:{version(obj)}:{viewer}": obj for obj in objects}
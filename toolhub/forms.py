@@ -1,17 +1,26 @@
 from datetime import timezone
 from django import forms
 from django.utils import timezone
+from django.urls import reverse_lazy
 from .models import CustomUser, Item, Collection, ItemReview, BorrowRequest
 from django.core.exceptions import ValidationError
 from django.contrib.auth import get_user_model
 
 
+# Lets toolhub/js/direct_upload.js send the picture straight to S3.
+PROFILE_PICTURE_ATTRS = {
+    "class": "form-control-file",
+    "data-direct-upload": "profile",
+    "data-presign-url": reverse_lazy("api_presign_upload"),
+}
+
+
 class ProfilePictureForm(forms.ModelForm):
     class Meta:
         model = CustomUser
         fields = ["profile_picture"]
         widgets = {
-            "profile_picture": forms.FileInput(attrs={"class": "form-control-file"}),
+            "profile_picture": forms.FileInput(attrs=PROFILE_PICTURE_ATTRS),
         }
 
 
@@ -26,7 +35,7 @@ class UserProfileForm(forms.ModelForm):
             "phone_number",
         ]
         widgets = {
-            "profile_picture": forms.FileInput(attrs={"class": "form-control-file"}),
+            "profile_picture": forms.FileInput(attrs=PROFILE_PICTURE_ATTRS),
         }
     def __init__(self, *args, **kwargs):
         user = kwargs.pop("user", None)
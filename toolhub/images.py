@@ -0,0 +1,163 @@
+"""
+Resized derivatives of uploaded images.
+
+Cards, detail pages and avatars shouldn't download the multi-megabyte
+original. After an image is saved, ``generate()`` writes WebP and JPEG copies
+at a few widths per variant beside it in the same storage, e.g.
+``items/<uuid>.card-400.webp``, and records their names in the model's
+``*_derivatives`` JSON field::
+
+    {"source": "items/<uuid>.jpg", "variants": {"card": {"webp": {"400": "items/...webp"}}}}
+
+``srcsets()`` turns that record into ready-to-render ``srcset`` strings. A
+record whose ``source`` no longer matches the field is stale and ignored.
+"""
+import io
+import os
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+from . import media
+
+# Widths generated for each variant; avatars are square crops.
+VARIANT_WIDTHS = {
+    "card": [400, 800],
+    "detail": [800, 1600],
+    "avatar": [160, 320],
+}
+SQUARE_VARIANTS = {"avatar"}
+
+FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+# Image formats browsers may upload straight to the bucket (toolhub.uploads)
+UPLOAD_FORMATS = {"JPEG", "PNG", "GIF", "WEBP"}
+
+# (model label, image field) -> (derivatives field, variants)
+IMAGE_FIELDS = {
+    ("toolhub.Item", "image"): ("image_derivatives", ["card", "detail"]),
+    ("toolhub.Collection", "image"): ("image_derivatives", ["card", "detail"]),
+    ("toolhub.CustomUser", "profile_picture"): ("profile_picture_derivatives", ["avatar"]),
+}
+
+
+class Srcset:
+    """The WebP and JPEG ``srcset`` strings of one variant, plus a JPEG ``src`` fallback."""
+
+    def __init__(self, files):
+        self.webp = self._srcset(files.get("webp", {}))
+        self.jpeg = self._srcset(files.get("jpeg", {}))
+        jpeg = files.get("jpeg", {})
+        self.src = media.url(jpeg[min(jpeg, key=int)]) if jpeg else ""
+
+    @staticmethod
+    def _srcset(names):
+        widths = sorted(names, key=int)
+        return ", ".join(f"{media.url(names[width])} {width}w" for width in widths)
+
+    def __bool__(self):
+        return bool(self.src)
+
+
+def srcsets(fieldfile, derivatives):
+    """Map variant name to ``Srcset`` for an up-to-date derivatives record, else ``{}``."""
+    if not fieldfile or not derivatives or derivatives.get("source") != fieldfile.name:
+        return {}
+    return {variant: Srcset(files) for variant, files in derivatives.get("variants", {}).items()}
+
+
+def _fields(instance):
+    for (label, field), spec in IMAGE_FIELDS.items():
+        if instance._meta.label == label:
+            yield field, spec
+
+
+def _resize(image, variant, width):
+    if variant in SQUARE_VARIANTS:
+        return ImageOps.fit(image, (width, width), Image.Resampling.LANCZOS)
+    height = round(image.height * width / image.width)
+    return image.resize((width, height), Image.Resampling.LANCZOS)
+
+
+def _widths(image, variant):
+    limit = min(image.size) if variant in SQUARE_VARIANTS else image.width
+    # Never upscale, but always produce at least one size.
+    return [width for width in VARIANT_WIDTHS[variant] if width <= limit] or [limit]
+
+
+def _render(fieldfile, variants):
+    """Write every variant of ``fieldfile`` to its storage and return their names."""
+    largest = max(width for variant in variants for width in VARIANT_WIDTHS[variant])
+    with fieldfile.storage.open(fieldfile.name, "rb") as source:
+        image = Image.open(source)
+        # Let the JPEG decoder downscale by a power of two while reading, which
+        # is far cheaper than decoding a full-size phone photo.
+        image.draft("RGB", (largest, largest))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+
+    stem = os.path.splitext(fieldfile.name)[0]
+    result = {}
+    for variant in variants:
+        result[variant] = {}
+        for extension, (pil_format, options) in FORMATS.items():
+            result[variant][extension] = {}
+            for width in _widths(image, variant):
+                buffer = io.BytesIO()
+                _resize(image, variant, width).save(buffer, pil_format, **options)
+                name = f"{stem}.{variant}-{width}.{extension}"
+                result[variant][extension][str(width)] = fieldfile.storage.save(name, ContentFile(buffer.getvalue()))
+    return result
+
+
+def _delete(storage, derivatives):
+    for files in derivatives.get("variants", {}).values():
+        for names in files.values():
+            for name in names.values():
+                storage.delete(name)
+
+
+def is_upload_image(storage, name):
+    """Whether ``name`` in ``storage`` is an image in one of ``UPLOAD_FORMATS``."""
+    try:
+        with storage.open(name, "rb") as f, Image.open(f) as image:
+            image.verify()
+            return image.format in UPLOAD_FORMATS
+    except (UnidentifiedImageError, OSError, ValueError, SyntaxError, Image.DecompressionBombError):
+        return False
+
+
+def generate(instance, force=False):
+    """
+    Bring ``instance``'s derivatives up to date with its image fields: render
+    new ones for a changed image, delete those of a replaced or cleared one.
+    Fields still flagged as processing are left alone.
+    Files Pillow can't read are recorded with no variants so they aren't
+    retried on every save. Returns True if anything changed.
+    """
+    updates = {}
+    for field, (derivatives_field, variants) in _fields(instance):
+        if getattr(instance, f"{field}_processing", False):
+            continue  # toolhub.uploads renders these once the upload has landed
+        fieldfile = getattr(instance, field)
+        derivatives = getattr(instance, derivatives_field) or {}
+        source = fieldfile.name if fieldfile else None
+        if derivatives.get("source") == source and not force:
+            continue
+
+        if derivatives:
+            _delete(fieldfile.storage, derivatives)
+        record = {}
+        if source:
+            try:
+                record = {"source": source, "variants": _render(fieldfile, variants)}
+            except (UnidentifiedImageError, OSError, ValueError, Image.DecompressionBombError):
+                record = {"source": source, "variants": {}}
+        updates[derivatives_field] = record
+
+    if updates:
+        for name, value in updates.items():
+            setattr(instance, name, value)
+        # A queryset update, so saving derivatives doesn't re-trigger post_save.
+        instance._meta.model._default_manager.filter(pk=instance.pk).update(**updates)
+    return bool(updates)
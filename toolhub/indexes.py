@@ -0,0 +1,39 @@
+"""
+Indexes that exist on one database vendor only.
+
+Search lookups compile to different SQL on PostgreSQL and SQLite, so each
+vendor gets the index that serves its query and skips the other's, which would
+either fail to create (GIN on SQLite) or never be used. Declare them in
+``Meta.indexes`` like any other index: migrations then track them, and SQLite's
+table rebuilds recreate them.
+"""
+from django.contrib.postgres.indexes import GinIndex
+from django.db import models
+from django.db.backends.ddl_references import Statement
+
+
+class _VendorIndex:
+    vendor = None
+
+    def _skipped(self, schema_editor):
+        return schema_editor.connection.vendor != self.vendor
+
+    def create_sql(self, model, schema_editor, *args, **kwargs):
+        if self._skipped(schema_editor):
+            return Statement("")
+        return super().create_sql(model, schema_editor, *args, **kwargs)
+
+    def remove_sql(self, model, schema_editor, *args, **kwargs):
+        if self._skipped(schema_editor):
+            return Statement("")
+        return super().remove_sql(model, schema_editor, *args, **kwargs)
+
+
+class PostgresGinIndex(_VendorIndex, GinIndex):
+    """A ``GinIndex`` that other databases skip."""
+    vendor = "postgresql"
+
+
+class SQLiteIndex(_VendorIndex, models.Index):
+    """An ``Index`` that other databases skip."""
+    vendor = "sqlite"
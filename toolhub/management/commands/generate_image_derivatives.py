@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from toolhub import images
+from toolhub.models import Collection, CustomUser, Item
+
+
+class Command(BaseCommand):
+    help = "Create the resized image derivatives for item, collection and profile images that lack them."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Regenerate derivatives that are already up to date.")
+
+    def handle(self, *args, **options):
+        updated = 0
+        for model, field in ((Item, "image"), (Collection, "image"), (CustomUser, "profile_picture")):
+            queryset = model.objects.exclude(**{f"{field}__isnull": True}).exclude(**{field: ""})
+            for instance in queryset.iterator(chunk_size=100):
+                updated += images.generate(instance, force=options["force"])
+        self.stdout.write(self.style.SUCCESS(f"Updated image derivatives for {updated} object(s)."))
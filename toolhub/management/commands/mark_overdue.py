@@ -0,0 +1,39 @@
+import logging
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from toolhub.borrowing import mark_overdue
+from toolhub.notifications import deliver_pending
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Mark approved borrow requests past their due date as overdue and send the notices."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Requests marked per transaction.")
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=0,
+            help="Keep running, repeating every INTERVAL seconds (for a worker dyno).",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                marked = mark_overdue(batch_size=options["batch_size"])
+                sent = deliver_pending()
+                self.stdout.write(
+                    self.style.SUCCESS(f"Marked {marked} request(s) overdue; sent {sent} notification(s).")
+                )
+            except Exception:
+                if not options["interval"]:
+                    raise
+                # A worker dyno keeps going: SMTP or the database may be back next time.
+                logger.exception("Overdue run failed; retrying in %s seconds", options["interval"])
+                close_old_connections()
+            if not options["interval"]:
+                return
+            time.sleep(options["interval"])
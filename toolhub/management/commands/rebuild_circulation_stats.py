@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from toolhub import stats
+
+
+class Command(BaseCommand):
+    help = "Recreate the daily circulation rollups from borrow request history."
+
+    def handle(self, *args, **options):
+        written = stats.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} circulation rollup row(s)."))
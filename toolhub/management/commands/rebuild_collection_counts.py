@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from toolhub.models import Collection
+
+
+class Command(BaseCommand):
+    help = "Rebuild the stored item_count on every collection from its items."
+
+    def handle(self, *args, **options):
+        updated = Collection.objects.refresh_item_counts()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt item counts for {updated} collection(s)."))
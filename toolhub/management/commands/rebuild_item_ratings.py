@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from toolhub.models import Item
+
+
+class Command(BaseCommand):
+    help = "Rebuild the stored rating_sum/rating_count on every item from its reviews."
+
+    def handle(self, *args, **options):
+        updated = Item.objects.rebuild_rating_aggregates()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rating aggregates for {updated} item(s)."))
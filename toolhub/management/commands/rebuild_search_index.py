@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from toolhub import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index for items and collections."
+
+    def handle(self, *args, **options):
+        search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS("Rebuilt the search index."))
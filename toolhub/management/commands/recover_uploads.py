@@ -0,0 +1,20 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from toolhub import uploads
+
+
+class Command(BaseCommand):
+    help = "Replay image upload jobs that a crashed or recycled process lost, or clear their processing flags."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than",
+            type=int,
+            default=settings.TOOLHUB_UPLOAD_RECOVER_AFTER // 60,
+            help="Treat jobs queued more than this many minutes ago as lost.",
+        )
+
+    def handle(self, *args, **options):
+        replayed, abandoned = uploads.recover(timedelta(minutes=options["older_than"]))
+        self.stdout.write(self.style.SUCCESS(f"Replayed {replayed} upload job(s); abandoned {abandoned}."))
@@ -0,0 +1,52 @@
+"""
+Media URLs without storage backend calls.
+
+Media is public in the bucket, so a file's URL is just a base URL plus its
+key. ``url()`` builds it once per name and caches it; nothing here asks the
+storage backend (``S3Boto3Storage.url()`` would presign every card image).
+Set ``TOOLHUB_MEDIA_BASE_URL`` to a CDN in front of the bucket to serve
+everything from there.
+
+Models expose these as ``image_url`` / ``profile_picture_url``, and templates
+use the ``media_url`` filter from ``media_tags``.
+"""
+from functools import lru_cache
+from urllib.parse import quote
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+# Key prefix of uploaded media in the bucket (mysite.storage_backends.MediaStorage.location)
+MEDIA_PREFIX = "media/"
+
+
+@lru_cache(maxsize=None)
+def base_url():
+    base = settings.TOOLHUB_MEDIA_BASE_URL
+    return base if base.endswith("/") else f"{base}/"
+
+
+@lru_cache(maxsize=8192)
+def url(name):
+    """Public URL of the uploaded file stored as ``name``."""
+    return f"{base_url()}{MEDIA_PREFIX}{quote(name)}"
+
+
+@lru_cache(maxsize=None)
+def asset_url(path):
+    """Public URL of a fixed object in the bucket, such as a placeholder image."""
+    return f"{base_url()}{quote(path)}"
+
+
+def file_url(fieldfile, default=""):
+    """``url()`` of a FieldFile (or name), ``default`` if it is empty."""
+    name = getattr(fieldfile, "name", fieldfile)
+    return url(name) if name else default
+
+
+@receiver(setting_changed)
+def clear_cache(setting, **kwargs):
+    if setting in ("TOOLHUB_MEDIA_BASE_URL", "AWS_STORAGE_BUCKET_NAME"):
+        base_url.cache_clear()
+        url.cache_clear()
+        asset_url.cache_clear()
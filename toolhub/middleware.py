@@ -1,18 +1,49 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.shortcuts import redirect
 from django.urls import reverse
 
+
+def _share_user(request, user):
+    # request.user and request.auser() cache separately; point both at the
+    # user loaded here so neither sync nor async views query for it again.
+    async def auser():
+        return user
+
+    request.user = user
+    request.auser = auser
+
+
 class SuperuserAdminOnlyMiddleware:
     """
     If a superuser attempts to visit any URL outside of /admin/,
     redirect them to the admin dashboard.
+
+    Runs natively in both sync and async stacks, so async views under ASGI
+    don't hop through a thread for it.
     """
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
 
-    def __call__(self, request):
+    def _redirect(self, request, user):
         # Only apply if user is authenticated and is a superuser.
-        if request.user.is_authenticated and request.user.is_superuser:
+        if user.is_authenticated and user.is_superuser:
             if not request.path.startswith('/admin/') and not request.path.startswith('/static/') and not request.path.startswith('/media/'):
                 return redirect(reverse('admin:index'))
-        response = self.get_response(request)
-        return response
\ No newline at end of file
+        return None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        user = request.user
+        _share_user(request, user)
+        return self._redirect(request, user) or self.get_response(request)
+
+    async def __acall__(self, request):
+        user = await request.auser()
+        _share_user(request, user)
+        return self._redirect(request, user) or await self.get_response(request)
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.6 on 2026-10-18 18:19
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Item = apps.get_model('toolhub', 'Item')
+    ItemReview = apps.get_model('toolhub', 'ItemReview')
+    reviews = ItemReview.objects.filter(item=OuterRef('pk')).values('item')
+    Item.objects.update(
+        rating_sum=Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0),
+        rating_count=Coalesce(Subquery(reviews.annotate(total=Count('pk')).values('total')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('toolhub', '0016_borrowrequest_borrow_start_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
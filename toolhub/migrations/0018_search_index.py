@@ -0,0 +1,58 @@
+# Generated by Django 5.1.6 on 2026-10-18 18:25
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Searchable tables and their (column, weight) pairs; mirrors toolhub.search.SEARCH_FIELDS.
+SEARCH_TABLES = {
+    'toolhub_item': [('name', 'A'), ('description', 'B')],
+    'toolhub_collection': [('title', 'A'), ('description', 'B')],
+}
+
+
+def create_search_indexes(apps, schema_editor):
+    # The GIN indexes on search_vector are declared on the models (0030).
+    vendor = schema_editor.connection.vendor
+    for table, fields in SEARCH_TABLES.items():
+        columns = ', '.join(column for column, _ in fields)
+        if vendor == 'postgresql':
+            vector = ' || '.join(
+                f"setweight(to_tsvector('english', coalesce({column}, '')), '{weight}')"
+                for column, weight in fields
+            )
+            schema_editor.execute(f'UPDATE {table} SET search_vector = {vector}')
+        elif vendor == 'sqlite':
+            schema_editor.execute(
+                f"CREATE VIRTUAL TABLE {table}_fts USING fts5({columns}, tokenize='porter unicode61')"
+            )
+            schema_editor.execute(
+                f'INSERT INTO {table}_fts (rowid, {columns}) SELECT id, {columns} FROM {table}'
+            )
+
+
+def drop_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for table in SEARCH_TABLES:
+        if vendor == 'sqlite':
+            schema_editor.execute(f'DROP TABLE IF EXISTS {table}_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('toolhub', '0017_item_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collection',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+def create_trigram_extension(apps, schema_editor):
+    # The typeahead indexes themselves are declared on the models (0031).
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('toolhub', '0018_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_extension, migrations.RunPython.noop),
+    ]
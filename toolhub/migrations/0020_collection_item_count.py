@@ -0,0 +1,32 @@
+# Generated by Django 5.1.6 on 2026-10-18 18:33
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_item_counts(apps, schema_editor):
+    Collection = apps.get_model('toolhub', 'Collection')
+    counts = (
+        Collection.items.through.objects.filter(collection=OuterRef('pk'))
+        .values('collection')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    Collection.objects.update(item_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('toolhub', '0019_typeahead_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collection',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_item_counts, migrations.RunPython.noop),
+    ]
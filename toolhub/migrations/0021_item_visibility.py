@@ -0,0 +1,35 @@
+# Generated by Django 5.1.6 on 2026-10-18 18:39
+
+from django.db import migrations, models
+from django.db.models import Case, Exists, OuterRef, Value, When
+
+
+def backfill_visibility(apps, schema_editor):
+    Item = apps.get_model('toolhub', 'Item')
+    Collection = apps.get_model('toolhub', 'Collection')
+    memberships = Collection.items.through.objects.filter(item=OuterRef('pk'))
+    Item.objects.update(
+        is_publicly_visible=Case(
+            When(
+                ~Exists(memberships) | Exists(memberships.filter(collection__visibility='public')),
+                then=Value(True),
+            ),
+            default=Value(False),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('toolhub', '0020_collection_item_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='is_publicly_visible',
+            field=models.BooleanField(db_index=True, default=True, editable=False),
+        ),
+        migrations.RunPython(backfill_visibility, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-18 18:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('toolhub', '0021_item_visibility'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='borrowrequest',
+            index=models.Index(fields=['item', 'user', 'status', '-request_date'], name='borrow_item_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowrequest',
+            index=models.Index(condition=models.Q(('status__in', ['pending', 'approved'])), fields=['user', 'item'], name='borrow_active_user_item_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowrequest',
+            index=models.Index(fields=['-request_date', '-id'], name='borrow_request_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowrequest',
+            index=models.Index(fields=['user', '-request_date', '-id'], name='borrow_user_request_date_idx'),
+        ),
+    ]
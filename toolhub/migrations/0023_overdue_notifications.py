@@ -0,0 +1,57 @@
+# Generated by Django 5.1.6 on 2026-10-18 18:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('toolhub', '0022_borrowrequest_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('overdue', 'Overdue')], max_length=20)),
+                ('subject', models.CharField(max_length=255)),
+                ('message', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='borrowrequest',
+            name='borrow_active_user_item_idx',
+        ),
+        migrations.AlterField(
+            model_name='borrowrequest',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('approved', 'Approved'), ('overdue', 'Overdue'), ('denied', 'Denied'), ('returned_on_time', 'Returned On Time'), ('returned_overdue', 'Returned Late')], default='pending', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='borrowrequest',
+            index=models.Index(condition=models.Q(('status__in', ['pending', 'approved', 'overdue'])), fields=['user', 'item'], name='borrow_active_user_item_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowrequest',
+            index=models.Index(condition=models.Q(('status', 'approved')), fields=['return_due_date', 'id'], name='borrow_approved_due_idx'),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='borrow_request',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='toolhub.borrowrequest'),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('sent_at__isnull', True)), fields=['id'], name='notification_unsent_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-18 18:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('toolhub', '0023_overdue_notifications'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CirculationStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('location', models.CharField(choices=[('main_warehouse', 'Main Warehouse'), ('aux_warehouse', 'Aux Warehouse'), ('patrons_location', "Patron's Location"), ('remote_storage', 'Remote Storage')], max_length=50)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('approved', 'Approved'), ('overdue', 'Overdue'), ('denied', 'Denied'), ('returned_on_time', 'Returned On Time'), ('returned_overdue', 'Returned Late')], max_length=20)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='circulation_stats', to='toolhub.item')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day', 'status'], name='circulation_day_status_idx')],
+                'constraints': [models.UniqueConstraint(fields=('day', 'item', 'location', 'status'), name='circulation_stat_unique')],
+            },
+        ),
+    ]
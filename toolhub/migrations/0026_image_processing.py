@@ -0,0 +1,28 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('toolhub', '0025_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collection',
+            name='image_processing',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='profile_picture_processing',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='image_processing',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
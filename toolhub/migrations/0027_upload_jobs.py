@@ -0,0 +1,31 @@
+# Generated by Django 5.1.6 on 2026-10-18 20:19
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('toolhub', '0026_image_processing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('label', models.CharField(max_length=100)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('field', models.CharField(max_length=50)),
+                ('job', models.CharField(choices=[('process', 'Process staged upload'), ('finalize', 'Finalize direct upload')], max_length=20)),
+                ('args', models.JSONField(default=list)),
+                ('host', models.CharField(max_length=100)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('queued_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['queued_at'], name='uploadjob_queued_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.6 on 2026-10-18 21:13
+
+import toolhub.indexes
+from django.db import migrations
+
+
+def drop_raw_indexes(apps, schema_editor):
+    # 0018 used to create these with raw SQL, outside the migration state.
+    if schema_editor.connection.vendor == 'postgresql':
+        for table in ('toolhub_item', 'toolhub_collection'):
+            schema_editor.execute(f'DROP INDEX IF EXISTS {table}_search_vector_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('toolhub', '0029_notification_attempts'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_raw_indexes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='collection',
+            index=toolhub.indexes.PostgresGinIndex(fields=['search_vector'], name='collection_search_vector_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=toolhub.indexes.PostgresGinIndex(fields=['search_vector'], name='item_search_vector_gin'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.1.6 on 2026-10-18 21:14
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+import toolhub.indexes
+from django.db import migrations
+
+# (table, column) pairs 0019 used to index with raw SQL, outside the migration state.
+RAW_INDEXED_COLUMNS = [
+    ('toolhub_item', 'name'),
+    ('toolhub_customuser', 'username'),
+    ('toolhub_customuser', 'email'),
+]
+
+
+def drop_raw_indexes(apps, schema_editor):
+    suffix = {'postgresql': 'trgm', 'sqlite': 'nocase'}.get(schema_editor.connection.vendor)
+    if suffix:
+        for table, column in RAW_INDEXED_COLUMNS:
+            schema_editor.execute(f'DROP INDEX IF EXISTS {table}_{column}_{suffix}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('toolhub', '0030_search_vector_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_raw_indexes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=toolhub.indexes.PostgresGinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('username'), name='gin_trgm_ops'), name='customuser_username_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=toolhub.indexes.SQLiteIndex(django.db.models.functions.text.Lower('username'), name='customuser_username_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=toolhub.indexes.PostgresGinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('email'), name='gin_trgm_ops'), name='customuser_email_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=toolhub.indexes.SQLiteIndex(django.db.models.functions.text.Lower('email'), name='customuser_email_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=toolhub.indexes.PostgresGinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('name'), name='gin_trgm_ops'), name='item_name_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=toolhub.indexes.SQLiteIndex(django.db.models.functions.text.Lower('name'), name='item_name_lower_idx'),
+        ),
+    ]
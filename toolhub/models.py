@@ -1,10 +1,28 @@
 from django.db import models
+from django.contrib.postgres.indexes import OpClass
+from django.db.models.functions import Coalesce, Lower, Upper
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.search import SearchVectorField
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.core.files.storage import default_storage
+from django.utils import timezone
 from django.utils.module_loading import import_string
 import uuid as uuid_lib
+from .images import srcsets
+from .indexes import PostgresGinIndex, SQLiteIndex
+from . import media, uploads
+
+def typeahead_indexes(model_name, field):
+    """
+    The indexes ``toolhub.search.typeahead`` matches ``field`` with: a trigram
+    GIN index on ``UPPER(field)`` for PostgreSQL's ``icontains``, and on SQLite
+    one on ``LOWER(field)`` for the prefix range.
+    """
+    return [
+        PostgresGinIndex(OpClass(Upper(field), name="gin_trgm_ops"), name=f"{model_name}_{field}_trgm"),
+        SQLiteIndex(Lower(field), name=f"{model_name}_{field}_lower_idx"),
+    ]
+
 
 def upload_to_profile(instance, filename):
     extension = filename.split(".")[-1]
@@ -27,28 +45,52 @@ class CustomUser(AbstractUser):
     )
     join_date = models.DateTimeField(auto_now_add=True)  # Records when the user joined
 
+    # Resized copies of profile_picture, maintained by toolhub.images
+    profile_picture_derivatives = models.JSONField(default=dict, blank=True, editable=False)
+
+    # True while a new profile_picture is being uploaded by toolhub.uploads
+    profile_picture_processing = models.BooleanField(default=False, editable=False)
+
+    # profile_picture as last loaded or saved, so save() can tell whether it
+    # really changed without re-reading the row.
+    _original_profile_picture = None
+
+    class Meta(AbstractUser.Meta):
+        indexes = typeahead_indexes("customuser", "username") + typeahead_indexes("customuser", "email")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._original_profile_picture = dict(zip(field_names, values)).get("profile_picture") or None
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        if fields is None or "profile_picture" in fields:
+            self._original_profile_picture = self.profile_picture.name or None
+
     def save(self, *args, **kwargs):
-        if self.pk:
-            try:
-                old_instance = CustomUser.objects.get(pk=self.pk)
-                # If an old profile picture exists, is not the default, and has changed,
-                # delete the old file from storage.
-                if (
-                    old_instance.profile_picture
-                    and old_instance.profile_picture != self.profile_picture
-                ):
-                    if old_instance.profile_picture.name:
-                        if default_storage.exists(old_instance.profile_picture.name):
-                            default_storage.delete(old_instance.profile_picture.name)
-            except CustomUser.DoesNotExist:
-                pass
+        update_fields = kwargs.get("update_fields")
+        tracked = "profile_picture" not in self.get_deferred_fields() and (
+            update_fields is None or "profile_picture" in update_fields
+        )
         super().save(*args, **kwargs)
+        if not tracked:
+            return
+
+        original, current = self._original_profile_picture, self.profile_picture.name or None
+        self._original_profile_picture = current
+        # While an upload is processing, toolhub.uploads deletes the replaced file.
+        if original and original != current and not self.profile_picture_processing:
+            uploads.delete_later(self._meta.get_field("profile_picture").storage, original)
 
     @property
     def profile_picture_url(self):
-        if self.profile_picture:
-            return f"https://{settings.AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com/media/{self.profile_picture.name}"
-        return f"https://{settings.AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com/toolhub/images/default.png"
+        return media.file_url(self.profile_picture, media.asset_url("toolhub/images/default.png"))
+
+    @property
+    def profile_picture_srcsets(self):
+        return srcsets(self.profile_picture, self.profile_picture_derivatives)
 
     @property
     def full_name(self):
@@ -58,6 +100,80 @@ class CustomUser(AbstractUser):
         return self.email
 
 
+# Borrow request statuses that mean the user currently holds or is waiting on an item
+ACTIVE_BORROW_STATUSES = ["pending", "approved", "overdue"]
+
+
+class ItemQuerySet(models.QuerySet):
+    def refresh_visibility(self):
+        """
+        Recompute ``is_publicly_visible``: an item is public unless every
+        collection it belongs to is private. Returns the number of items updated.
+        """
+        memberships = Collection.items.through.objects.filter(item=models.OuterRef("pk"))
+        return self.update(
+            is_publicly_visible=models.Case(
+                models.When(
+                    ~models.Exists(memberships)
+                    | models.Exists(memberships.filter(collection__visibility=Collection.PUBLIC)),
+                    then=models.Value(True),
+                ),
+                default=models.Value(False),
+            )
+        )
+
+    def rebuild_rating_aggregates(self):
+        """
+        Recompute ``rating_sum`` and ``rating_count`` from ``ItemReview`` rows in a
+        single UPDATE. Returns the number of items updated.
+        """
+        reviews = ItemReview.objects.filter(item=models.OuterRef("pk")).values("item")
+        return self.update(
+            rating_sum=Coalesce(
+                models.Subquery(reviews.annotate(total=models.Sum("rating")).values("total")), 0
+            ),
+            rating_count=Coalesce(
+                models.Subquery(reviews.annotate(total=models.Count("pk")).values("total")), 0
+            ),
+        )
+
+    def with_user_status(self, user):
+        """
+        Annotate every item with ``already_requested`` and ``user_status`` for the
+        given user. Both are computed in SQL with an ``Exists`` subquery, so a
+        listing costs a single query whatever the catalog size.
+        """
+        status_display = [
+            models.When(status=value, then=models.Value(label))
+            for value, label in self.model.STATUS_CHOICES
+        ]
+        if user is None or not user.is_authenticated:
+            return self.annotate(
+                already_requested=models.Value(False, output_field=models.BooleanField()),
+                user_status=models.Case(
+                    *status_display, default=models.F("status"), output_field=models.CharField()
+                ),
+            )
+
+        active_requests = BorrowRequest.objects.filter(
+            item=models.OuterRef("pk"), user=user, status__in=ACTIVE_BORROW_STATUSES
+        )
+        # Mirrors the rules in Item.status_for_user.
+        return self.annotate(already_requested=models.Exists(active_requests)).annotate(
+            user_status=models.Case(
+                models.When(already_requested=True, then=models.Value("Already requested")),
+                models.When(status="currently_requested", then=models.Value("Available")),
+                models.When(
+                    models.Q(status="currently_borrowed") & ~models.Q(borrower=user),
+                    then=models.Value("Borrowed"),
+                ),
+                *status_display,
+                default=models.F("status"),
+                output_field=models.CharField(),
+            )
+        )
+
+
 # Helper function for item and collection image uploads
 def upload_to_item(instance, filename):
     extension = filename.split(".")[-1]
@@ -104,23 +220,71 @@ class Item(models.Model):
         blank=True,
         null=True,
     )
-    
+
+    # Resized copies of image, maintained by toolhub.images
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
+
+    # True while a new image is being uploaded by toolhub.uploads
+    image_processing = models.BooleanField(default=False, editable=False)
+
+    # Full-text index column (PostgreSQL only), maintained by toolhub.search
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    # False when the item only appears in private collections; kept in sync by toolhub.signals
+    is_publicly_visible = models.BooleanField(default=True, db_index=True, editable=False)
+
+    # Denormalized review aggregates, kept in sync by toolhub.signals
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = ItemQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            PostgresGinIndex(fields=["search_vector"], name="item_search_vector_gin"),
+        ] + typeahead_indexes("item", "name")
+
+    # Columns toolhub.signals maintains with UPDATEs of their own. A full save()
+    # of a loaded item leaves them out, so it can't write back the values it read
+    # over a change made in the meantime.
+    SIGNAL_MAINTAINED_FIELDS = {"is_publicly_visible", "rating_sum", "rating_count"}
+
+    def save(self, *args, **kwargs):
+        if kwargs.get("update_fields") is None and not kwargs.get("force_insert") and not self._state.adding:
+            deferred = self.get_deferred_fields()
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.attname not in deferred
+                and field.name not in self.SIGNAL_MAINTAINED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     @property
     def average_rating(self):
-        return self.reviews.aggregate(avg=models.Avg("rating"))["avg"] or 0
+        if not self.rating_count:
+            return 0
+        return self.rating_sum / self.rating_count
 
     @property
     def image_url(self):
-        if self.image:
-            return f"https://{settings.AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com/media/{self.image.name}"
-        return f"https://{settings.AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com/toolhub/images/logo.png"
+        return media.file_url(self.image, media.asset_url("toolhub/images/logo.png"))
+
+    @property
+    def image_srcsets(self):
+        return srcsets(self.image, self.image_derivatives)
 
     def __str__(self):
         return self.name
 
-    def status_for_user(self, user):
+    def status_for_user(self, user, already_requested=None):
         """
         Return a display string specific to the given user.
+
+        ``already_requested`` may be passed in when the caller has already
+        looked up the user's active requests; items loaded through
+        ``Item.objects.with_user_status`` carry it as an annotation.
         """
         # For anonymous users, we only display global status for borrowed items.
         if user is None or not user.is_authenticated:
@@ -129,7 +293,13 @@ class Item(models.Model):
             return self.get_status_display()
         
         # If the user already has a pending or approved borrow request for this item, show it.
-        if self.borrow_requests.filter(user=user, status__in=["pending", "approved"]).exists():
+        if already_requested is None:
+            already_requested = getattr(self, "already_requested", None)
+        if already_requested is None:
+            already_requested = self.borrow_requests.filter(
+                user=user, status__in=ACTIVE_BORROW_STATUSES
+            ).exists()
+        if already_requested:
             return "Already requested"
         
         # If the item is marked as 'currently_requested' (someone else requested it)
@@ -138,7 +308,7 @@ class Item(models.Model):
             return "Available"
         
         # If the item is marked as currently borrowed and the borrower is someone else.
-        if self.status == "currently_borrowed" and self.borrower != user:
+        if self.status == "currently_borrowed" and self.borrower_id != user.pk:
             return "Borrowed"
         
         return self.get_status_display()
@@ -162,6 +332,36 @@ class Item(models.Model):
         self.save()
 
 
+class CollectionQuerySet(models.QuerySet):
+    def accessible_to(self, user):
+        """
+        Collections the user may open: public ones, their own, and private ones
+        shared with them (librarians can open everything). The shared set is read
+        straight from the indexed allowed_users through table.
+        """
+        if user is None or not user.is_authenticated:
+            return self.filter(visibility=Collection.PUBLIC)
+        if user.role == "librarian":
+            return self
+        shared = Collection.allowed_users.through.objects.filter(customuser=user).values("collection_id")
+        return self.filter(
+            models.Q(visibility=Collection.PUBLIC) | models.Q(creator=user) | models.Q(pk__in=shared)
+        )
+
+    def refresh_item_counts(self):
+        """
+        Recompute the stored ``item_count`` from the through table in a single
+        UPDATE. Returns the number of collections updated.
+        """
+        counts = (
+            Collection.items.through.objects.filter(collection=models.OuterRef("pk"))
+            .values("collection")
+            .annotate(total=models.Count("pk"))
+            .values("total")
+        )
+        return self.update(item_count=Coalesce(models.Subquery(counts), 0))
+
+
 class Collection(models.Model):
     uuid = models.UUIDField(default=uuid_lib.uuid4, editable=False, unique=True)
 
@@ -197,11 +397,32 @@ class Collection(models.Model):
         help_text="Users who can access this private collection (librarians can always access).",
     )
 
+    # Resized copies of image, maintained by toolhub.images
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
+
+    # True while a new image is being uploaded by toolhub.uploads
+    image_processing = models.BooleanField(default=False, editable=False)
+
+    # Full-text index column (PostgreSQL only), maintained by toolhub.search
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    # Denormalized items.count(), kept in sync by toolhub.signals
+    item_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = CollectionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            PostgresGinIndex(fields=["search_vector"], name="collection_search_vector_gin"),
+        ]
+
     @property
     def image_url(self):
-        if self.image:
-            return f"https://{settings.AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com/media/{self.image.name}"
-        return f"https://{settings.AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com/toolhub/images/logo.png"
+        return media.file_url(self.image, media.asset_url("toolhub/images/logo.png"))
+
+    @property
+    def image_srcsets(self):
+        return srcsets(self.image, self.image_derivatives)
 
     def __str__(self):
         return self.title
@@ -210,6 +431,7 @@ class BorrowRequest(models.Model):
     STATUS_CHOICES = [
         ("pending", "Pending"),
         ("approved", "Approved"),
+        ("overdue", "Overdue"),
         ("denied", "Denied"),
         ("returned_on_time", "Returned On Time"),
         ("returned_overdue", "Returned Late")
@@ -227,21 +449,45 @@ class BorrowRequest(models.Model):
     # class Meta:
     #     unique_together = ("item", "user")  # Allow only one active request per user-item pair
 
+    class Meta:
+        indexes = [
+            # "Does this user hold/await this item?" (request_borrow, status annotations),
+            # and return_item's newest approved request for (item, user).
+            models.Index(
+                fields=["item", "user", "status", "-request_date"],
+                name="borrow_item_user_status_idx",
+            ),
+            # The small set of still-active requests per user.
+            models.Index(
+                fields=["user", "item"],
+                condition=models.Q(status__in=ACTIVE_BORROW_STATUSES),
+                name="borrow_active_user_item_idx",
+            ),
+            # Keyset pages of borrow_overview: all requests, and one patron's history.
+            models.Index(fields=["-request_date", "-id"], name="borrow_request_date_idx"),
+            models.Index(fields=["user", "-request_date", "-id"], name="borrow_user_request_date_idx"),
+            # Loans past their due date, scanned by the mark_overdue command.
+            models.Index(
+                fields=["return_due_date", "id"],
+                condition=models.Q(status="approved"),
+                name="borrow_approved_due_idx",
+            ),
+        ]
+
     def __str__(self):
         return f"{self.user.email} - {self.item.name} ({self.status})"
 
     def approve(self, due_date):
         """
         Approve the borrow request, set the due date, and update the item's status.
+        See toolhub.borrowing.approve_request.
         """
-        if self.status != "pending":
-            raise ValidationError("Only pending requests can be approved.")
-        if not due_date:
-            raise ValidationError("A due date must be set when approving a borrow request.")
-        self.status = "approved"
-        self.return_due_date = due_date
-        self.item.mark_as_borrowed()
-        self.save()
+        from .borrowing import approve_request
+
+        approved, _ = approve_request(self.pk, due_date)
+        self.status = approved.status
+        self.return_due_date = approved.return_due_date
+        self.item = approved.item
 
     def deny(self):
         """
@@ -253,6 +499,98 @@ class BorrowRequest(models.Model):
         self.save()
 
 
+class CirculationStat(models.Model):
+    """
+    Daily rollup: how many borrow requests for ``item`` (at ``location``)
+    entered ``status`` on ``day``. Maintained by ``toolhub.stats``.
+    """
+    day = models.DateField()
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name="circulation_stats")
+    location = models.CharField(max_length=50, choices=Item.LOCATION_CHOICES)
+    status = models.CharField(max_length=20, choices=BorrowRequest.STATUS_CHOICES)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["day", "item", "location", "status"], name="circulation_stat_unique"),
+        ]
+        indexes = [
+            models.Index(fields=["day", "status"], name="circulation_day_status_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.item_id} {self.status}: {self.count}"
+
+
+class Notification(models.Model):
+    """
+    Outbox of messages to users. Rows are written in the same transaction as
+    the change they report and delivered later by ``toolhub.notifications``.
+    """
+    KIND_CHOICES = [
+        ("overdue", "Overdue"),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="notifications")
+    borrow_request = models.ForeignKey(
+        BorrowRequest, on_delete=models.CASCADE, related_name="notifications", null=True, blank=True
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    subject = models.CharField(max_length=255)
+    message = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Set while a worker is sending it; a claim older than
+    # notifications.CLAIM_TIMEOUT belongs to a worker that died.
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    # Failed sends; after notifications.MAX_ATTEMPTS the message is given up on.
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    failed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["id"],
+                condition=models.Q(sent_at__isnull=True, failed_at__isnull=True),
+                name="notification_unsent_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user.email} - {self.subject}"
+
+
+class UploadJob(models.Model):
+    """
+    An image upload job queued by ``toolhub.uploads``. The row is written in
+    the same transaction as the object it updates and deleted when the job
+    finishes; rows that linger belong to jobs a killed or recycled process
+    lost, and ``uploads.recover`` replays or abandons them.
+    """
+    JOB_CHOICES = [
+        ("process", "Process staged upload"),
+        ("finalize", "Finalize direct upload"),
+    ]
+
+    label = models.CharField(max_length=100)
+    object_id = models.PositiveBigIntegerField()
+    field = models.CharField(max_length=50)
+    job = models.CharField(max_length=20, choices=JOB_CHOICES)
+    args = models.JSONField(default=list)
+    # The staging directory is on the web dyno's own disk, so staged uploads
+    # can only be replayed on the host that staged them.
+    host = models.CharField(max_length=100)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    queued_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=["queued_at"], name="uploadjob_queued_idx")]
+
+    def __str__(self):
+        return f"{self.job} {self.label} {self.object_id}.{self.field}"
+
+
 class ItemReview(models.Model):
     item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name="reviews")
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="reviews")
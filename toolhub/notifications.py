@@ -0,0 +1,126 @@
+"""
+Notification outbox.
+
+Jobs queue ``Notification`` rows inside the transaction that changes the state
+they report, so a notice is never lost or sent for a change that rolled back.
+``deliver_pending`` then emails them in batches. It claims a batch with
+``SELECT ... FOR UPDATE SKIP LOCKED`` and commits the claim before talking to
+SMTP, so several workers can drain the outbox at once and no row lock is held
+during network I/O. Each message is marked sent as soon as it has gone out, so
+a failure part way through a batch never re-sends the messages before it.
+
+A message the mail server refuses doesn't hold up the rest: it is retried once
+its claim expires and marked failed after ``MAX_ATTEMPTS``. Only errors that
+mean the server can't be reached stop delivery.
+"""
+import logging
+import smtplib
+from datetime import timedelta
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.utils.timezone import now
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+# Claims older than this were left by a worker that died while sending.
+CLAIM_TIMEOUT = timedelta(minutes=15)
+
+# Sends of one message that may fail before it is given up on.
+MAX_ATTEMPTS = 5
+
+# Errors that mean the server (not one message) is the problem.
+CONNECTION_ERRORS = (
+    smtplib.SMTPServerDisconnected,
+    smtplib.SMTPConnectError,
+    smtplib.SMTPHeloError,
+    smtplib.SMTPAuthenticationError,
+)
+
+
+def queue_overdue(borrow_requests):
+    """Queue an overdue notice for each request (with ``item`` loaded)."""
+    Notification.objects.bulk_create(
+        Notification(
+            user_id=borrow_request.user_id,
+            borrow_request=borrow_request,
+            kind="overdue",
+            subject=f"'{borrow_request.item.name}' is overdue",
+            message=(
+                f"'{borrow_request.item.name}' was due back on "
+                f"{borrow_request.return_due_date:%b %d, %Y}. Please return it as soon as possible."
+            ),
+        )
+        for borrow_request in borrow_requests
+    )
+
+
+def _claim(batch_size):
+    with transaction.atomic():
+        batch = list(
+            Notification.objects.select_for_update(skip_locked=True, of=("self",))
+            .select_related("user")
+            .filter(sent_at__isnull=True, failed_at__isnull=True)
+            .filter(Q(claimed_at__isnull=True) | Q(claimed_at__lt=now() - CLAIM_TIMEOUT))
+            .order_by("pk")[:batch_size]
+        )
+        Notification.objects.filter(pk__in=[notification.pk for notification in batch]).update(claimed_at=now())
+    return batch
+
+
+def _is_connection_error(error):
+    if isinstance(error, CONNECTION_ERRORS):
+        return True
+    # Socket errors; the other SMTP errors are OSErrors as well.
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+def _record_failure(notification, error):
+    """
+    Count a failed send of one message. It keeps its claim, so it is retried
+    after ``CLAIM_TIMEOUT``, until ``MAX_ATTEMPTS`` marks it failed.
+    """
+    notification.attempts += 1
+    notification.last_error = f"{type(error).__name__}: {error}"
+    if notification.attempts >= MAX_ATTEMPTS:
+        notification.failed_at = now()
+    Notification.objects.filter(pk=notification.pk).update(
+        attempts=notification.attempts, last_error=notification.last_error, failed_at=notification.failed_at
+    )
+    logger.warning("Could not send notification %s: %s", notification.pk, notification.last_error)
+
+
+def deliver_pending(batch_size=100):
+    """
+    Email every unsent notification. Returns the number sent. A message that
+    fails on its own is recorded on its row and skipped; if the mail server
+    can't be reached, the rest of the batch is released for the next run and
+    the error is raised.
+    """
+    sent = 0
+    while True:
+        batch = _claim(batch_size)
+        if not batch:
+            return sent
+        unsent = [notification.pk for notification in batch]
+        try:
+            with get_connection() as connection:
+                for notification in batch:
+                    try:
+                        if not notification.user.email:
+                            raise ValueError(f"User {notification.user.pk} has no email address.")
+                        connection.send_messages([
+                            EmailMessage(notification.subject, notification.message, to=[notification.user.email])
+                        ])
+                    except Exception as error:
+                        if _is_connection_error(error):
+                            raise
+                        _record_failure(notification, error)
+                    else:
+                        Notification.objects.filter(pk=notification.pk).update(sent_at=now())
+                        sent += 1
+                    unsent.remove(notification.pk)
+        except Exception:
+            Notification.objects.filter(pk__in=unsent).update(claimed_at=None)
+            raise
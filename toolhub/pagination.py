@@ -0,0 +1,189 @@
+import base64
+import json
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import QueryDict
+
+
+def _encode_cursor(values):
+    raw = json.dumps(values, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor, fields):
+    """Decode a cursor into field values, or return None if it is malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(fields):
+            return None
+        return [field.to_python(value) for field, value in zip(fields, values)]
+    except (ValueError, TypeError, ValidationError):
+        return None
+
+
+class KeysetPage:
+    """
+    One page of a keyset-paginated queryset.
+
+    Iterating the page yields its objects. ``next_query`` / ``previous_query``
+    are ready-to-use query strings that keep every other GET parameter (such as
+    the ``q`` search term) and swap in the new cursor.
+    """
+
+    def __init__(self, object_list, params, prefix, has_next, has_previous, first_key, last_key):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self._params = params if params is not None else QueryDict()
+        self._prefix = prefix
+        self._first_key = first_key
+        self._last_key = last_key
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def _query(self, direction, key):
+        params = self._params.copy()
+        params.pop(f"{self._prefix}after", None)
+        params.pop(f"{self._prefix}before", None)
+        params[f"{self._prefix}{direction}"] = _encode_cursor(key)
+        return params.urlencode()
+
+    @property
+    def next_query(self):
+        return self._query("after", self._last_key) if self.has_next else ""
+
+    @property
+    def previous_query(self):
+        return self._query("before", self._first_key) if self.has_previous else ""
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset by seeking past the last row seen instead of using OFFSET.
+
+    ``ordering`` lists the key fields, e.g. ``("pk",)`` or
+    ``("-request_date", "-pk")``, and may name annotations; the last one must be
+    unique so the order is total. Every page, however deep, is a single indexed range scan.
+    """
+
+    def __init__(self, queryset, ordering=("pk",), per_page=None):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page or settings.TOOLHUB_PAGE_SIZE
+        self.keys = [name.lstrip("-") for name in self.ordering]
+        self.fields = [self._key_field(key) for key in self.keys]
+
+    def _key_field(self, key):
+        """Model field or annotation (e.g. ``search_rank``) used to decode cursor values."""
+        if key == "pk":
+            return self.queryset.model._meta.pk
+        if key in self.queryset.query.annotations:
+            return self.queryset.query.annotations[key].output_field
+        return self.queryset.model._meta.get_field(key)
+
+    def _seek(self, values, forward):
+        """Build the row-comparison filter ``(k1, k2, ...) > (v1, v2, ...)`` lexicographically."""
+        condition = Q()
+        for i, name in enumerate(self.ordering):
+            lookup = "lt" if name.startswith("-") == forward else "gt"
+            step = Q(**dict(zip(self.keys[:i], values[:i])))
+            step &= Q(**{f"{self.keys[i]}__{lookup}": values[i]})
+            condition |= step
+        return condition
+
+    def _key(self, obj):
+        return [getattr(obj, key) for key in self.keys]
+
+    def _window(self, after, before):
+        """
+        The slice of rows to fetch for the requested page: one row more than a
+        page, so the row past the end tells whether there is another page.
+        Returns ``(rows, backwards, seeked_forward)``.
+        """
+        after_values = _decode_cursor(after, self.fields) if after else None
+        before_values = _decode_cursor(before, self.fields) if before else None
+
+        if before_values is not None:
+            reversed_ordering = [name[1:] if name.startswith("-") else f"-{name}" for name in self.ordering]
+            rows = self.queryset.filter(self._seek(before_values, forward=False)).order_by(*reversed_ordering)
+            return rows[: self.per_page + 1], True, False
+
+        queryset = self.queryset
+        if after_values is not None:
+            queryset = queryset.filter(self._seek(after_values, forward=True))
+        return queryset.order_by(*self.ordering)[: self.per_page + 1], False, after_values is not None
+
+    def _page(self, rows, backwards, seeked_forward, params, prefix):
+        if backwards:
+            has_previous = len(rows) > self.per_page
+            object_list = rows[: self.per_page][::-1]
+            has_next = True
+        else:
+            has_next = len(rows) > self.per_page
+            object_list = rows[: self.per_page]
+            has_previous = seeked_forward
+
+        first_key = self._key(object_list[0]) if object_list else None
+        last_key = self._key(object_list[-1]) if object_list else None
+        return KeysetPage(
+            object_list,
+            params,
+            prefix,
+            has_next=has_next and bool(object_list),
+            has_previous=has_previous and bool(object_list),
+            first_key=first_key,
+            last_key=last_key,
+        )
+
+    def get_page(self, after=None, before=None, params=None, prefix=""):
+        rows, backwards, seeked_forward = self._window(after, before)
+        return self._page(list(rows), backwards, seeked_forward, params, prefix)
+
+    async def aget_page(self, after=None, before=None, params=None, prefix=""):
+        rows, backwards, seeked_forward = self._window(after, before)
+        return self._page([row async for row in rows], backwards, seeked_forward, params, prefix)
+
+
+def _paginator(request, queryset, ordering):
+    try:
+        per_page = int(request.GET.get("per_page", settings.TOOLHUB_PAGE_SIZE))
+    except ValueError:
+        per_page = settings.TOOLHUB_PAGE_SIZE
+    per_page = max(1, min(per_page, settings.TOOLHUB_MAX_PAGE_SIZE))
+    return KeysetPaginator(queryset, ordering=ordering, per_page=per_page)
+
+
+def paginate(request, queryset, ordering=("pk",), prefix=""):
+    """
+    Return the ``KeysetPage`` selected by the request's ``<prefix>after`` /
+    ``<prefix>before`` cursors. ``per_page`` may be passed as a GET parameter,
+    capped at ``TOOLHUB_MAX_PAGE_SIZE``.
+    """
+    return _paginator(request, queryset, ordering).get_page(
+        after=request.GET.get(f"{prefix}after"),
+        before=request.GET.get(f"{prefix}before"),
+        params=request.GET,
+        prefix=prefix,
+    )
+
+
+async def apaginate(request, queryset, ordering=("pk",), prefix=""):
+    """``paginate()`` for async views."""
+    return await _paginator(request, queryset, ordering).aget_page(
+        after=request.GET.get(f"{prefix}after"),
+        before=request.GET.get(f"{prefix}before"),
+        params=request.GET,
+        prefix=prefix,
+    )
@@ -0,0 +1,212 @@
+"""
+Full-text search for items and collections.
+
+On PostgreSQL each searchable model has a stored ``search_vector`` tsvector
+column with a GIN index. On SQLite (local development) matching rows are looked
+up in an FTS5 virtual table named ``<db_table>_fts``. Any other database falls
+back to ``icontains`` filtering. Whichever backend is active, ``search()``
+annotates results with ``search_rank`` (higher is more relevant), and the
+indexes are kept in sync from ``post_save``/``post_delete`` (see signals.py).
+
+``search_rank`` is an integer, the backend's score in billionths: keyset
+cursors seek on it with ``=`` and ``<``, and a float score (PostgreSQL's
+ts_rank is a float4) doesn't compare equal to itself after a round trip
+through the cursor.
+
+``typeahead()`` serves the keystroke-driven API lookups from the trigram (or, on
+SQLite, ``LOWER()``) indexes declared on the matched columns.
+"""
+import re
+import sys
+from django.db import connection
+from django.db.models import BigIntegerField, F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast, Lower
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from .models import Item, Collection
+
+SEARCH_CONFIG = "english"
+
+# Keyset ordering for ranked result pages: best match first, pk as tiebreak.
+RANKED_ORDERING = ("-search_rank", "pk")
+
+# search_rank units per unit of the backend's score.
+RANK_SCALE = 1_000_000_000
+
+# Searchable models and their (field, weight) pairs, most important first.
+SEARCH_FIELDS = {
+    Item: [("name", "A"), ("description", "B")],
+    Collection: [("title", "A"), ("description", "B")],
+}
+
+
+def _terms(query):
+    return re.findall(r"\w+", query.lower())
+
+
+def fts_table(model):
+    return f"{model._meta.db_table}_fts"
+
+
+def _rank(score):
+    return Cast(score * RANK_SCALE, BigIntegerField())
+
+
+def _no_rank():
+    return Value(0, output_field=BigIntegerField())
+
+
+class PostgresSearchBackend:
+    def vector(self, model):
+        vector = None
+        for field, weight in SEARCH_FIELDS[model]:
+            part = SearchVector(field, weight=weight, config=SEARCH_CONFIG)
+            vector = part if vector is None else vector + part
+        return vector
+
+    def search(self, queryset, query):
+        # Every term must match, each as a prefix so partial words still hit.
+        tsquery = SearchQuery(
+            " & ".join(f"{term}:*" for term in _terms(query)),
+            search_type="raw",
+            config=SEARCH_CONFIG,
+        )
+        return queryset.filter(search_vector=tsquery).annotate(
+            search_rank=_rank(SearchRank(F("search_vector"), tsquery))
+        )
+
+    def update(self, instance):
+        model = type(instance)
+        model.objects.filter(pk=instance.pk).update(search_vector=self.vector(model))
+
+    def remove(self, instance):
+        pass  # the vector lives on the deleted row itself
+
+    def rebuild(self, model):
+        model.objects.update(search_vector=self.vector(model))
+
+
+class SQLiteSearchBackend:
+    def match(self, query):
+        return " ".join(f'"{term}"*' for term in _terms(query))
+
+    def search(self, queryset, query):
+        model = queryset.model
+        table = fts_table(model)
+        weights = ", ".join("10.0" if weight == "A" else "1.0" for _, weight in SEARCH_FIELDS[model])
+        match = self.match(query)
+        # bm25() is lower-is-better, so negate it to match SearchRank's ordering.
+        rank = RawSQL(
+            f'SELECT -bm25({table}, {weights}) FROM {table} '
+            f'WHERE {table} MATCH %s AND {table}.rowid = "{model._meta.db_table}"."id"',
+            [match],
+            output_field=FloatField(),
+        )
+        return queryset.filter(
+            pk__in=RawSQL(f"SELECT rowid FROM {table} WHERE {table} MATCH %s", [match])
+        ).annotate(search_rank=_rank(rank))
+
+    def update(self, instance):
+        model = type(instance)
+        fields = [field for field, _ in SEARCH_FIELDS[model]]
+        table = fts_table(model)
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {table} WHERE rowid = %s", [instance.pk])
+            cursor.execute(
+                f"INSERT INTO {table} (rowid, {', '.join(fields)}) VALUES (%s, {', '.join(['%s'] * len(fields))})",
+                [instance.pk] + [getattr(instance, field) or "" for field in fields],
+            )
+
+    def remove(self, instance):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {fts_table(type(instance))} WHERE rowid = %s", [instance.pk])
+
+    def rebuild(self, model):
+        fields = ", ".join(field for field, _ in SEARCH_FIELDS[model])
+        table = fts_table(model)
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {table}")
+            cursor.execute(
+                f"INSERT INTO {table} (rowid, {fields}) SELECT id, {fields} FROM {model._meta.db_table}"
+            )
+
+
+class SubstringSearchBackend:
+    def search(self, queryset, query):
+        condition = Q()
+        for field, _ in SEARCH_FIELDS[queryset.model]:
+            condition |= Q(**{f"{field}__icontains": query})
+        return queryset.filter(condition).annotate(search_rank=_no_rank())
+
+    def update(self, instance):
+        pass
+
+    def remove(self, instance):
+        pass
+
+    def rebuild(self, model):
+        pass
+
+
+def get_backend():
+    if connection.vendor == "postgresql":
+        return PostgresSearchBackend()
+    if connection.vendor == "sqlite":
+        return SQLiteSearchBackend()
+    return SubstringSearchBackend()
+
+
+def search(queryset, query):
+    """
+    Filter ``queryset`` (of Item or Collection) down to rows matching ``query``
+    and annotate each with ``search_rank``. Callers order by ``-search_rank``.
+    """
+    if not _terms(query):
+        return queryset.none().annotate(search_rank=_no_rank())
+    return get_backend().search(queryset, query)
+
+
+def _prefix_end(prefix):
+    """The smallest string after every string starting with ``prefix``, or None."""
+    prefix = prefix.rstrip(chr(sys.maxunicode))
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1) if prefix else None
+
+
+def typeahead(queryset, fields, query):
+    """
+    Match ``query`` against ``fields`` for as-you-type lookups. PostgreSQL does a
+    substring match (``icontains``, i.e. ``UPPER(field) LIKE``) served by pg_trgm
+    GIN indexes on ``UPPER(field)``. Elsewhere it is a case-insensitive prefix
+    match, written as a range on ``LOWER(field)`` so SQLite can answer it from
+    the ``LOWER(field)`` indexes (see ``models.typeahead_indexes``).
+    """
+    condition = Q()
+    if connection.vendor == "postgresql":
+        for field in fields:
+            condition |= Q(**{f"{field}__icontains": query})
+        return queryset.filter(condition)
+
+    start = query.lower()
+    end = _prefix_end(start)
+    for field in fields:
+        lowered = f"{field}_lower"
+        queryset = queryset.alias(**{lowered: Lower(field)})
+        match = Q(**{f"{lowered}__gte": start})
+        if end is not None:
+            match &= Q(**{f"{lowered}__lt": end})
+        condition |= match
+    return queryset.filter(condition)
+
+
+def update_index(instance):
+    get_backend().update(instance)
+
+
+def remove_from_index(instance):
+    get_backend().remove(instance)
+
+
+def rebuild_index():
+    backend = get_backend()
+    for model in SEARCH_FIELDS:
+        backend.rebuild(model)
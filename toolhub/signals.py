@@ -0,0 +1,177 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+from .models import CustomUser, Item, Collection, BorrowRequest, ItemReview
+from . import cache, images, search, stats
+
+
+def _adjust_rating(item_id, rating_delta, count_delta):
+    """Apply a change to an item's stored rating aggregates in the database."""
+    Item.objects.filter(pk=item_id).update(
+        rating_sum=F("rating_sum") + rating_delta,
+        rating_count=F("rating_count") + count_delta,
+    )
+
+
+@receiver(pre_save, sender=ItemReview)
+def remember_original_rating(sender, instance, **kwargs):
+    # Edits need the previous rating (and item) to compute the delta.
+    instance._original_rating = None
+    if instance.pk:
+        instance._original_rating = (
+            ItemReview.objects.filter(pk=instance.pk).values_list("item_id", "rating").first()
+        )
+
+
+@receiver(post_save, sender=ItemReview)
+def update_rating_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    original = getattr(instance, "_original_rating", None)
+    with transaction.atomic():
+        if created or original is None:
+            _adjust_rating(instance.item_id, instance.rating, 1)
+        elif original[0] != instance.item_id:
+            _adjust_rating(original[0], -original[1], -1)
+            _adjust_rating(instance.item_id, instance.rating, 1)
+        elif original[1] != instance.rating:
+            _adjust_rating(instance.item_id, instance.rating - original[1], 0)
+
+
+@receiver(post_delete, sender=ItemReview)
+def update_rating_on_delete(sender, instance, **kwargs):
+    _adjust_rating(instance.item_id, -instance.rating, -1)
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_save, sender=Collection)
+def update_search_index(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Status, borrower and rating saves name their fields and leave the text alone.
+    searchable = {field for field, _ in search.SEARCH_FIELDS[sender]}
+    if update_fields is not None and not searchable & set(update_fields):
+        return
+    if not raw:
+        search.update_index(instance)
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_save, sender=Collection)
+@receiver(post_save, sender=CustomUser)
+def update_image_derivatives(sender, instance, raw=False, **kwargs):
+    if not raw:
+        images.generate(instance)
+
+
+@receiver(post_delete, sender=Item)
+@receiver(post_delete, sender=Collection)
+def remove_from_search_index(sender, instance, **kwargs):
+    search.remove_from_index(instance)
+
+
+def _bump_on_commit(namespace):
+    # Bump after commit so no request can re-cache the pre-write result.
+    transaction.on_commit(lambda: cache.bump_version(namespace))
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+@receiver(post_save, sender=BorrowRequest)
+@receiver(post_delete, sender=BorrowRequest)
+def invalidate_item_search(sender, **kwargs):
+    _bump_on_commit(cache.ITEM_SEARCH)
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_user_search(sender, update_fields=None, **kwargs):
+    # Logins only touch last_login, which the user search never returns.
+    if update_fields is not None and set(update_fields) <= {"last_login"}:
+        return
+    _bump_on_commit(cache.USER_SEARCH)
+
+
+@receiver(m2m_changed, sender=Collection.items.through)
+def update_collection_item_count(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        # collection.items.add/remove/set/clear: refresh this collection, including
+        # the in-memory instance so a later collection.save() doesn't undo it.
+        if action in ("post_add", "post_remove", "post_clear"):
+            instance.item_count = instance.items.count()
+            Collection.objects.filter(pk=instance.pk).update(item_count=instance.item_count)
+        return
+
+    # item.collections.*: pk_set holds collection ids, except for clear.
+    if action == "pre_clear":
+        instance._cleared_collection_ids = list(instance.collections.values_list("pk", flat=True))
+    elif action in ("post_add", "post_remove"):
+        Collection.objects.filter(pk__in=pk_set).refresh_item_counts()
+    elif action == "post_clear":
+        Collection.objects.filter(pk__in=instance._cleared_collection_ids).refresh_item_counts()
+
+
+@receiver(pre_delete, sender=Item)
+def remember_item_collections(sender, instance, **kwargs):
+    # Deleting an item drops its through rows without sending m2m_changed.
+    instance._collection_ids = list(instance.collections.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=Item)
+def update_counts_after_item_delete(sender, instance, **kwargs):
+    if getattr(instance, "_collection_ids", None):
+        Collection.objects.filter(pk__in=instance._collection_ids).refresh_item_counts()
+
+
+@receiver(m2m_changed, sender=Collection.items.through)
+def update_item_visibility(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # item.collections.*: refresh this item, in memory as well.
+        if action in ("post_add", "post_remove", "post_clear"):
+            items = Item.objects.filter(pk=instance.pk)
+            items.refresh_visibility()
+            instance.is_publicly_visible = items.values_list("is_publicly_visible", flat=True).get()
+        return
+
+    # collection.items.*: pk_set holds item ids, except for clear.
+    if action == "pre_clear":
+        instance._cleared_item_ids = list(instance.items.values_list("pk", flat=True))
+    elif action in ("post_add", "post_remove"):
+        Item.objects.filter(pk__in=pk_set).refresh_visibility()
+    elif action == "post_clear":
+        Item.objects.filter(pk__in=instance._cleared_item_ids).refresh_visibility()
+
+
+@receiver(post_save, sender=Collection)
+def update_visibility_on_collection_save(sender, instance, created, raw=False, **kwargs):
+    # A visibility change can flip every item in the collection.
+    if not created and not raw:
+        Item.objects.filter(collections=instance).refresh_visibility()
+
+
+@receiver(pre_delete, sender=Collection)
+def remember_collection_items(sender, instance, **kwargs):
+    # Deleting a collection drops its through rows without sending m2m_changed.
+    instance._item_ids = list(instance.items.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=Collection)
+def update_visibility_after_collection_delete(sender, instance, **kwargs):
+    if getattr(instance, "_item_ids", None):
+        Item.objects.filter(pk__in=instance._item_ids).refresh_visibility()
+
+
+@receiver(pre_save, sender=BorrowRequest)
+def remember_original_status(sender, instance, **kwargs):
+    instance._original_status = None
+    if instance.pk:
+        instance._original_status = (
+            BorrowRequest.objects.filter(pk=instance.pk).values_list("status", flat=True).first()
+        )
+
+
+@receiver(post_save, sender=BorrowRequest)
+def record_status_transition(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created or instance.status != getattr(instance, "_original_status", None):
+        stats.record([(instance.item_id, instance.item.location, instance.status)])
@@ -0,0 +1,49 @@
+// Direct-to-S3 uploads: a file input marked with data-direct-upload is sent
+// straight to the bucket with a presigned POST, and the form submits only the
+// signed token for it as "<name>_token". Any failure falls back to a normal
+// multipart upload through the app.
+document.addEventListener("DOMContentLoaded", function () {
+  async function upload(input, file) {
+    const csrf = input.form.querySelector("[name=csrfmiddlewaretoken]").value;
+    const params = new FormData();
+    params.append("kind", input.dataset.directUpload);
+    params.append("content_type", file.type);
+    const presign = await fetch(input.dataset.presignUrl, {
+      method: "POST",
+      body: params,
+      headers: { "X-CSRFToken": csrf },
+    });
+    if (!presign.ok) throw new Error("presign failed");
+    const { url, fields, token } = await presign.json();
+
+    const body = new FormData();
+    Object.entries(fields).forEach(([key, value]) => body.append(key, value));
+    body.append("file", file);  // S3 requires the file to be the last field
+    const response = await fetch(url, { method: "POST", body: body });
+    if (!response.ok) throw new Error("upload failed");
+    return token;
+  }
+
+  document.querySelectorAll("input[type=file][data-direct-upload]").forEach(function (input) {
+    const form = input.form;
+    if (!form) return;
+
+    form.addEventListener("submit", async function (e) {
+      const file = input.files[0];
+      if (!file || form.dataset.directUploadDone) return;
+      e.preventDefault();
+      form.dataset.directUploadDone = "1";
+      try {
+        const hidden = document.createElement("input");
+        hidden.type = "hidden";
+        hidden.name = input.name + "_token";
+        hidden.value = await upload(input, file);
+        form.appendChild(hidden);
+        input.value = "";
+      } catch (error) {
+        console.warn("Direct upload unavailable, uploading through the app.", error);
+      }
+      form.submit();
+    });
+  });
+});
@@ -0,0 +1,104 @@
+"""
+Daily circulation rollups for the librarian dashboard.
+
+``CirculationStat`` keeps one counter per (day, item, location, status): how many
+borrow requests entered that status that day. Every transition adds to it, from
+``post_save`` for model saves (see signals.py) and from explicit ``record()``
+calls next to the queryset updates in toolhub.borrowing. The dashboard reads
+only these rows, so its cost depends on the reporting window, not on how much
+borrowing history there is.
+"""
+from collections import Counter
+from datetime import timedelta
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils.timezone import localdate
+from .models import BorrowRequest, CirculationStat, Item
+
+
+def record(transitions, day=None):
+    """Count ``(item_id, location, status)`` transitions against ``day`` (today)."""
+    day = day or localdate()
+    for (item_id, location, status), count in Counter(transitions).items():
+        key = {"day": day, "item_id": item_id, "location": location, "status": status}
+        # Usually the day's row exists and this is the only query.
+        if CirculationStat.objects.filter(**key).update(count=F("count") + count):
+            continue
+        try:
+            with transaction.atomic():
+                CirculationStat.objects.create(count=count, **key)
+        except IntegrityError:
+            # Another transaction created the row first.
+            CirculationStat.objects.filter(**key).update(count=F("count") + count)
+
+
+def _sum(status):
+    return Sum("count", filter=Q(status=status), default=0)
+
+
+def dashboard(days=30, top=10):
+    """Summarize the last ``days`` days of rollups for the dashboard template."""
+    since = localdate() - timedelta(days=days - 1)
+    stats = CirculationStat.objects.filter(day__gte=since)
+    locations = dict(Item.LOCATION_CHOICES)
+
+    totals = dict(stats.values_list("status").annotate(total=Sum("count")))
+    by_location = []
+    for row in stats.values("location").annotate(
+        requests=_sum("pending"), borrows=_sum("approved"), overdue=_sum("overdue")
+    ).order_by("location"):
+        row["label"] = locations.get(row["location"], row["location"])
+        row["overdue_rate"] = row["overdue"] / row["borrows"] if row["borrows"] else 0
+        by_location.append(row)
+
+    return {
+        "days": days,
+        "since": since,
+        "totals": [(label, totals.get(status, 0)) for status, label in BorrowRequest.STATUS_CHOICES],
+        "daily": list(
+            stats.values("day")
+            .annotate(
+                requests=_sum("pending"),
+                borrows=_sum("approved"),
+                returns=_sum("returned_on_time") + _sum("returned_overdue"),
+            )
+            .order_by("-day")
+        ),
+        "by_location": by_location,
+        "top_items": list(
+            stats.filter(status="approved")
+            .values("item_id", "item__name")
+            .annotate(borrows=Sum("count"))
+            .order_by("-borrows", "item__name")[:top]
+        ),
+    }
+
+
+def rebuild():
+    """
+    Recreate the rollups from BorrowRequest history. Past transition dates are
+    not stored, so every request is counted as entering "pending" and its
+    current status on its request date. Returns the number of rows written.
+    """
+    requests = BorrowRequest.objects.annotate(day=TruncDate("request_date"))
+    created = requests.values("day", "item_id", "item__location").annotate(total=Count("pk"))
+    current = (
+        requests.exclude(status="pending")
+        .values("day", "item_id", "item__location", "status")
+        .annotate(total=Count("pk"))
+    )
+    rows = [
+        CirculationStat(
+            day=row["day"],
+            item_id=row["item_id"],
+            location=row["item__location"],
+            status=row.get("status", "pending"),
+            count=row["total"],
+        )
+        for row in [*created, *current]
+    ]
+    with transaction.atomic():
+        CirculationStat.objects.all().delete()
+        CirculationStat.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
@@ -0,0 +1,117 @@
+# toolhub/templatetags/card_tags.py
+import hashlib
+import re
+from functools import cache as memoize
+from django import template
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+from .. import cache
+
+register = template.Library()
+
+INCLUDE = re.compile(r"""{%\s*include\s+["']([^"']+)["']""")
+
+
+def _item_fields(item):
+    derivatives = item.image_derivatives or {}
+    return (
+        item.name, item.description, item.image.name, item.image_processing,
+        derivatives.get("source"), bool(derivatives.get("variants")),
+    )
+
+
+def _collection_fields(collection):
+    derivatives = collection.image_derivatives or {}
+    return (
+        str(collection.uuid), collection.title, collection.description, collection.visibility,
+        collection.item_count, collection.image.name, collection.image_processing,
+        derivatives.get("source"), bool(derivatives.get("variants")),
+    )
+
+
+# kind -> (cache namespace, fragment template, fields the fragment renders)
+CARDS = {
+    "item": (cache.ITEM_CARD, "toolhub/includes/_item_card_fragment.html", _item_fields),
+    "collection": (cache.COLLECTION_CARD, "toolhub/includes/_collection_card_fragment.html", _collection_fields),
+}
+
+
+def fragment_templates():
+    """``{name: source}`` of the fragment templates and every template they include."""
+    sources = {}
+    pending = [template_name for _, template_name, _ in CARDS.values()]
+    while pending:
+        name = pending.pop()
+        if name not in sources:
+            sources[name] = get_template(name).template.source
+            pending.extend(INCLUDE.findall(sources[name]))
+    return sources
+
+
+@memoize
+def fragment_version():
+    """
+    Digest of the fragment markup and the release, so cards cached by an
+    earlier deploy stop matching as soon as the templates, static URLs or
+    code change.
+    """
+    sources = sorted(fragment_templates().items())
+    return hashlib.md5(repr((settings.TOOLHUB_RELEASE, settings.STATIC_URL, sources)).encode()).hexdigest()
+
+
+@receiver(setting_changed)
+def clear_fragment_version(setting, **kwargs):
+    if setting in ("TOOLHUB_RELEASE", "STATIC_URL", "TEMPLATES"):
+        fragment_version.cache_clear()
+
+
+def card_version(kind, obj):
+    """
+    Digest of everything ``obj``'s card fragment shows. Any write to those
+    fields, by ``save()`` or by a queryset update, yields a new version.
+    """
+    fields = CARDS[kind][2](obj)
+    return hashlib.md5(repr((fragment_version(), settings.TOOLHUB_MEDIA_BASE_URL, fields)).encode()).hexdigest()
+
+
+def _fragment_args(kind, objects, user):
+    namespace, template_name, _ = CARDS[kind]
+    fragment = get_template(template_name)
+    return (
+        namespace,
+        objects,
+        lambda obj: card_version(kind, obj),
+        cache.viewer_key(user),
+        lambda obj: str(fragment.render({kind: obj, "user": user})),
+    )
+
+
+def _attach(objects, fragments):
+    for obj in objects:
+        obj.card_fragment = mark_safe(fragments[obj.pk])
+
+
+@register.simple_tag(takes_context=True)
+def prefetch_cards(context, objects, kind):
+    """
+    ``{% prefetch_cards items "item" %}`` before a loop of cards: sets
+    ``card_fragment`` on every object from one cache ``get_many``, rendering
+    only the misses. Cards left without one render their fragment inline.
+    Objects an async view already ran ``aprefetch_cards()`` on are skipped.
+    """
+    objects = [obj for obj in objects if not hasattr(obj, "card_fragment")]
+    if objects:
+        _attach(objects, cache.cached_fragments(*_fragment_args(kind, objects, context.get("user"))))
+    return ""
+
+
+async def aprefetch_cards(objects, kind, user):
+    """
+    ``{% prefetch_cards %}`` for async views, called before rendering so the
+    cache round trips don't block the event loop.
+    """
+    objects = list(objects)
+    _attach(objects, await cache.acached_fragments(*_fragment_args(kind, objects, user)))
@@ -0,0 +1,11 @@
+# toolhub/templatetags/media_tags.py
+from django import template
+from .. import media
+
+register = template.Library()
+
+
+@register.filter
+def media_url(fieldfile):
+    """``{{ item.image|media_url }}``: cached public URL, see toolhub.media."""
+    return media.file_url(fieldfile)
@@ -0,0 +1,33 @@
+"""
+Template cache warming.
+
+The cached template loader compiles each template on first use, so without
+warming the first requests a fresh worker serves pay for parsing every
+template they touch. ``warm()`` compiles all of toolhub's templates up front;
+mysite/wsgi.py calls it once per worker at boot.
+"""
+import logging
+from pathlib import Path
+from django.template import TemplateSyntaxError
+from django.template.loader import get_template
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_ROOT = Path(__file__).resolve().parent / "templates"
+
+
+def template_names():
+    return sorted(path.relative_to(TEMPLATE_ROOT).as_posix() for path in TEMPLATE_ROOT.rglob("*.html"))
+
+
+def warm():
+    """Compile every toolhub template into the cached loader. Returns how many compiled."""
+    compiled = 0
+    for name in template_names():
+        try:
+            get_template(name)
+            compiled += 1
+        except TemplateSyntaxError:
+            # Let the request that uses it fail, not the worker.
+            logger.exception("Template %s does not compile", name)
+    return compiled
@@ -1,11 +1,44 @@
-from django.test import TestCase, Client, override_settings
+from django.test import TestCase, TransactionTestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, connections, OperationalError
+from django.core.management import call_command
+from django.core import mail
+from django.core.mail.backends import locmem
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from unittest import skipUnless
 from unittest.mock import patch
-from .models import CustomUser, Item, Collection, BorrowRequest
+from django.core.exceptions import ValidationError
+from .models import CustomUser, Item, Collection, BorrowRequest, CirculationStat, ItemReview, Notification, UploadJob
+from django.db.models import Sum
+from . import borrowing, cache, media, notifications, search, templating, uploads
+from mysite import database
+from .borrowing import approve_request
+from .pagination import KeysetPaginator
+from django.core.cache import cache as django_cache
 from django.core.files.storage import FileSystemStorage, default_storage
 import os
+import runpy
+import smtplib
+import struct
+import threading
+import time
+import zlib
+from datetime import date, timedelta
+from django.utils import timezone
+from io import BytesIO, StringIO
+import shutil
+import tempfile
+from PIL import Image
+from django.template import engines
+from django.template.loader import render_to_string
+import boto3
+import requests
+from moto import mock_aws
+from mysite.storage_backends import MediaStorage
+from .templatetags import card_tags
 
 
 # Disable SSL redirect/cookie‐secure in tests
@@ -13,8 +46,12 @@ TEST_SETTINGS = {
     "SECURE_SSL_REDIRECT": False,
     "SESSION_COOKIE_SECURE": False,
     "CSRF_COOKIE_SECURE": False,
+    # Keep cached responses from leaking between tests; cache tests opt back in.
+    "CACHES": {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}},
 }
 
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "tests"}}
+
 @override_settings(**TEST_SETTINGS)
 class CustomUserModelTests(TestCase):
     def setUp(self):
@@ -26,14 +63,13 @@ class CustomUserModelTests(TestCase):
             role='patron'
         )
 
-    @patch('django.core.files.storage.default_storage.delete')
-    @patch('django.core.files.storage.default_storage.exists')
-    def test_profile_picture_update_deletes_old_file(self, mock_exists, mock_delete):
+    @override_settings(TOOLHUB_UPLOADS_EAGER=True)
+    def test_profile_picture_update_deletes_old_file(self):
         """
         When updating the profile picture to a new file and the old picture is not default,
-        the old file should be deleted.
+        the old file should be deleted once the save commits.
         """
-        mock_exists.return_value = True
+        storage = CustomUser._meta.get_field('profile_picture').storage
 
         initial_image = SimpleUploadedFile(
             "old_image.jpg",
@@ -49,19 +85,19 @@ class CustomUserModelTests(TestCase):
             b"new image content",
             content_type="image/jpeg"
         )
-        self.user.profile_picture = new_image
-        self.user.save()
+        with patch.object(storage, "delete") as mock_delete, self.captureOnCommitCallbacks(execute=True):
+            self.user.profile_picture = new_image
+            self.user.save()
+            mock_delete.assert_not_called()
 
-        mock_exists.assert_called_with(old_image_name)
-        mock_delete.assert_called_with(old_image_name)
+        mock_delete.assert_called_once_with(old_image_name)
 
-    @patch('django.core.files.storage.default_storage.delete')
-    @patch('django.core.files.storage.default_storage.exists')
-    def test_profile_picture_update_no_deletion_when_same(self, mock_exists, mock_delete):
+    @override_settings(TOOLHUB_UPLOADS_EAGER=True)
+    def test_profile_picture_update_no_deletion_when_same(self):
         """
         If the profile picture remains unchanged, no deletion should occur.
         """
-        mock_exists.return_value = True
+        storage = CustomUser._meta.get_field('profile_picture').storage
 
         test_image = SimpleUploadedFile(
             "image.jpg",
@@ -71,12 +107,30 @@ class CustomUserModelTests(TestCase):
         self.user.profile_picture = test_image
         self.user.save()
 
+        with patch.object(storage, "delete") as mock_delete, self.captureOnCommitCallbacks(execute=True):
+            self.user.profile_picture = self.user.profile_picture
+            self.user.save()
+            CustomUser.objects.get(pk=self.user.pk).save()
 
-        self.user.profile_picture = self.user.profile_picture
-        self.user.save()
+        mock_delete.assert_not_called()
 
+    def test_save_does_not_reread_the_row(self):
+        user = CustomUser.objects.get(pk=self.user.pk)
+        user.role = "librarian"
+        with self.assertNumQueries(1):
+            user.save()
+        with self.assertNumQueries(1):
+            user.save(update_fields=["last_login"])
 
-        mock_delete.assert_not_called()
+    @override_settings(TOOLHUB_UPLOADS_EAGER=True)
+    def test_picture_change_detected_on_loaded_user(self):
+        CustomUser.objects.filter(pk=self.user.pk).update(profile_picture="profile_pictures/old.jpg")
+        user = CustomUser.objects.get(pk=self.user.pk)
+        storage = CustomUser._meta.get_field('profile_picture').storage
+        with patch.object(storage, "delete") as mock_delete, self.captureOnCommitCallbacks(execute=True):
+            user.profile_picture = None
+            user.save()
+        mock_delete.assert_called_once_with("profile_pictures/old.jpg")
 
 
 
@@ -158,6 +212,8 @@ class ItemTests(TestCase):
                     default_storage.delete(item.image.name)
                 except Exception:
                     pass
+        # Image derivatives are written beside the originals under MEDIA_ROOT.
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
 
     def test_item_model_default_image_url(self):
         """
@@ -567,6 +623,28 @@ class BorrowViewsTests(TestCase):
         self.item.refresh_from_db()
         self.assertEqual(self.item.status, "currently_borrowed")
 
+    def test_approve_borrow_denies_competing_requests(self):
+        other = CustomUser.objects.create_user(username="other", email="other@test.com", password="pass")
+        competing = BorrowRequest.objects.create(item=self.item, user=other, status="pending")
+        self.client.login(username="lib", password="pass")
+        self.client.post(reverse("approve_borrow", args=[self.borrow_request.id]))
+        competing.refresh_from_db()
+        self.assertEqual(competing.status, "denied")
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.borrower, self.patron)
+
+    def test_approve_borrow_unavailable_item(self):
+        """Approving a request for an item someone else already holds changes nothing."""
+        other = CustomUser.objects.create_user(username="other", email="other@test.com", password="pass")
+        Item.objects.filter(pk=self.item.pk).update(status="currently_borrowed", borrower=other)
+        self.client.login(username="lib", password="pass")
+        response = self.client.post(reverse("approve_borrow", args=[self.borrow_request.id]))
+        self.assertRedirects(response, reverse("my_borrow_requests"))
+        self.borrow_request.refresh_from_db()
+        self.assertEqual(self.borrow_request.status, "pending")
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.borrower, other)
+
     def test_deny_borrow(self):
         """
         Verify that a librarian can deny a pending borrow request.
@@ -578,4 +656,1667 @@ class BorrowViewsTests(TestCase):
         self.borrow_request.refresh_from_db()
         self.assertEqual(self.borrow_request.status, "denied")
         self.item.refresh_from_db()
-        self.assertEqual(self.item.status, "available")
\ No newline at end of file
+        self.assertEqual(self.item.status, "available")
+
+@override_settings(**TEST_SETTINGS)
+class ItemStatusTests(TestCase):
+    def setUp(self):
+        self.patron = CustomUser.objects.create_user(
+            username="patron", email="patron@test.com", password="pass", role="patron"
+        )
+        self.other = CustomUser.objects.create_user(
+            username="other", email="other@test.com", password="pass", role="patron"
+        )
+        self.requested = Item.objects.create(name="Drill", identifier="drill001")
+        self.borrowed = Item.objects.create(
+            name="Saw", identifier="saw001", status="currently_borrowed", borrower=self.other
+        )
+        self.free = Item.objects.create(name="Hammer", identifier="hammer001")
+        BorrowRequest.objects.create(item=self.requested, user=self.patron, status="pending")
+
+    def test_with_user_status_matches_status_for_user(self):
+        """
+        The bulk resolver should produce the same display strings as the per-item method.
+        """
+        items = Item.objects.order_by("pk").with_user_status(self.patron)
+        for item in items:
+            self.assertEqual(item.user_status, Item.objects.get(pk=item.pk).status_for_user(self.patron))
+        self.assertEqual(
+            [item.user_status for item in items],
+            ["Already requested", "Borrowed", "Available"],
+        )
+        self.assertEqual([item.already_requested for item in items], [True, False, False])
+
+    def test_with_user_status_is_a_single_query(self):
+        """
+        The annotations are computed in SQL, so evaluating the queryset is one query.
+        """
+        with self.assertNumQueries(1):
+            items = list(Item.objects.with_user_status(self.patron))
+        with self.assertNumQueries(0):
+            for item in items:
+                item.status_for_user(self.patron)
+
+    def test_with_user_status_anonymous(self):
+        with self.assertNumQueries(1):
+            items = list(Item.objects.order_by("pk").with_user_status(AnonymousUser()))
+        self.assertEqual([item.user_status for item in items], ["Available", "Currently Borrowed", "Available"])
+
+
+
+@override_settings(**TEST_SETTINGS)
+class ListingQueryCountTests(TestCase):
+    """
+    Listing pages must run a constant number of queries regardless of catalog size.
+    """
+    def setUp(self):
+        self.client = Client()
+        self.librarian = CustomUser.objects.create_user(
+            username="librarian", email="librarian@test.com", password="pass", role="librarian"
+        )
+        self.patron = CustomUser.objects.create_user(
+            username="patron", email="patron@test.com", password="pass", role="patron"
+        )
+        self.collection = Collection.objects.create(
+            title="Shop", description="Shop tools", visibility="public", creator=self.librarian
+        )
+        self.counter = 0
+
+    def add_items(self, count):
+        for _ in range(count):
+            self.counter += 1
+            item = Item.objects.create(name=f"Tool {self.counter}", identifier=f"tool{self.counter}")
+            self.collection.items.add(item)
+            BorrowRequest.objects.create(item=item, user=self.patron, status="pending")
+            Collection.objects.create(
+                title=f"Kit {self.counter}", description="Kit", creator=self.librarian
+            ).items.add(item)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx)
+
+    def assertConstantQueries(self, url):
+        self.add_items(2)
+        self.client.get(url)  # warm per-process caches (e.g. the current Site)
+        small = self.count_queries(url)
+        self.add_items(10)
+        self.assertEqual(self.count_queries(url), small)
+
+    def test_home_page(self):
+        self.client.login(username="patron", password="pass")
+        self.assertConstantQueries(reverse("home"))
+
+    def test_home_page_anonymous(self):
+        self.assertConstantQueries(reverse("home"))
+
+    def test_tools_page(self):
+        self.client.login(username="patron", password="pass")
+        self.assertConstantQueries(reverse("tools_page"))
+
+    def test_view_collection(self):
+        self.client.login(username="patron", password="pass")
+        self.assertConstantQueries(reverse("view_collection", args=[self.collection.uuid]))
+
+    def test_collections_page(self):
+        self.client.login(username="patron", password="pass")
+        self.assertConstantQueries(reverse("collections_page"))
+
+    def test_search_items_api(self):
+        self.client.login(username="patron", password="pass")
+        self.assertConstantQueries(reverse("api_search_items") + "?q=Tool")
+
+    def test_collections_page_prefetches_annotated_items(self):
+        self.add_items(3)
+        self.client.login(username="patron", password="pass")
+        response = self.client.get(reverse("collections_page"))
+        with self.assertNumQueries(0):
+            statuses = [item.user_status for c in response.context["collections"] for item in c.items.all()]
+        self.assertEqual(statuses.count("Already requested"), 6)
+
+
+
+@override_settings(**TEST_SETTINGS)
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        self.patron = CustomUser.objects.create_user(
+            username="patron", email="patron@test.com", password="pass", role="patron"
+        )
+        self.other = CustomUser.objects.create_user(
+            username="other", email="other@test.com", password="pass", role="patron"
+        )
+        self.item = Item.objects.create(name="Drill", identifier="drill001")
+
+    def test_review_create_edit_delete_updates_aggregates(self):
+        review = ItemReview.objects.create(item=self.item, user=self.patron, rating=4)
+        ItemReview.objects.create(item=self.item, user=self.other, rating=2)
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.rating_sum, self.item.rating_count), (6, 2))
+        self.assertEqual(self.item.average_rating, 3)
+
+        review.rating = 5
+        review.save()
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.rating_sum, self.item.rating_count), (7, 2))
+
+        review.delete()
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.rating_sum, self.item.rating_count), (2, 1))
+
+    def test_item_save_keeps_concurrent_review(self):
+        """
+        A full save of an item loaded before a review was posted must not
+        overwrite the review's counter update.
+        """
+        stale = Item.objects.get(pk=self.item.pk)
+        ItemReview.objects.create(item=self.item, user=self.patron, rating=4)
+        stale.mark_as_borrowed()
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.status, "currently_borrowed")
+        self.assertEqual((self.item.rating_sum, self.item.rating_count), (4, 1))
+
+    def test_average_rating_without_reviews(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(self.item.average_rating, 0)
+
+    def test_rebuild_command(self):
+        ItemReview.objects.create(item=self.item, user=self.patron, rating=4)
+        ItemReview.objects.create(item=self.item, user=self.other, rating=3)
+        Item.objects.update(rating_sum=0, rating_count=0)
+        call_command("rebuild_item_ratings", stdout=StringIO())
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.rating_sum, self.item.rating_count), (7, 2))
+
+
+@override_settings(**TEST_SETTINGS, TOOLHUB_PAGE_SIZE=3)
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.librarian = CustomUser.objects.create_user(
+            username="librarian", email="librarian@test.com", password="pass", role="librarian"
+        )
+        self.patron = CustomUser.objects.create_user(
+            username="patron", email="patron@test.com", password="pass", role="patron"
+        )
+        self.items = [
+            Item.objects.create(name=f"Drill {i}", identifier=f"drill{i}") for i in range(7)
+        ]
+        Item.objects.create(name="Hammer", identifier="hammer")
+
+    def walk(self, url, context_name):
+        """Follow next cursors to the end, then previous cursors back to the start."""
+        forward, response = [], self.client.get(url)
+        while True:
+            page = response.context[context_name]
+            forward.append([obj.pk for obj in page])
+            if not page.has_next:
+                break
+            response = self.client.get(f"{url.split('?')[0]}?{page.next_query}")
+        backward = [[obj.pk for obj in page]]
+        while page.has_previous:
+            response = self.client.get(f"{url.split('?')[0]}?{page.previous_query}")
+            page = response.context[context_name]
+            backward.append([obj.pk for obj in page])
+        return forward, backward[::-1]
+
+    def test_tools_page_cursors_keep_search(self):
+        forward, backward = self.walk(reverse("tools_page") + "?q=Drill", "items")
+        expected = [item.pk for item in self.items]
+        self.assertEqual(forward, [expected[0:3], expected[3:6], expected[6:7]])
+        self.assertEqual(backward, forward)
+
+    def test_ranked_cursors_with_fractional_ties(self):
+        # Two groups of tied, fractional ranks, each straddling a page boundary.
+        for i in range(4):
+            Item.objects.create(name=f"Saw {i}", identifier=f"saw{i}", description="Cuts holes a drill can't")
+        forward, backward = self.walk(reverse("tools_page") + "?q=Drill", "items")
+        ranked = search.search(Item.objects.all(), "Drill").order_by(*search.RANKED_ORDERING)
+        self.assertEqual(sum(forward, []), list(ranked.values_list("pk", flat=True)))
+        self.assertEqual(len(sum(forward, [])), 11)
+        self.assertEqual(backward, forward)
+
+    @skipUnless(connection.vendor == "postgresql", "ts_rank is PostgreSQL's")
+    def test_postgres_rank_survives_the_cursor(self):
+        ranked = search.search(Item.objects.all(), "drill")
+        first = KeysetPaginator(ranked, ordering=search.RANKED_ORDERING).get_page()
+        self.assertIsInstance(first[0].search_rank, int)
+        self.assertGreater(first[0].search_rank, 0)
+        after = KeysetPaginator(ranked, ordering=search.RANKED_ORDERING).get_page(
+            after=first.next_query.split("=", 1)[1]
+        )
+        self.assertEqual([item.pk for item in list(first) + list(after)][:6], [item.pk for item in self.items[:6]])
+
+    def test_borrow_overview_orders_by_request_date(self):
+        for item in self.items:
+            BorrowRequest.objects.create(item=item, user=self.patron)
+        # Identical timestamps must still page deterministically via the pk tiebreak.
+        BorrowRequest.objects.update(request_date=BorrowRequest.objects.first().request_date)
+        self.client.login(username="librarian", password="pass")
+        forward, backward = self.walk(reverse("my_borrow_requests"), "borrow_requests")
+        expected = list(BorrowRequest.objects.order_by("-request_date", "-pk").values_list("pk", flat=True))
+        self.assertEqual(sum(forward, []), expected)
+        self.assertEqual(backward, forward)
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        response = self.client.get(reverse("tools_page") + "?after=not-a-cursor")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item.pk for item in response.context["items"]], [item.pk for item in self.items[:3]])
+
+
+@override_settings(**TEST_SETTINGS)
+class SearchTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.librarian = CustomUser.objects.create_user(
+            username="librarian", email="librarian@test.com", password="pass", role="librarian"
+        )
+        self.by_description = Item.objects.create(
+            name="Toolbox", identifier="box001", description="Holds a cordless drill and bits"
+        )
+        self.by_name = Item.objects.create(name="Cordless Drill", identifier="drill001")
+        Item.objects.create(name="Hammer", identifier="hammer001", description="Claw hammer")
+
+    def names(self, queryset):
+        return [obj.name for obj in queryset.order_by(*search.RANKED_ORDERING)]
+
+    def test_ranks_name_matches_first(self):
+        self.assertEqual(self.names(search.search(Item.objects.all(), "drill")), ["Cordless Drill", "Toolbox"])
+
+    def test_prefix_and_multiple_terms(self):
+        self.assertEqual(self.names(search.search(Item.objects.all(), "cord dri")), ["Cordless Drill", "Toolbox"])
+        self.assertEqual(self.names(search.search(Item.objects.all(), "drill hammer")), [])
+        self.assertEqual(self.names(search.search(Item.objects.all(), "\"drill")), ["Cordless Drill", "Toolbox"])
+
+    def test_index_follows_save_and_delete(self):
+        self.by_name.name = "Impact Driver"
+        self.by_name.save()
+        self.assertEqual(self.names(search.search(Item.objects.all(), "impact")), ["Impact Driver"])
+        self.assertEqual(self.names(search.search(Item.objects.all(), "drill")), ["Toolbox"])
+        self.by_description.delete()
+        self.assertEqual(self.names(search.search(Item.objects.all(), "drill")), [])
+
+    def test_saves_of_other_fields_skip_the_index(self):
+        with patch("toolhub.search.update_index") as update_index:
+            self.by_name.status = "being_repaired"
+            self.by_name.save(update_fields=["status"])
+            update_index.assert_not_called()
+            self.by_name.save(update_fields=["status", "name"])
+            update_index.assert_called_once_with(self.by_name)
+
+    def test_collections_are_searchable(self):
+        Collection.objects.create(
+            title="Woodworking", description="Saws and chisels", creator=self.librarian
+        )
+        self.assertEqual(
+            [c.title for c in search.search(Collection.objects.all(), "chisel")], ["Woodworking"]
+        )
+
+    def test_rebuild_command(self):
+        call_command("rebuild_search_index", stdout=StringIO())
+        self.assertEqual(self.names(search.search(Item.objects.all(), "drill")), ["Cordless Drill", "Toolbox"])
+
+    @skipUnless(connection.vendor == "postgresql", "GIN indexes are PostgreSQL only")
+    def test_search_vectors_have_gin_indexes(self):
+        for model in search.SEARCH_FIELDS:
+            with connection.cursor() as cursor:
+                constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+            gin = [c["columns"] for c in constraints.values() if c["index"] and c["type"] == "gin"]
+            self.assertIn(["search_vector"], gin)
+
+    def test_views_use_ranked_search(self):
+        response = self.client.get(reverse("tools_page") + "?q=drill")
+        self.assertEqual([item.name for item in response.context["items"]], ["Cordless Drill", "Toolbox"])
+
+
+@override_settings(**TEST_SETTINGS)
+class TypeaheadApiTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.patron = CustomUser.objects.create_user(
+            username="patron", email="patron@test.com", password="pass", role="patron",
+            first_name="Pat", last_name="Ron",
+        )
+        CustomUser.objects.create_user(username="zed", email="zed@test.com", password="pass")
+        Item.objects.create(name="Drill Press", identifier="press001")
+        Item.objects.create(name="drill bits", identifier="bits001")
+        Item.objects.create(name="Hammer", identifier="hammer001")
+
+    def test_items_match_name_prefix_case_insensitively(self):
+        response = self.client.get(reverse("api_search_items") + "?q=DRI")
+        self.assertCountEqual([row["name"] for row in response.json()], ["Drill Press", "drill bits"])
+        self.assertEqual(
+            set(response.json()[0]), {"id", "name", "title", "status", "status_display"}
+        )
+
+    def test_users_match_username_or_email(self):
+        response = self.client.get(reverse("api_search_users") + "?q=pat")
+        self.assertEqual(response.json(), [{"id": self.patron.id, "name": "Pat Ron", "email": "patron@test.com"}])
+        response = self.client.get(reverse("api_search_users") + "?q=zed@")
+        self.assertEqual([row["name"] for row in response.json()], ["zed"])
+
+    def test_short_queries_return_nothing(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("api_search_items") + "?q=d")
+        self.assertEqual(response.json(), [])
+        response = self.client.get(reverse("api_search_users") + "?q=%20p%20")
+        self.assertEqual(response.json(), [])
+
+    @override_settings(TOOLHUB_TYPEAHEAD_LIMIT=1)
+    def test_results_are_capped(self):
+        response = self.client.get(reverse("api_search_items") + "?q=dri")
+        self.assertEqual(len(response.json()), 1)
+
+    def test_prefix_range_edges(self):
+        Item.objects.create(name="Drilm", identifier="drilm001")
+        Item.objects.create(name="Dril", identifier="dril001")
+        names = search.typeahead(Item.objects.all(), ["name"], "dril").values_list("name", flat=True)
+        self.assertCountEqual(names, ["Drill Press", "drill bits", "Drilm", "Dril"])
+        self.assertFalse(search.typeahead(Item.objects.all(), ["name"], chr(0x10FFFF)).exists())
+
+    def plans(self):
+        items = search.typeahead(Item.objects.only("id", "name"), ["name"], "dri").order_by("name", "pk")[:20]
+        users = search.typeahead(CustomUser.objects.all(), ["username", "email"], "pat").order_by("username", "pk")
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")  # tiny tables: make the planner show the index
+        return items.explain(), users.values("id")[:20].explain()
+
+    @skipUnless(connection.vendor == "sqlite", "prefix range indexes are SQLite only")
+    def test_sqlite_typeahead_uses_lower_indexes(self):
+        item_plan, user_plan = self.plans()
+        self.assertIn("USING INDEX item_name_lower_idx", item_plan)
+        self.assertNotIn("SCAN toolhub_item", item_plan)
+        self.assertIn("USING INDEX customuser_username_lower_idx", user_plan)
+        self.assertIn("USING INDEX customuser_email_lower_idx", user_plan)
+        self.assertNotIn("SCAN toolhub_customuser", user_plan)
+
+    @skipUnless(connection.vendor == "postgresql", "trigram indexes are PostgreSQL only")
+    def test_postgres_typeahead_uses_trigram_indexes(self):
+        item_plan, user_plan = self.plans()
+        self.assertIn("item_name_trgm", item_plan)
+        self.assertIn("customuser_username_trgm", user_plan)
+        self.assertIn("customuser_email_trgm", user_plan)
+
+
+@override_settings(**{**TEST_SETTINGS, "CACHES": LOCMEM_CACHES})
+class TypeaheadCacheTests(TestCase):
+    def setUp(self):
+        django_cache.clear()
+        self.client = Client()
+        self.patron = CustomUser.objects.create_user(
+            username="patron", email="patron@test.com", password="pass", role="patron"
+        )
+        self.item = Item.objects.create(name="Drill", identifier="drill001")
+
+    def get_items(self, q="dri"):
+        return self.client.get(reverse("api_search_items") + f"?q={q}").json()
+
+    def test_repeated_query_is_served_from_cache(self):
+        self.client.login(username="patron", password="pass")
+        first = self.get_items()
+        with self.assertNumQueries(2):  # session + user only
+            self.assertEqual(self.get_items("  DRI "), first)
+
+    def test_item_and_borrow_writes_invalidate(self):
+        self.client.login(username="patron", password="pass")
+        self.assertEqual(self.get_items()[0]["status_display"], "Available")
+        with self.captureOnCommitCallbacks(execute=True):
+            BorrowRequest.objects.create(item=self.item, user=self.patron)
+        self.assertEqual(self.get_items()[0]["status_display"], "Already requested")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.name = "Drill Press"
+            self.item.save()
+        self.assertEqual(self.get_items()[0]["name"], "Drill Press")
+
+    def test_item_results_are_per_user(self):
+        other = CustomUser.objects.create_user(username="other", email="other@test.com", password="pass")
+        with self.captureOnCommitCallbacks(execute=True):
+            BorrowRequest.objects.create(item=self.item, user=other)
+        self.client.login(username="patron", password="pass")
+        self.assertEqual(self.get_items()[0]["status_display"], "Available")
+        self.client.login(username="other", password="pass")
+        self.assertEqual(self.get_items()[0]["status_display"], "Already requested")
+
+    def test_user_writes_invalidate_but_logins_do_not(self):
+        url = reverse("api_search_users") + "?q=pat"
+        self.assertEqual(self.client.get(url).json()[0]["name"], "patron")
+        version = cache.get_version(cache.USER_SEARCH)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.login(username="patron", password="pass")
+        self.assertEqual(cache.get_version(cache.USER_SEARCH), version)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.patron.first_name = "Pat"
+            self.patron.save()
+        self.assertEqual(self.client.get(url).json()[0]["name"], "Pat")
+
+
+@override_settings(**{**TEST_SETTINGS, "CACHES": LOCMEM_CACHES})
+class CardFragmentCacheTests(TestCase):
+    def setUp(self):
+        django_cache.clear()
+        self.librarian = CustomUser.objects.create_user(
+            username="lib", email="librarian@test.com", password="pass", role="librarian"
+        )
+        self.patron = CustomUser.objects.create_user(username="patron", email="patron@test.com", password="pass")
+        self.items = [Item.objects.create(name=f"Tool {i}", identifier=f"tool{i}") for i in range(5)]
+
+    def render_tools(self):
+        return self.client.get(reverse("tools_page")).content.decode()
+
+    def test_cards_rendered_once_then_fetched_together(self):
+        self.client.login(username="patron", password="pass")
+        first = self.client.get(reverse("home")).content.decode()
+        self.assertIn("Tool 4", first)
+        with patch.object(django_cache, "get_many", wraps=django_cache.get_many) as get_many, \
+                patch("toolhub.templatetags.card_tags.get_template") as get_template:
+            self.assertEqual(self.client.get(reverse("home")).content.decode(), first)
+        get_many.assert_called_once()
+        get_template.return_value.render.assert_not_called()
+
+    def test_cards_vary_by_role_not_user(self):
+        self.client.login(username="patron", password="pass")
+        self.assertNotIn(reverse("edit_item", args=[self.items[0].pk]), self.render_tools())
+        self.client.login(username="lib", password="pass")
+        self.assertIn(reverse("edit_item", args=[self.items[0].pk]), self.render_tools())
+
+    def test_per_user_parts_are_not_cached(self):
+        self.client.login(username="patron", password="pass")
+        self.render_tools()
+        Item.objects.filter(pk=self.items[0].pk).update(status="currently_borrowed", borrower=self.patron)
+        html = self.render_tools()
+        self.assertIn(reverse("return_item", args=[self.items[0].pk]), html)
+        self.client.login(username="lib", password="pass")
+        self.assertNotIn(reverse("return_item", args=[self.items[0].pk]), self.render_tools())
+
+    def test_saves_and_queryset_updates_change_the_version(self):
+        self.client.login(username="patron", password="pass")
+        self.render_tools()
+        item = self.items[0]
+        item.name = "Renamed saw"
+        item.save()
+        self.assertIn("Renamed saw", self.render_tools())
+        Item.objects.filter(pk=item.pk).update(image_processing=True)
+        self.assertIn("Processing image", self.render_tools())
+
+    def test_version_covers_included_templates_and_release(self):
+        self.assertEqual(set(card_tags.fragment_templates()), {
+            "toolhub/includes/_item_card_fragment.html",
+            "toolhub/includes/_collection_card_fragment.html",
+            "toolhub/includes/_picture.html",
+            "toolhub/includes/_image_processing.html",
+        })
+        version = card_tags.card_version("item", self.items[0])
+        with override_settings(TOOLHUB_RELEASE="v999"):
+            self.assertNotEqual(card_tags.card_version("item", self.items[0]), version)
+        with patch.object(card_tags, "fragment_templates", return_value={"_picture.html": "edited"}):
+            card_tags.fragment_version.cache_clear()
+            self.assertNotEqual(card_tags.card_version("item", self.items[0]), version)
+        card_tags.fragment_version.cache_clear()
+        self.assertEqual(card_tags.card_version("item", self.items[0]), version)
+
+    def test_collection_cards_follow_item_count(self):
+        collection = Collection.objects.create(title="Kit", creator=self.librarian)
+        self.client.login(username="patron", password="pass")
+        self.assertIn("# Items: 0", self.client.get(reverse("collections_page")).content.decode())
+        collection.items.add(*self.items[:2])
+        self.assertIn("# Items: 2", self.client.get(reverse("collections_page")).content.decode())
+
+
+class TemplateWarmingTests(TestCase):
+    def test_cached_loader_configured_regardless_of_debug(self):
+        engine = engines["django"].engine
+        self.assertEqual([type(loader).__module__ for loader in engine.template_loaders],
+                         ["django.template.loaders.cached"])
+        self.assertFalse(engine.debug)
+
+    def test_every_template_compiles(self):
+        names = templating.template_names()
+        self.assertIn("toolhub/home/home.html", names)
+        self.assertEqual(templating.warm(), len(names))
+
+
+class DatabaseConfigTests(TestCase):
+    CI = {"GITHUB_ACTIONS": "true"}
+
+    def test_local_development_uses_sqlite(self):
+        config = database.config(settings.BASE_DIR, {})
+        self.assertEqual(config["ENGINE"], "django.db.backends.sqlite3")
+        self.assertNotIn("CONN_MAX_AGE", config)
+
+    def test_postgres_connections_persist_without_psycopg_pool(self):
+        with patch("importlib.util.find_spec", return_value=None):
+            for environ in (self.CI, {"DATABASE_URL": "postgres://u:p@db.example.com:5432/toolhub"}):
+                config = database.config(settings.BASE_DIR, environ)
+                self.assertEqual(config["ENGINE"], "django.db.backends.postgresql")
+                self.assertEqual(config["CONN_MAX_AGE"], 600)
+                self.assertTrue(config["CONN_HEALTH_CHECKS"])
+
+    def test_native_pool_sized_for_worker_threads(self):
+        environ = {**self.CI, "GUNICORN_THREADS": "8", "DB_POOL_EXTRA": "2"}
+        with patch("importlib.util.find_spec", return_value=object()):
+            config = database.config(settings.BASE_DIR, environ)
+            self.assertEqual(config["CONN_MAX_AGE"], 0)
+            self.assertEqual(config["OPTIONS"]["pool"], {"min_size": 2, "max_size": 10, "timeout": 10})
+            forced_off = database.config(settings.BASE_DIR, {**environ, "DB_POOL": "False"})
+        self.assertNotIn("OPTIONS", forced_off)
+
+    @override_settings(**TEST_SETTINGS)
+    def test_stats_endpoint_is_staff_only(self):
+        user = CustomUser.objects.create_user(username="ops", email="ops@test.com", password="pass")
+        self.client.login(username="ops", password="pass")
+        self.assertEqual(self.client.get(reverse("api_db_pool_stats")).status_code, 403)
+        CustomUser.objects.filter(pk=user.pk).update(is_staff=True)
+        stats = self.client.get(reverse("api_db_pool_stats")).json()
+        self.assertEqual(stats["mode"], "per_request")
+        self.assertTrue(stats["connected"])
+
+
+class GunicornConfigTests(TestCase):
+    def load(self, **environ):
+        path = os.path.join(settings.BASE_DIR, "gunicorn.conf.py")
+        with patch.dict(os.environ, environ):
+            config = runpy.run_path(path)
+            return config, os.environ["GUNICORN_THREADS"]
+
+    def test_threaded_workers_share_thread_count_with_pool(self):
+        config, exported = self.load(WEB_CONCURRENCY="3", GUNICORN_THREADS="8")
+        self.assertEqual((config["workers"], config["worker_class"], config["threads"]), (3, "gthread", 8))
+        self.assertEqual(exported, "8")
+        self.assertTrue(config["preload_app"])
+        self.assertEqual(config["wsgi_app"], "mysite.wsgi:application")
+
+
+@override_settings(**TEST_SETTINGS)
+class AsyncViewTests(TestCase):
+    """
+    The search APIs, tools page and item detail run as async views; served
+    through the ASGI handler, any lazy query left in them or their templates
+    raises SynchronousOnlyOperation.
+    """
+    def setUp(self):
+        self.patron = CustomUser.objects.create_user(
+            username="patron", email="patron@test.com", password="pass", role="patron"
+        )
+        self.drill = Item.objects.create(
+            name="Drill", identifier="drill", status="currently_borrowed", borrower=self.patron
+        )
+        self.saw = Item.objects.create(name="Saw", identifier="saw")
+        BorrowRequest.objects.create(item=self.saw, user=self.patron, status="pending")
+        ItemReview.objects.create(item=self.drill, user=self.patron, rating=4, comment="Solid")
+
+    async def test_tools_page(self):
+        await self.async_client.alogin(username="patron", password="pass")
+        response = await self.async_client.get(reverse("tools_page"))
+        self.assertEqual(response.status_code, 200)
+        statuses = {item.name: item.user_status for item in response.context["items"]}
+        self.assertEqual(statuses, {"Drill": "Currently Borrowed", "Saw": "Already requested"})
+
+    async def test_view_item_shows_reviews_and_return_button(self):
+        await self.async_client.alogin(username="patron", password="pass")
+        response = await self.async_client.get(reverse("view_item", args=[self.drill.id]))
+        self.assertContains(response, "Solid")
+        self.assertContains(response, reverse("return_item", args=[self.drill.id]))
+
+    async def test_view_item_saves_review(self):
+        await self.async_client.alogin(username="patron", password="pass")
+        response = await self.async_client.post(
+            reverse("view_item", args=[self.saw.id]), {"rating": 5, "comment": "Sharp"}
+        )
+        self.assertRedirects(response, reverse("view_item", args=[self.saw.id]), fetch_redirect_response=False)
+        self.assertTrue(await ItemReview.objects.filter(item=self.saw, rating=5).aexists())
+
+    async def test_view_item_requires_login(self):
+        response = await self.async_client.get(reverse("view_item", args=[self.drill.id]))
+        self.assertEqual(response.status_code, 302)
+
+    async def test_search_apis(self):
+        await self.async_client.alogin(username="patron", password="pass")
+        items = (await self.async_client.get(reverse("api_search_items") + "?q=saw")).json()
+        self.assertEqual([(i["name"], i["status_display"]) for i in items], [("Saw", "Already requested")])
+        users = (await self.async_client.get(reverse("api_search_users") + "?q=pat")).json()
+        self.assertEqual([u["email"] for u in users], ["patron@test.com"])
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    async def test_tools_page_fetches_cards_without_blocking(self):
+        await self.async_client.alogin(username="patron", password="pass")
+        with patch("toolhub.cache.cached_fragments", side_effect=AssertionError("blocking cache call")):
+            first = await self.async_client.get(reverse("tools_page"))
+            with patch("toolhub.templatetags.card_tags.get_template") as get_template:
+                second = await self.async_client.get(reverse("tools_page"))
+        self.assertContains(first, "Drill")
+        self.assertContains(second, "Drill")
+        get_template.return_value.render.assert_not_called()
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    async def test_search_is_cached(self):
+        django_cache.clear()
+        url = reverse("api_search_users") + "?q=pat"
+        first = (await self.async_client.get(url)).json()
+        await CustomUser.objects.filter(pk=self.patron.pk).aupdate(email="changed@test.com")
+        self.assertEqual((await self.async_client.get(url)).json(), first)
+
+    async def test_superusers_redirected_to_admin(self):
+        admin = await CustomUser.objects.acreate(username="admin", email="admin@test.com", is_staff=True, is_superuser=True)
+        await self.async_client.aforce_login(admin)
+        response = await self.async_client.get(reverse("tools_page"))
+        self.assertRedirects(response, reverse("admin:index"), fetch_redirect_response=False)
+
+    def test_user_loaded_once(self):
+        self.client.login(username="patron", password="pass")
+        with self.assertNumQueries(3):  # session, user, items
+            self.client.get(reverse("api_search_items") + "?q=saw")
+
+
+@override_settings(**TEST_SETTINGS)
+class CollectionItemCountTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.librarian = CustomUser.objects.create_user(
+            username="librarian", email="librarian@test.com", password="pass", role="librarian"
+        )
+        self.collection = Collection.objects.create(
+            title="Shop", description="Shop tools", creator=self.librarian
+        )
+        self.items = [Item.objects.create(name=f"Tool {i}", identifier=f"tool{i}") for i in range(3)]
+
+    def stored_count(self, collection=None):
+        return Collection.objects.get(pk=(collection or self.collection).pk).item_count
+
+    def test_forward_changes(self):
+        self.collection.items.add(*self.items)
+        self.assertEqual(self.collection.item_count, 3)
+        self.assertEqual(self.stored_count(), 3)
+        self.collection.items.remove(self.items[0])
+        self.assertEqual(self.stored_count(), 2)
+        self.collection.items.set(self.items[:1])
+        self.assertEqual(self.stored_count(), 1)
+        self.collection.items.clear()
+        self.assertEqual(self.stored_count(), 0)
+
+    def test_reverse_changes_and_item_delete(self):
+        other = Collection.objects.create(title="Kit", description="Kit", creator=self.librarian)
+        self.items[0].collections.add(self.collection, other)
+        self.items[1].collections.add(self.collection)
+        self.assertEqual((self.stored_count(), self.stored_count(other)), (2, 1))
+        self.items[0].collections.clear()
+        self.assertEqual((self.stored_count(), self.stored_count(other)), (1, 0))
+        self.items[1].delete()
+        self.assertEqual(self.stored_count(), 0)
+
+    def test_edit_collection_view_keeps_count(self):
+        self.client.login(username="librarian", password="pass")
+        self.client.post(
+            reverse("edit_collection", args=[self.collection.uuid]),
+            {"title": "Shop", "description": "Shop tools", "visibility": "public",
+             "items": [item.pk for item in self.items[:2]]},
+        )
+        self.assertEqual(self.stored_count(), 2)
+
+    def test_rebuild_command(self):
+        self.collection.items.add(*self.items)
+        Collection.objects.update(item_count=0)
+        call_command("rebuild_collection_counts", stdout=StringIO())
+        self.assertEqual(self.stored_count(), 3)
+
+
+@override_settings(**TEST_SETTINGS)
+class VisibilityTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.librarian = CustomUser.objects.create_user(
+            username="librarian", email="librarian@test.com", password="pass", role="librarian"
+        )
+        self.patron = CustomUser.objects.create_user(
+            username="patron", email="patron@test.com", password="pass", role="patron"
+        )
+        self.public = Collection.objects.create(title="Public", description="-", creator=self.librarian)
+        self.private = Collection.objects.create(
+            title="Private", description="-", visibility="private", creator=self.librarian
+        )
+        self.loose = Item.objects.create(name="Loose", identifier="loose")
+        self.hidden = Item.objects.create(name="Hidden", identifier="hidden")
+        self.both = Item.objects.create(name="Both", identifier="both")
+        self.private.items.add(self.hidden, self.both)
+        self.public.items.add(self.both)
+
+    def anonymous_item_names(self):
+        response = self.client.get(reverse("home"))
+        return sorted(item.name for item in response.context["items"])
+
+    def test_anonymous_home_hides_private_only_items(self):
+        self.assertEqual(self.anonymous_item_names(), ["Both", "Loose"])
+
+    def test_flag_follows_membership_visibility_and_deletes(self):
+        self.public.items.remove(self.both)
+        self.assertEqual(self.anonymous_item_names(), ["Loose"])
+        self.hidden.collections.add(self.public)
+        self.assertEqual(self.anonymous_item_names(), ["Hidden", "Loose"])
+        self.private.visibility = "public"
+        self.private.save()
+        self.assertEqual(self.anonymous_item_names(), ["Both", "Hidden", "Loose"])
+        self.private.visibility = "private"
+        self.private.save()
+        self.public.items.clear()
+        self.assertEqual(self.anonymous_item_names(), ["Loose"])
+        self.private.delete()
+        self.assertEqual(self.anonymous_item_names(), ["Both", "Hidden", "Loose"])
+
+    def test_item_save_keeps_concurrent_visibility_change(self):
+        """
+        Saving an item loaded while it was still public must not publish it again
+        after its last public collection dropped it.
+        """
+        stale = Item.objects.get(pk=self.both.pk)
+        self.public.items.remove(self.both)
+        stale.name = "Both (edited)"
+        stale.save()
+        self.both.refresh_from_db()
+        self.assertEqual(self.both.name, "Both (edited)")
+        self.assertFalse(self.both.is_publicly_visible)
+        self.assertEqual(self.anonymous_item_names(), ["Loose"])
+
+    def test_home_collections_are_per_user(self):
+        own = Collection.objects.create(
+            title="Own", description="-", visibility="private", creator=self.patron
+        )
+        shared = Collection.objects.create(
+            title="Shared", description="-", visibility="private", creator=self.librarian
+        )
+        shared.allowed_users.add(self.patron)
+        self.client.login(username="patron", password="pass")
+        response = self.client.get(reverse("home"))
+        self.assertEqual(
+            sorted(c.title for c in response.context["collections"]), ["Own", "Public", "Shared"]
+        )
+        self.assertNotIn(self.private, list(response.context["collections"]))
+        self.assertIn(own, list(response.context["collections"]))
+
+        self.client.login(username="librarian", password="pass")
+        response = self.client.get(reverse("home"))
+        self.assertEqual(len(response.context["collections"]), 4)
+
+
+@override_settings(**TEST_SETTINGS)
+class BulkBorrowActionTests(TestCase):
+    def setUp(self):
+        self.librarian = CustomUser.objects.create_user(
+            username="lib", email="librarian@test.com", password="pass", role="librarian"
+        )
+        self.patrons = [
+            CustomUser.objects.create_user(username=f"patron{i}", email=f"patron{i}@test.com", password="pass")
+            for i in range(3)
+        ]
+        self.saw = Item.objects.create(name="Saw", identifier="saw001")
+        self.drill = Item.objects.create(name="Drill", identifier="drill001")
+        self.client.login(username="lib", password="pass")
+
+    def post(self, action, ids):
+        return self.client.post(
+            reverse("bulk_borrow_action"),
+            {"action": action, "request_ids": ids},
+            HTTP_ACCEPT="application/json",
+        )
+
+    def test_bulk_approve_reports_each_request(self):
+        first = BorrowRequest.objects.create(item=self.saw, user=self.patrons[0])
+        second = BorrowRequest.objects.create(item=self.saw, user=self.patrons[1])
+        drill = BorrowRequest.objects.create(item=self.drill, user=self.patrons[2])
+        returned = BorrowRequest.objects.create(item=self.drill, user=self.patrons[0], status="returned_on_time")
+
+        response = self.post("approve", [first.pk, second.pk, drill.pk, returned.pk, 9999])
+
+        self.assertEqual(response.json()["results"], {
+            str(first.pk): "approved",
+            str(second.pk): "denied",
+            str(drill.pk): "approved",
+            str(returned.pk): "not_pending",
+            "9999": "not_found",
+        })
+        second.refresh_from_db()
+        self.assertEqual(second.status, "denied")
+        self.saw.refresh_from_db()
+        self.assertEqual((self.saw.status, self.saw.borrower), ("currently_borrowed", self.patrons[0]))
+
+    def test_bulk_approve_denies_pending_requests_outside_batch(self):
+        chosen = BorrowRequest.objects.create(item=self.saw, user=self.patrons[0])
+        other = BorrowRequest.objects.create(item=self.saw, user=self.patrons[1])
+        self.post("approve", [chosen.pk])
+        other.refresh_from_db()
+        self.assertEqual(other.status, "denied")
+
+    def test_bulk_approve_unavailable_item(self):
+        Item.objects.filter(pk=self.saw.pk).update(status="currently_borrowed", borrower=self.patrons[1])
+        waiting = BorrowRequest.objects.create(item=self.saw, user=self.patrons[0])
+        response = self.post("approve", [waiting.pk])
+        self.assertEqual(response.json()["results"], {str(waiting.pk): "unavailable"})
+        waiting.refresh_from_db()
+        self.assertEqual(waiting.status, "pending")
+
+    def test_bulk_approve_keeps_concurrent_item_change(self):
+        saw = BorrowRequest.objects.create(item=self.saw, user=self.patrons[0])
+        drill = BorrowRequest.objects.create(item=self.drill, user=self.patrons[1])
+        approve = borrowing._approve
+
+        def repair_then_approve(borrow_request, due_date):
+            # The saw is sent for repair after the batch was read, before it is written.
+            if borrow_request.pk == saw.pk:
+                Item.objects.filter(pk=self.saw.pk).update(status="being_repaired")
+            return approve(borrow_request, due_date)
+
+        with patch.object(borrowing, "_approve", repair_then_approve):
+            results = borrowing.bulk_process([saw.pk, drill.pk], "approve")
+
+        self.assertEqual(results, {saw.pk: "unavailable", drill.pk: "approved"})
+        self.saw.refresh_from_db()
+        self.assertEqual((self.saw.status, self.saw.borrower), ("being_repaired", None))
+        saw.refresh_from_db()
+        self.assertEqual(saw.status, "pending")
+        self.drill.refresh_from_db()
+        self.assertEqual((self.drill.status, self.drill.borrower), ("currently_borrowed", self.patrons[1]))
+
+    def test_bulk_approve_skips_request_that_moved_on(self):
+        pending = BorrowRequest.objects.create(item=self.saw, user=self.patrons[0])
+        approve = borrowing._approve
+
+        def deny_then_approve(borrow_request, due_date):
+            BorrowRequest.objects.filter(pk=borrow_request.pk).update(status="denied")
+            return approve(borrow_request, due_date)
+
+        with patch.object(borrowing, "_approve", deny_then_approve):
+            results = borrowing.bulk_process([pending.pk], "approve")
+
+        self.assertEqual(results, {pending.pk: "not_pending"})
+        self.saw.refresh_from_db()
+        self.assertEqual((self.saw.status, self.saw.borrower), ("available", None))
+
+    def test_bulk_deny_query_count(self):
+        ids = [
+            BorrowRequest.objects.create(item=self.drill, user=self.patrons[i % 3]).pk
+            for i in range(30)
+        ]
+        self.client.get(reverse("my_borrow_requests"))  # warm up the session
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.post("deny", ids)
+        self.assertEqual(set(response.json()["results"].values()), {"denied"})
+        self.assertEqual(BorrowRequest.objects.filter(status="denied").count(), 30)
+        # Lock the items, one SELECT to validate every id, one UPDATE to apply them.
+        borrow_queries = [q["sql"] for q in ctx.captured_queries if "toolhub_borrowrequest" in q["sql"]]
+        self.assertEqual(len(borrow_queries), 3)
+
+    def test_bulk_deny_keeps_concurrent_approval(self):
+        approved = BorrowRequest.objects.create(item=self.saw, user=self.patrons[0])
+        pending = BorrowRequest.objects.create(item=self.drill, user=self.patrons[1])
+        deny = borrowing._deny
+
+        def approve_then_deny(requests, results):
+            # Another librarian approves after the batch was read, before it is written.
+            approve_request(approved.pk, borrowing.default_due_date())
+            return deny(requests, results)
+
+        with patch.object(borrowing, "_deny", approve_then_deny):
+            results = borrowing.bulk_process([approved.pk, pending.pk], "deny")
+
+        self.assertEqual(results, {approved.pk: "not_pending", pending.pk: "denied"})
+        approved.refresh_from_db()
+        self.assertEqual(approved.status, "approved")
+        self.saw.refresh_from_db()
+        self.assertEqual((self.saw.status, self.saw.borrower), ("currently_borrowed", self.patrons[0]))
+        self.assertEqual(CirculationStat.objects.filter(status="denied").aggregate(total=Sum("count"))["total"], 1)
+
+    def test_html_form_redirects_with_summary(self):
+        pending = BorrowRequest.objects.create(item=self.saw, user=self.patrons[0])
+        response = self.client.post(
+            reverse("bulk_borrow_action"), {"action": "deny", "request_ids": [pending.pk]}, follow=True
+        )
+        self.assertRedirects(response, reverse("my_borrow_requests"))
+        self.assertEqual(
+            [str(message) for message in response.context["messages"]], ["Processed 1 request: 1 denied."]
+        )
+
+    def test_invalid_action(self):
+        response = self.post("delete", [1])
+        self.assertEqual(response.status_code, 400)
+
+    def test_patron_forbidden(self):
+        pending = BorrowRequest.objects.create(item=self.saw, user=self.patrons[0])
+        self.client.login(username="patron0", password="pass")
+        response = self.post("approve", [pending.pk])
+        self.assertEqual(response.status_code, 403)
+        pending.refresh_from_db()
+        self.assertEqual(pending.status, "pending")
+
+
+@override_settings(**TEST_SETTINGS)
+class MarkOverdueTests(TestCase):
+    def setUp(self):
+        self.patron = CustomUser.objects.create_user(username="patron", email="patron@test.com", password="pass")
+        self.today = date(2030, 1, 10)
+
+    def loan(self, due, status="approved", name="Saw"):
+        item = Item.objects.create(name=name, identifier=name.lower(), status="currently_borrowed", borrower=self.patron)
+        return BorrowRequest.objects.create(item=item, user=self.patron, status=status, return_due_date=due)
+
+    def test_marks_only_past_due_loans(self):
+        late = self.loan(date(2030, 1, 9))
+        due_today = self.loan(date(2030, 1, 10), name="Drill")
+        returned = self.loan(date(2030, 1, 1), status="returned_on_time", name="Hammer")
+
+        self.assertEqual(borrowing.mark_overdue(today=self.today), 1)
+
+        statuses = dict(BorrowRequest.objects.values_list("pk", "status"))
+        self.assertEqual(statuses, {late.pk: "overdue", due_today.pk: "approved", returned.pk: "returned_on_time"})
+        notification = Notification.objects.get()
+        self.assertEqual((notification.user, notification.borrow_request), (self.patron, late))
+        self.assertIsNone(notification.sent_at)
+
+    def test_batches_and_reruns_are_idempotent(self):
+        for i in range(5):
+            self.loan(date(2030, 1, 1), name=f"Tool {i}")
+        self.assertEqual(borrowing.mark_overdue(today=self.today, batch_size=2), 5)
+        self.assertEqual(borrowing.mark_overdue(today=self.today, batch_size=2), 0)
+        self.assertEqual(Notification.objects.count(), 5)
+
+    def test_command_sends_notifications_once(self):
+        self.loan(date(2000, 1, 1))
+        out = StringIO()
+        call_command("mark_overdue", stdout=out)
+        self.assertIn("Marked 1 request(s) overdue; sent 1 notification(s).", out.getvalue())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["patron@test.com"])
+
+        call_command("mark_overdue", stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_failed_send_keeps_messages_already_sent(self):
+        for i in range(3):
+            self.loan(date(2030, 1, 1), name=f"Tool {i}")
+        borrowing.mark_overdue(today=self.today)
+        send = locmem.EmailBackend.send_messages
+        calls = []
+
+        def flaky(backend, messages):
+            calls.append(messages)
+            if len(calls) == 2:
+                raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+            return send(backend, messages)
+
+        with patch.object(locmem.EmailBackend, "send_messages", flaky), \
+                self.assertRaises(smtplib.SMTPServerDisconnected):
+            notifications.deliver_pending()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(Notification.objects.filter(sent_at__isnull=False).count(), 1)
+        self.assertFalse(Notification.objects.filter(sent_at__isnull=True, claimed_at__isnull=False).exists())
+
+        self.assertEqual(notifications.deliver_pending(), 2)
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_refused_message_does_not_block_the_outbox(self):
+        for i in range(3):
+            self.loan(date(2030, 1, 1), name=f"Tool {i}")
+        borrowing.mark_overdue(today=self.today)
+        bad = Notification.objects.order_by("pk").first()
+        send = locmem.EmailBackend.send_messages
+
+        def refuse_first(backend, messages):
+            if messages[0].subject == bad.subject:
+                raise smtplib.SMTPRecipientsRefused({"patron@test.com": (550, b"No such user")})
+            return send(backend, messages)
+
+        with patch.object(locmem.EmailBackend, "send_messages", refuse_first), \
+                self.assertLogs("toolhub.notifications", level="WARNING"):
+            self.assertEqual(notifications.deliver_pending(), 2)
+            bad.refresh_from_db()
+            self.assertEqual((bad.attempts, bad.sent_at, bad.failed_at), (1, None, None))
+            self.assertIn("SMTPRecipientsRefused", bad.last_error)
+            # Backed off until its claim expires, then retried until given up on.
+            self.assertEqual(notifications.deliver_pending(), 0)
+            self.assertEqual(Notification.objects.get(pk=bad.pk).attempts, 1)
+            for _ in range(notifications.MAX_ATTEMPTS - 1):
+                Notification.objects.filter(pk=bad.pk).update(
+                    claimed_at=timezone.now() - notifications.CLAIM_TIMEOUT - timedelta(minutes=1)
+                )
+                notifications.deliver_pending()
+        bad.refresh_from_db()
+        self.assertEqual(bad.attempts, notifications.MAX_ATTEMPTS)
+        self.assertIsNotNone(bad.failed_at)
+        Notification.objects.filter(pk=bad.pk).update(claimed_at=None)
+        self.assertEqual(notifications.deliver_pending(), 0)
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_user_without_email_is_not_marked_sent(self):
+        self.loan(date(2030, 1, 1))
+        borrowing.mark_overdue(today=self.today)
+        CustomUser.objects.filter(pk=self.patron.pk).update(email="")
+        with self.assertLogs("toolhub.notifications", level="WARNING"):
+            self.assertEqual(notifications.deliver_pending(), 0)
+        notification = Notification.objects.get()
+        self.assertEqual((notification.attempts, notification.sent_at), (1, None))
+
+    def test_claims_of_dead_workers_expire(self):
+        self.loan(date(2030, 1, 1))
+        borrowing.mark_overdue(today=self.today)
+        Notification.objects.update(claimed_at=timezone.now())
+        self.assertEqual(notifications.deliver_pending(), 0)
+        Notification.objects.update(claimed_at=timezone.now() - notifications.CLAIM_TIMEOUT - timedelta(minutes=1))
+        self.assertEqual(notifications.deliver_pending(), 1)
+
+    def test_worker_loop_survives_errors(self):
+        class Stop(Exception):
+            pass
+
+        with patch("toolhub.management.commands.mark_overdue.deliver_pending",
+                   side_effect=smtplib.SMTPException("down")), \
+                patch("toolhub.management.commands.mark_overdue.time.sleep", side_effect=Stop), \
+                self.assertLogs("toolhub.management.commands.mark_overdue", level="ERROR"), \
+                self.assertRaises(Stop):
+            call_command("mark_overdue", interval=60, stdout=StringIO())
+
+        with patch("toolhub.management.commands.mark_overdue.deliver_pending",
+                   side_effect=smtplib.SMTPException("down")), \
+                self.assertRaises(smtplib.SMTPException):
+            call_command("mark_overdue", stdout=StringIO())
+
+    def test_returning_overdue_item(self):
+        loan = self.loan(date(2030, 1, 1))
+        borrowing.mark_overdue(today=self.today)
+        self.client.login(username="patron", password="pass")
+        self.client.get(reverse("return_item", args=[loan.item.pk]))
+        loan.refresh_from_db()
+        self.assertEqual(loan.status, "returned_overdue")
+
+    def test_overdue_loan_still_blocks_new_request(self):
+        loan = self.loan(date(2030, 1, 1))
+        borrowing.mark_overdue(today=self.today)
+        item = Item.objects.with_user_status(self.patron).get(pk=loan.item.pk)
+        self.assertTrue(item.already_requested)
+
+
+@override_settings(**TEST_SETTINGS)
+class CirculationStatsTests(TestCase):
+    def setUp(self):
+        self.librarian = CustomUser.objects.create_user(
+            username="lib", email="librarian@test.com", password="pass", role="librarian"
+        )
+        self.patrons = [
+            CustomUser.objects.create_user(username=f"patron{i}", email=f"patron{i}@test.com", password="pass")
+            for i in range(2)
+        ]
+        self.item = Item.objects.create(name="Saw", identifier="saw001", location="aux_warehouse")
+
+    def counts(self):
+        return dict(CirculationStat.objects.values_list("status").annotate(total=Sum("count")))
+
+    def test_transitions_are_counted(self):
+        first = BorrowRequest.objects.create(item=self.item, user=self.patrons[0])
+        BorrowRequest.objects.create(item=self.item, user=self.patrons[1])
+        approve_request(first.pk, date(2000, 1, 1))
+        borrowing.mark_overdue()
+        self.client.login(username="patron0", password="pass")
+        self.client.get(reverse("return_item", args=[self.item.pk]))
+
+        self.assertEqual(
+            self.counts(),
+            {"pending": 2, "approved": 1, "denied": 1, "overdue": 1, "returned_overdue": 1},
+        )
+        self.assertEqual(set(CirculationStat.objects.values_list("location", flat=True)), {"aux_warehouse"})
+
+    def test_saving_without_status_change_is_not_counted(self):
+        borrow_request = BorrowRequest.objects.create(item=self.item, user=self.patrons[0])
+        borrow_request.note = "Weekend project"
+        borrow_request.save()
+        self.assertEqual(self.counts(), {"pending": 1})
+
+    def test_bulk_actions_are_counted(self):
+        drill = Item.objects.create(name="Drill", identifier="drill001")
+        ids = [
+            BorrowRequest.objects.create(item=item, user=patron).pk
+            for item in (self.item, drill)
+            for patron in self.patrons
+        ]
+        borrowing.bulk_process(ids[:1], "approve")
+        borrowing.bulk_process(ids[2:], "deny")
+        self.assertEqual(self.counts(), {"pending": 4, "approved": 1, "denied": 3})
+
+    def test_dashboard_reads_rollups_only(self):
+        self.client.login(username="lib", password="pass")
+        url = reverse("circulation_dashboard")
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(url)
+        for i in range(20):
+            BorrowRequest.objects.create(item=self.item, user=self.patrons[i % 2])
+        with CaptureQueriesContext(connection) as after:
+            response = self.client.get(url)
+        self.assertEqual(len(before), len(after))
+        self.assertContains(response, "Aux Warehouse")
+        self.assertFalse(any("toolhub_borrowrequest" in query["sql"] for query in after.captured_queries))
+
+    def test_dashboard_librarian_only(self):
+        self.client.login(username="patron0", password="pass")
+        response = self.client.get(reverse("circulation_dashboard"))
+        self.assertEqual(response.status_code, 403)
+
+    def test_rebuild_command(self):
+        BorrowRequest.objects.create(item=self.item, user=self.patrons[0], status="denied")
+        BorrowRequest.objects.create(item=self.item, user=self.patrons[1])
+        CirculationStat.objects.all().delete()
+        call_command("rebuild_circulation_stats", stdout=StringIO())
+        self.assertEqual(self.counts(), {"pending": 2, "denied": 1})
+
+
+def make_image(width, height, format="JPEG"):
+    buffer = BytesIO()
+    Image.new("RGB", (width, height), (200, 120, 40)).save(buffer, format)
+    return buffer.getvalue()
+
+
+def make_decompression_bomb(width=100_000, height=100_000):
+    """A PNG of a few dozen bytes whose header claims ``width`` x ``height`` pixels."""
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">IIBBBBB", width, height, 1, 0, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(b"")) + chunk(b"IEND", b"")
+
+
+@override_settings(**TEST_SETTINGS)
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.storage = FileSystemStorage(location=self.media)
+        self.fields = [
+            Item._meta.get_field("image"),
+            Collection._meta.get_field("image"),
+            CustomUser._meta.get_field("profile_picture"),
+        ]
+        self.original_storages = [field.storage for field in self.fields]
+        for field in self.fields:
+            field.storage = self.storage
+
+    def tearDown(self):
+        for field, storage in zip(self.fields, self.original_storages):
+            field.storage = storage
+        shutil.rmtree(self.media)
+
+    def item_with_image(self, content, name="photo.jpg"):
+        item = Item.objects.create(name="Saw", identifier="saw001")
+        item.image = SimpleUploadedFile(name, content, content_type="image/jpeg")
+        item.save()
+        return item
+
+    def test_item_variants_generated(self):
+        item = self.item_with_image(make_image(2000, 1500))
+        variants = item.image_derivatives["variants"]
+        self.assertEqual(item.image_derivatives["source"], item.image.name)
+        self.assertEqual(sorted(variants), ["card", "detail"])
+        self.assertEqual(sorted(variants["card"]["webp"], key=int), ["400", "800"])
+
+        with Image.open(self.storage.open(variants["card"]["jpeg"]["400"])) as card:
+            self.assertEqual(card.size, (400, 300))
+        with Image.open(self.storage.open(variants["detail"]["webp"]["1600"])) as detail:
+            self.assertEqual(detail.format, "WEBP")
+
+        # Stored state survives a reload and renders as srcset strings.
+        srcset = Item.objects.get(pk=item.pk).image_srcsets["card"]
+        self.assertRegex(srcset.webp, r"\.card-400\.webp 400w, .*\.card-800\.webp 800w$")
+        self.assertTrue(srcset.src.endswith(".card-400.jpeg"))
+
+    def test_small_images_are_not_upscaled(self):
+        item = self.item_with_image(make_image(300, 200))
+        self.assertEqual(list(item.image_derivatives["variants"]["card"]["jpeg"]), ["300"])
+
+    def test_replacing_image_removes_old_variants(self):
+        item = self.item_with_image(make_image(900, 600))
+        item.image = SimpleUploadedFile("new.png", make_image(1000, 600, "PNG"), content_type="image/png")
+        item.save()
+        self.assertEqual(item.image_derivatives["source"], item.image.name)
+
+        current = {
+            os.path.basename(name)
+            for files in item.image_derivatives["variants"].values()
+            for names in files.values()
+            for name in names.values()
+        }
+        _, stored = self.storage.listdir("items")
+        self.assertEqual({name for name in stored if name.count(".") == 2}, current)
+        with Image.open(self.storage.open(item.image_derivatives["variants"]["detail"]["jpeg"]["800"])) as detail:
+            self.assertEqual(detail.size, (800, 480))
+
+    def test_unreadable_image_falls_back_to_original(self):
+        item = self.item_with_image(b"not an image")
+        self.assertEqual(item.image_derivatives, {"source": item.image.name, "variants": {}})
+        self.assertEqual(item.image_srcsets, {})
+        html = render_to_string("toolhub/includes/_item_card.html", {"item": item})
+        self.assertIn(item.image_url, html)
+        self.assertNotIn("<picture>", html)
+
+    def test_decompression_bomb_is_not_rendered(self):
+        bomb = make_decompression_bomb()
+        self.assertLess(len(bomb), 100)
+        item = self.item_with_image(bomb, name="bomb.png")
+        self.assertEqual(item.image_derivatives, {"source": item.image.name, "variants": {}})
+        self.assertFalse(item.image_processing)
+
+    def test_card_renders_picture_element(self):
+        item = self.item_with_image(make_image(1000, 800))
+        html = render_to_string("toolhub/includes/_item_card.html", {"item": item})
+        self.assertIn('<source type="image/webp"', html)
+        self.assertNotIn(item.image_url, html)
+
+    def test_profile_picture_avatar_is_square(self):
+        user = CustomUser.objects.create_user(username="patron", email="patron@test.com")
+        user.profile_picture = SimpleUploadedFile("me.jpg", make_image(600, 900))
+        user.save()
+        avatar = user.profile_picture_derivatives["variants"]["avatar"]["jpeg"]
+        with Image.open(self.storage.open(avatar["320"])) as image:
+            self.assertEqual(image.size, (320, 320))
+
+    def test_backfill_command(self):
+        item = self.item_with_image(make_image(900, 600))
+        Item.objects.filter(pk=item.pk).update(image_derivatives={})
+        out = StringIO()
+        call_command("generate_image_derivatives", stdout=out)
+        self.assertIn("for 1 object(s)", out.getvalue())
+        item.refresh_from_db()
+        self.assertEqual(item.image_derivatives["source"], item.image.name)
+
+
+@override_settings(**TEST_SETTINGS)
+class MediaUrlTests(TestCase):
+    def test_urls_built_from_base_url(self):
+        self.assertEqual(
+            media.url("items/a b.jpg"),
+            f"https://{settings.AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com/media/items/a%20b.jpg",
+        )
+        with override_settings(TOOLHUB_MEDIA_BASE_URL="https://cdn.example.com"):
+            self.assertEqual(media.url("items/a.jpg"), "https://cdn.example.com/media/items/a.jpg")
+            item = Item(name="Saw", identifier="saw001")
+            self.assertEqual(item.image_url, "https://cdn.example.com/toolhub/images/logo.png")
+        self.assertTrue(media.url("items/a.jpg").startswith(f"https://{settings.AWS_STORAGE_BUCKET_NAME}"))
+
+    def test_cards_never_ask_the_storage_for_urls(self):
+        item = Item.objects.create(name="Saw", identifier="saw001")
+        Item.objects.filter(pk=item.pk).update(image="items/saw.jpg")
+        item.refresh_from_db()
+        with patch.object(type(item.image.storage), "url", side_effect=AssertionError("storage.url called")):
+            html = render_to_string("toolhub/includes/_item_card.html", {"item": item})
+        self.assertIn(media.url("items/saw.jpg"), html)
+
+    def test_url_is_built_once_per_name(self):
+        media.url.cache_clear()
+        for _ in range(3):
+            media.url("items/once.jpg")
+        self.assertEqual(media.url.cache_info().misses, 1)
+
+
+@override_settings(**TEST_SETTINGS, TOOLHUB_UPLOADS_EAGER=True)
+class UploadProcessingTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.staging = tempfile.mkdtemp()
+        self.settings_override = override_settings(TOOLHUB_UPLOAD_STAGING_DIR=self.staging)
+        self.settings_override.enable()
+        self.storage = FileSystemStorage(location=self.media)
+        self.fields = [Item._meta.get_field("image"), CustomUser._meta.get_field("profile_picture")]
+        self.original_storages = [field.storage for field in self.fields]
+        for field in self.fields:
+            field.storage = self.storage
+
+        self.librarian = CustomUser.objects.create_user(
+            username="lib", email="librarian@test.com", password="pass", role="librarian"
+        )
+        self.client.login(username="lib", password="pass")
+
+    def tearDown(self):
+        for field, storage in zip(self.fields, self.original_storages):
+            field.storage = storage
+        self.settings_override.disable()
+        shutil.rmtree(self.media)
+        shutil.rmtree(self.staging)
+
+    def post_item(self, url, identifier="saw001"):
+        return self.client.post(url, {
+            "name": "Saw",
+            "identifier": identifier,
+            "status": "available",
+            "location": "main_warehouse",
+            "description": "Hand saw",
+            "image": SimpleUploadedFile("saw.jpg", make_image(1200, 900), content_type="image/jpeg"),
+        })
+
+    def test_upload_is_staged_then_processed_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.post_item(reverse("add_item"))
+
+        item = Item.objects.get(identifier="saw001")
+        self.assertTrue(item.image_processing)
+        self.assertFalse(item.image)
+        self.assertEqual(len(os.listdir(self.staging)), 1)
+        html = render_to_string("toolhub/includes/_item_card.html", {"item": item})
+        self.assertIn("Processing image", html)
+
+        for callback in callbacks:
+            callback()
+        item.refresh_from_db()
+        self.assertFalse(item.image_processing)
+        self.assertTrue(self.storage.exists(item.image.name))
+        self.assertEqual(item.image_derivatives["source"], item.image.name)
+        self.assertEqual(os.listdir(self.staging), [])
+
+    def test_replaced_image_deleted_by_worker(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post_item(reverse("add_item"))
+        item = Item.objects.get(identifier="saw001")
+        first = item.image.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post_item(reverse("edit_item", args=[item.pk]))
+        item.refresh_from_db()
+        self.assertNotEqual(item.image.name, first)
+        self.assertFalse(self.storage.exists(first))
+
+    @patch("django.core.files.storage.default_storage.delete")
+    @patch("django.core.files.storage.default_storage.exists")
+    def test_profile_upload_does_no_storage_io_in_request(self, mock_exists, mock_delete):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(
+                reverse("upload_profile_picture"),
+                {"profile_picture": SimpleUploadedFile("me.jpg", make_image(400, 400), content_type="image/jpeg")},
+            )
+        self.assertFalse(mock_exists.called or mock_delete.called)
+        self.librarian.refresh_from_db()
+        self.assertTrue(self.librarian.profile_picture_processing)
+
+        for callback in callbacks:
+            callback()
+        self.librarian.refresh_from_db()
+        self.assertFalse(self.librarian.profile_picture_processing)
+        self.assertIn("avatar", self.librarian.profile_picture_derivatives["variants"])
+
+    def test_failed_job_clears_placeholder(self):
+        with patch("toolhub.images._render", side_effect=RuntimeError("boom")), \
+                self.assertLogs("toolhub.uploads", level="ERROR"), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.post_item(reverse("add_item"))
+        item = Item.objects.get(identifier="saw001")
+        self.assertFalse(item.image_processing)
+        self.assertEqual(os.listdir(self.staging), [])
+
+    def lose_job(self):
+        # The process dies after commit, before its upload thread runs the job.
+        with self.captureOnCommitCallbacks():
+            self.post_item(reverse("add_item"))
+        self.assertEqual(UploadJob.objects.count(), 1)
+        UploadJob.objects.update(queued_at=timezone.now() - timedelta(hours=1))
+        return Item.objects.get(identifier="saw001")
+
+    def test_finished_job_is_forgotten(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post_item(reverse("add_item"))
+        self.assertFalse(UploadJob.objects.exists())
+
+    def test_recover_replays_lost_job(self):
+        item = self.lose_job()
+        with self.assertLogs("toolhub.uploads", level="WARNING"):
+            self.assertEqual(uploads.recover(), (1, 0))
+        item.refresh_from_db()
+        self.assertFalse(item.image_processing)
+        self.assertTrue(self.storage.exists(item.image.name))
+        self.assertFalse(UploadJob.objects.exists())
+        self.assertEqual(os.listdir(self.staging), [])
+
+    def test_recover_abandons_job_without_staged_file(self):
+        item = self.lose_job()
+        for name in os.listdir(self.staging):
+            os.remove(os.path.join(self.staging, name))
+        with self.assertLogs("toolhub.uploads", level="WARNING"):
+            self.assertEqual(uploads.recover(), (0, 1))
+        item.refresh_from_db()
+        self.assertFalse(item.image_processing)
+        self.assertFalse(UploadJob.objects.exists())
+
+    def test_recover_leaves_recent_and_foreign_jobs(self):
+        item = self.lose_job()
+        UploadJob.objects.update(host="web.9")
+        self.assertEqual(uploads.recover(), (0, 0))
+        UploadJob.objects.update(queued_at=timezone.now())
+        self.assertEqual(uploads.recover(), (0, 0))
+        item.refresh_from_db()
+        self.assertTrue(item.image_processing)
+
+    def test_recover_deletes_orphaned_staged_files(self):
+        for name in ("old.jpg", "new.jpg"):
+            with open(os.path.join(self.staging, name), "wb") as f:
+                f.write(b"x")
+        an_hour_ago = time.time() - 3600
+        os.utime(os.path.join(self.staging, "old.jpg"), (an_hour_ago, an_hour_ago))
+        out = StringIO()
+        call_command("recover_uploads", stdout=out)
+        self.assertEqual(os.listdir(self.staging), ["new.jpg"])
+        self.assertIn("Replayed 0 upload job(s); abandoned 0.", out.getvalue())
+
+
+@override_settings(**TEST_SETTINGS, TOOLHUB_UPLOADS_EAGER=True)
+class DirectUploadTests(TestCase):
+    """Presigned browser uploads against a moto stand-in for the S3 bucket."""
+
+    def setUp(self):
+        self.aws = mock_aws()
+        self.aws.start()
+        boto3.client("s3", region_name=settings.AWS_S3_REGION_NAME).create_bucket(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+            CreateBucketConfiguration={"LocationConstraint": settings.AWS_S3_REGION_NAME},
+        )
+        self.storage = MediaStorage()
+        self.fields = [Item._meta.get_field("image"), CustomUser._meta.get_field("profile_picture")]
+        self.original_storages = [field.storage for field in self.fields]
+        for field in self.fields:
+            field.storage = self.storage
+
+        self.librarian = CustomUser.objects.create_user(
+            username="lib", email="librarian@test.com", password="pass", role="librarian"
+        )
+        self.patron = CustomUser.objects.create_user(username="pat", email="patron@test.com", password="pass")
+        self.client.login(username="lib", password="pass")
+
+    def tearDown(self):
+        for field, storage in zip(self.fields, self.original_storages):
+            field.storage = storage
+        self.aws.stop()
+
+    def presign(self, kind="item", content_type="image/jpeg"):
+        return self.client.post(reverse("api_presign_upload"), {"kind": kind, "content_type": content_type})
+
+    def upload(self, presigned, content=None):
+        """POST a file to the presigned URL, as direct_upload.js does."""
+        return requests.post(
+            presigned["url"],
+            data=presigned["fields"],
+            files={"file": ("saw.jpg", content or make_image(1200, 900), "image/jpeg")},
+        )
+
+    def post_item(self, token, identifier="saw001"):
+        return self.client.post(reverse("add_item"), {
+            "name": "Saw",
+            "identifier": identifier,
+            "status": "available",
+            "location": "main_warehouse",
+            "description": "Hand saw",
+            "image_token": token,
+        })
+
+    def test_presign_returns_post_for_fresh_key(self):
+        response = self.presign()
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        key = data["fields"]["key"]
+        self.assertRegex(key, r"^media/items/[0-9a-f]{32}\.jpg$")
+        self.assertEqual(data["fields"]["Content-Type"], "image/jpeg")
+        self.assertIn(settings.AWS_STORAGE_BUCKET_NAME, data["url"])
+        self.assertTrue(data["token"])
+
+    def test_presign_validates_request(self):
+        self.assertEqual(self.presign(kind="bogus").status_code, 400)
+        self.assertEqual(self.presign(content_type="text/html").status_code, 400)
+        self.assertEqual(self.presign(content_type="image/svg+xml").status_code, 400)
+        self.client.login(username="pat", password="pass")
+        self.assertEqual(self.presign(kind="item").status_code, 403)
+        self.assertEqual(self.presign(kind="profile").status_code, 200)
+
+    def test_key_extension_follows_content_type(self):
+        key = self.presign(content_type="image/png").json()["fields"]["key"]
+        self.assertTrue(key.endswith(".png"))
+
+    def test_token_is_single_use(self):
+        presigned = self.presign().json()
+        self.upload(presigned)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post_item(presigned["token"], identifier="saw001")
+            self.post_item(presigned["token"], identifier="saw002")
+        name = presigned["fields"]["key"].removeprefix("media/")
+        self.assertEqual(Item.objects.get(identifier="saw001").image.name, name)
+        self.assertFalse(Item.objects.get(identifier="saw002").image)
+
+    def test_upload_that_is_not_an_image_is_rejected(self):
+        presigned = self.presign().json()
+        self.upload(presigned, content=b"<html><script>alert(1)</script></html>")
+        with self.assertLogs("toolhub.uploads", level="WARNING"), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.post_item(presigned["token"])
+        item = Item.objects.get(identifier="saw001")
+        self.assertFalse(item.image)
+        self.assertFalse(item.image_processing)
+        self.assertFalse(self.storage.exists(presigned["fields"]["key"].removeprefix("media/")))
+
+    def test_presign_needs_s3_storage(self):
+        for field in self.fields:
+            field.storage = FileSystemStorage(location=tempfile.gettempdir())
+        self.assertEqual(self.presign().status_code, 400)
+
+    def test_direct_upload_is_claimed_and_processed(self):
+        presigned = self.presign().json()
+        self.assertEqual(self.upload(presigned).status_code, 204)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.post_item(presigned["token"])
+        item = Item.objects.get(identifier="saw001")
+        self.assertEqual(item.image.name, presigned["fields"]["key"].removeprefix("media/"))
+        self.assertTrue(item.image_processing)
+        self.assertEqual(item.image_derivatives, {})
+
+        for callback in callbacks:
+            callback()
+        item.refresh_from_db()
+        self.assertFalse(item.image_processing)
+        self.assertEqual(item.image_derivatives["source"], item.image.name)
+        for name in item.image_derivatives["variants"]["card"]["webp"].values():
+            self.assertTrue(self.storage.exists(name))
+
+    def test_replaced_picture_deleted_after_direct_upload(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.presign(kind="profile").json()
+            self.upload(first)
+            self.client.post(reverse("upload_profile_picture"), {"profile_picture_token": first["token"]})
+            second = self.presign(kind="profile").json()
+            self.upload(second)
+            self.client.post(reverse("upload_profile_picture"), {"profile_picture_token": second["token"]})
+
+        self.librarian.refresh_from_db()
+        self.assertEqual(self.librarian.profile_picture.name, second["fields"]["key"].removeprefix("media/"))
+        self.assertFalse(self.storage.exists(first["fields"]["key"].removeprefix("media/")))
+
+    def test_upload_that_never_arrived_is_reverted(self):
+        presigned = self.presign().json()
+        with self.assertLogs("toolhub.uploads", level="WARNING"), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.post_item(presigned["token"])
+        item = Item.objects.get(identifier="saw001")
+        self.assertFalse(item.image)
+        self.assertFalse(item.image_processing)
+
+    def test_replaced_files_deleted_in_one_batch(self):
+        names = [self.storage.save(f"profile_pictures/{i}.jpg", BytesIO(b"x")) for i in range(3)]
+        bucket = self.storage.bucket
+        with patch.object(bucket, "delete_objects", wraps=bucket.delete_objects) as delete_objects:
+            uploads.delete_files(self.storage, names)
+        self.assertEqual(delete_objects.call_count, 1)
+        self.assertFalse(any(self.storage.exists(name) for name in names))
+
+    def test_forged_or_foreign_tokens_are_ignored(self):
+        presigned = self.presign().json()
+        self.upload(presigned)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post_item(presigned["token"] + "x", identifier="saw001")
+        self.assertFalse(Item.objects.get(identifier="saw001").image)
+
+        # A token is only good for its own user and field.
+        self.client.login(username="pat", password="pass")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("upload_profile_picture"), {"profile_picture_token": presigned["token"]})
+        self.patron.refresh_from_db()
+        self.assertFalse(self.patron.profile_picture)
+
+
+@override_settings(**TEST_SETTINGS)
+class ApprovalRaceTests(TransactionTestCase):
+    """Concurrent approvals run on real threads, each with its own connection."""
+
+    CONTENDERS = 8
+
+    def setUp(self):
+        self.item = Item.objects.create(name="Drill", identifier="drill001", status="available")
+        self.requests = [
+            BorrowRequest.objects.create(
+                item=self.item,
+                user=CustomUser.objects.create_user(username=f"patron{i}", email=f"patron{i}@test.com"),
+            )
+            for i in range(self.CONTENDERS)
+        ]
+
+    def approve_concurrently(self, request_ids):
+        barrier = threading.Barrier(len(request_ids))
+        winners, losers = [], []
+
+        def contend(request_id):
+            try:
+                barrier.wait()
+                for _ in range(50):
+                    try:
+                        approve_request(request_id, date(2030, 1, 1))
+                        winners.append(request_id)
+                        return
+                    except OperationalError:
+                        # SQLite refuses a second writer instead of blocking; retry like a busy client.
+                        time.sleep(0.01)
+                    except ValidationError:
+                        losers.append(request_id)
+                        return
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=contend, args=(pk,)) for pk in request_ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return winners, losers
+
+    def test_exactly_one_approval_wins(self):
+        winners, losers = self.approve_concurrently([r.pk for r in self.requests])
+
+        self.assertEqual(len(winners), 1)
+        self.assertEqual(len(losers), self.CONTENDERS - 1)
+        winner = BorrowRequest.objects.get(pk=winners[0])
+        self.assertEqual(winner.status, "approved")
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.status, "currently_borrowed")
+        self.assertEqual(self.item.borrower_id, winner.user_id)
+        statuses = BorrowRequest.objects.exclude(pk=winner.pk).values_list("status", flat=True)
+        self.assertEqual(set(statuses), {"denied"})
+
+    def test_same_request_approved_twice(self):
+        request_id = self.requests[0].pk
+        winners, losers = self.approve_concurrently([request_id, request_id])
+        self.assertEqual((len(winners), len(losers)), (1, 1))
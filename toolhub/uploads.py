@@ -0,0 +1,404 @@
+"""
+Image uploads processed off the request thread.
+
+Form views call ``stage()`` before saving: the uploaded file is written to
+local staging storage instead of S3, the object keeps its previously stored
+image and is flagged ``<field>_processing``. ``process_later()`` queues the
+staged file once the transaction commits; a worker thread then uploads it to
+the field's storage, renders the derivatives (toolhub.images), deletes the
+replaced file and clears the flag. Web workers never wait on S3.
+
+Staged files are on the web dyno's own disk, so the queue is a thread pool in
+the same process (``TOOLHUB_UPLOAD_WORKERS`` threads). With
+``TOOLHUB_UPLOADS_EAGER`` the job runs inline at commit instead. Every job is
+also recorded as an ``UploadJob`` row in the object's transaction and deleted
+once it finishes, so jobs a crash, deploy or worker recycle takes down with
+the process aren't lost: ``recover()`` (run periodically by each gunicorn
+worker, or ``manage.py recover_uploads``) replays them or, when the staged
+file is gone, clears the processing flag.
+
+Browsers can also skip the app entirely: ``presign()`` hands out a presigned
+S3 POST for a fresh key plus a signed token naming it. The browser uploads
+the file straight to the bucket and submits only the token as
+``<field>_token``; ``stage()`` then records the key and ``finalize()``
+checks the object arrived and is an image before rendering its derivatives.
+Only raster image types are presigned, and a key can be claimed by one
+object only.
+
+Files that are no longer referenced go to ``delete_later()``: they are
+queued at commit and a worker deletes whatever has piled up, on S3 up to
+1000 keys per request.
+"""
+import logging
+import os
+import posixpath
+import queue
+import socket
+import threading
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.apps import apps
+from django.conf import settings
+from django.core import signing
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils.timezone import now
+from . import images
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_deletes = queue.SimpleQueue()
+
+# Direct upload kind -> (model label, image field, key prefix)
+DIRECT_UPLOADS = {
+    "item": ("toolhub.Item", "image", "items"),
+    "collection": ("toolhub.Collection", "image", "items"),
+    "profile": ("toolhub.CustomUser", "profile_picture", "profile_pictures"),
+}
+# Content types a direct upload may declare, with the key extension for each.
+# Anything else, SVG and HTML above all, could be served from the bucket as
+# active content.
+CONTENT_TYPES = {"image/jpeg": ".jpg", "image/png": ".png", "image/gif": ".gif", "image/webp": ".webp"}
+SIGNING_SALT = "toolhub.uploads"
+# How long after presigning the uploaded key may still be claimed by a form.
+TOKEN_MAX_AGE = 6 * 60 * 60
+# A lost job is replayed at most this many times before it is abandoned.
+MAX_ATTEMPTS = 3
+# Lost jobs staged on another host are left to that host for this long.
+ABANDON_AFTER = timedelta(days=1)
+
+
+def staging_storage():
+    return FileSystemStorage(location=settings.TOOLHUB_UPLOAD_STAGING_DIR)
+
+
+def processing_field(field):
+    return f"{field}_processing"
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.TOOLHUB_UPLOAD_WORKERS, thread_name_prefix="toolhub-upload"
+        )
+    return _executor
+
+
+def _host():
+    return os.environ.get("DYNO") or socket.gethostname()
+
+
+def _jobs():
+    return apps.get_model("toolhub.UploadJob")._default_manager
+
+
+def _key(storage, name):
+    return posixpath.join(storage.location, name) if storage.location else name
+
+
+def _run(job, *args):
+    if settings.TOOLHUB_UPLOADS_EAGER:
+        job(*args)
+    else:
+        _get_executor().submit(job, *args)
+
+
+def presign(kind, content_type, user):
+    """
+    Presign a direct browser-to-S3 POST of one image for ``kind`` (a key of
+    ``DIRECT_UPLOADS``). Returns ``{"url", "fields", "token"}``; raises
+    ``ValueError`` for a content type outside ``CONTENT_TYPES`` or if the
+    field's storage isn't an S3 bucket.
+    """
+    if content_type not in CONTENT_TYPES:
+        raise ValueError("Only JPEG, PNG, GIF and WebP images can be uploaded.")
+    label, field, prefix = DIRECT_UPLOADS[kind]
+    storage = apps.get_model(label)._meta.get_field(field).storage
+    if not hasattr(storage, "bucket"):
+        raise ValueError("Direct uploads need S3 storage.")
+
+    name = f"{prefix}/{uuid.uuid4().hex}{CONTENT_TYPES[content_type]}"
+    key = _key(storage, name)
+    post = storage.bucket.meta.client.generate_presigned_post(
+        storage.bucket_name,
+        key,
+        Fields={"Content-Type": content_type},
+        Conditions=[
+            {"Content-Type": content_type},
+            ["content-length-range", 1, settings.TOOLHUB_MAX_UPLOAD_SIZE],
+        ],
+        ExpiresIn=settings.TOOLHUB_DIRECT_UPLOAD_EXPIRES,
+    )
+    token = signing.dumps({"kind": kind, "name": name, "user": user.pk}, salt=SIGNING_SALT)
+    return {"url": post["url"], "fields": post["fields"], "token": token}
+
+
+def _stored_name(instance, field):
+    if not instance.pk:
+        return None
+    return instance._meta.model._default_manager.filter(pk=instance.pk).values_list(field, flat=True).first()
+
+
+def _in_use(name, exclude=None):
+    """Whether an object other than ``exclude`` stores ``name`` in one of its image fields."""
+    for label, field in {(label, field) for label, field, _ in DIRECT_UPLOADS.values()}:
+        queryset = apps.get_model(label)._default_manager.filter(**{field: name})
+        if exclude is not None and exclude._meta.label == label and exclude.pk:
+            queryset = queryset.exclude(pk=exclude.pk)
+        if queryset.exists():
+            return True
+    return False
+
+
+def _delete_replaced(fieldfile, replaced):
+    if replaced and replaced != fieldfile.name and not _in_use(replaced):
+        fieldfile.storage.delete(replaced)
+
+
+def _claim(instance, field, token, user):
+    try:
+        data = signing.loads(token, salt=SIGNING_SALT, max_age=TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    label, target, _ = DIRECT_UPLOADS.get(data.get("kind"), (None, None, None))
+    if (label, target) != (instance._meta.label, field) or data.get("user") != user.pk:
+        return None
+
+    previous = _stored_name(instance, field)
+    # Tokens are single-use: a key another object already holds would be
+    # deleted from under it when that object's image is replaced.
+    if previous == data["name"] or _in_use(data["name"], exclude=instance):
+        return None
+    setattr(instance, field, data["name"])
+    setattr(instance, processing_field(field), True)
+    return finalize, previous or ""
+
+
+def stage(instance, field, request=None):
+    """
+    If ``instance.<field>`` holds a new upload, move it to staging storage,
+    put the currently stored file back on the instance and flag it as
+    processing. If instead ``request`` carries a valid ``<field>_token`` from
+    ``presign()``, point the field at the directly uploaded key. Returns a
+    ticket for ``process_later()``, or None.
+    """
+    token = request.POST.get(f"{field}_token") if request is not None else None
+    if token:
+        return _claim(instance, field, token, request.user)
+
+    fieldfile = getattr(instance, field)
+    if not fieldfile or fieldfile._committed:
+        return None
+
+    filename = os.path.basename(fieldfile.name)
+    staged_name = staging_storage().save(
+        f"{uuid.uuid4().hex}{os.path.splitext(filename)[1]}", fieldfile.file
+    )
+    setattr(instance, field, _stored_name(instance, field) or None)
+    setattr(instance, processing_field(field), True)
+    return process, staged_name, filename
+
+
+def process_later(instance, field, ticket):
+    """
+    Record the job for the upload staged by ``stage()`` and queue it to run
+    after commit.
+    """
+    if ticket is None:
+        return
+    job, *rest = ticket
+    label = instance._meta.label
+    record = _jobs().create(
+        label=label, object_id=instance.pk, field=field, job=job.__name__, args=rest, host=_host()
+    )
+    transaction.on_commit(lambda: _run(_tracked, record.pk, job, label, instance.pk, field, *rest))
+
+
+def _tracked(job_id, job, *args):
+    try:
+        job(*args)
+    finally:
+        _jobs().filter(pk=job_id).delete()
+        if not settings.TOOLHUB_UPLOADS_EAGER:
+            connection.close()
+
+
+def process(label, pk, field, staged_name, filename):
+    """Store a staged upload on object ``pk`` and bring its derivatives up to date."""
+    model = apps.get_model(label)
+    manager = model._default_manager
+    try:
+        instance = manager.get(pk=pk)
+        fieldfile = getattr(instance, field)
+        replaced = fieldfile.name
+        with staging_storage().open(staged_name) as staged:
+            fieldfile.save(filename, File(staged), save=False)
+        manager.filter(pk=pk).update(**{field: fieldfile.name, processing_field(field): False})
+        setattr(instance, processing_field(field), False)
+
+        images.generate(instance)
+        _delete_replaced(fieldfile, replaced)
+    except model.DoesNotExist:
+        pass  # deleted while the upload was queued
+    except Exception:
+        logger.exception("Processing upload %s for %s %s failed", staged_name, label, pk)
+        # Drop the placeholder; the object keeps whichever image was stored last.
+        manager.filter(pk=pk).update(**{processing_field(field): False})
+    finally:
+        staging_storage().delete(staged_name)
+
+
+def finalize(label, pk, field, replaced):
+    """
+    Finish a direct upload claimed by ``stage()``: if the object never reached
+    the bucket, or isn't an image, put ``replaced`` back; otherwise render its
+    derivatives and delete ``replaced``.
+    """
+    model = apps.get_model(label)
+    manager = model._default_manager
+    try:
+        instance = manager.get(pk=pk)
+        fieldfile = getattr(instance, field)
+        if not fieldfile.storage.exists(fieldfile.name):
+            logger.warning("Direct upload %s for %s %s never arrived", fieldfile.name, label, pk)
+            manager.filter(pk=pk).update(**{field: replaced, processing_field(field): False})
+            return
+        if not images.is_upload_image(fieldfile.storage, fieldfile.name):
+            logger.warning("Direct upload %s for %s %s is not an image", fieldfile.name, label, pk)
+            manager.filter(pk=pk).update(**{field: replaced, processing_field(field): False})
+            fieldfile.storage.delete(fieldfile.name)
+            return
+        manager.filter(pk=pk).update(**{processing_field(field): False})
+        setattr(instance, processing_field(field), False)
+
+        images.generate(instance)
+        _delete_replaced(fieldfile, replaced)
+    except model.DoesNotExist:
+        pass
+    except Exception:
+        logger.exception("Finalizing direct upload for %s %s failed", label, pk)
+        manager.filter(pk=pk).update(**{processing_field(field): False})
+
+
+JOBS = {"process": process, "finalize": finalize}
+
+
+def recover(older_than=None):
+    """
+    Deal with upload jobs queued more than ``older_than`` (default
+    ``TOOLHUB_UPLOAD_RECOVER_AFTER`` seconds) ago, which the process running
+    them must have lost: replay them, or clear the object's processing flag
+    when they can't be replayed, so it keeps showing its last stored image.
+    Staged uploads are replayed only on the host that staged them. Staged
+    files no job refers to are deleted. Returns ``(replayed, abandoned)``.
+    """
+    host = _host()
+    cutoff = now() - (older_than or timedelta(seconds=settings.TOOLHUB_UPLOAD_RECOVER_AFTER))
+    staging = staging_storage()
+    replayed = abandoned = 0
+    for record in _jobs().filter(queued_at__lt=cutoff).order_by("queued_at"):
+        here = record.job == "finalize" or record.host == host
+        if not here and record.queued_at >= now() - ABANDON_AFTER:
+            continue
+        # Several workers sweep at once; whoever moves queued_at first owns the job.
+        claimed = _jobs().filter(pk=record.pk, queued_at=record.queued_at).update(
+            queued_at=now(), attempts=F("attempts") + 1
+        )
+        if not claimed:
+            continue
+        staged = here and (record.job == "finalize" or staging.exists(record.args[0]))
+        if staged and record.attempts < MAX_ATTEMPTS:
+            logger.warning("Replaying lost upload job %s", record)
+            _tracked(record.pk, JOBS[record.job], record.label, record.object_id, record.field, *record.args)
+            replayed += 1
+        else:
+            logger.warning("Abandoning lost upload job %s", record)
+            _abandon(record, staging if record.host == host else None)
+            abandoned += 1
+    _delete_orphans(staging, cutoff)
+    return replayed, abandoned
+
+
+def _abandon(record, staging):
+    apps.get_model(record.label)._default_manager.filter(pk=record.object_id).update(
+        **{processing_field(record.field): False}
+    )
+    if record.job == "process" and staging is not None:
+        staging.delete(record.args[0])
+    _jobs().filter(pk=record.pk).delete()
+
+
+def _delete_orphans(staging, cutoff):
+    try:
+        _, names = staging.listdir("")
+    except FileNotFoundError:
+        return
+    queued = {args[0] for args in _jobs().filter(job="process", host=_host()).values_list("args", flat=True)}
+    for name in names:
+        if name not in queued and staging.get_modified_time(name) < cutoff:
+            staging.delete(name)
+
+
+def _recover_in_background():
+    try:
+        recover()
+    except Exception:
+        logger.exception("Recovering lost upload jobs failed")
+    finally:
+        connection.close()
+
+
+def schedule_recovery(interval=None):
+    """Run ``recover()`` on the upload threads every ``TOOLHUB_UPLOAD_RECOVER_INTERVAL`` seconds."""
+    interval = interval or settings.TOOLHUB_UPLOAD_RECOVER_INTERVAL
+
+    def tick():
+        _get_executor().submit(_recover_in_background)
+        schedule_recovery(interval)
+
+    timer = threading.Timer(interval, tick)
+    timer.daemon = True
+    timer.start()
+
+
+def delete_later(storage, name):
+    """Delete ``name`` from ``storage`` in the background once the transaction commits."""
+
+    def enqueue():
+        _deletes.put((storage, name))
+        _run(_flush_deletes)
+
+    transaction.on_commit(enqueue)
+
+
+def delete_files(storage, names):
+    """Delete ``names`` from ``storage``, batched into ``DeleteObjects`` requests on S3."""
+    if not hasattr(storage, "bucket"):
+        for name in names:
+            storage.delete(name)
+        return
+    keys = [{"Key": _key(storage, name)} for name in names]
+    for start in range(0, len(keys), 1000):
+        storage.bucket.delete_objects(Delete={"Objects": keys[start:start + 1000], "Quiet": True})
+
+
+def _flush_deletes():
+    # Whoever runs first takes everything queued so far; later runs find less.
+    batches = defaultdict(list)
+    while True:
+        try:
+            storage, name = _deletes.get_nowait()
+        except queue.Empty:
+            break
+        batches[storage].append(name)
+    for storage, names in batches.items():
+        try:
+            delete_files(storage, names)
+        except Exception:
+            logger.exception("Deleting %d replaced files failed", len(names))
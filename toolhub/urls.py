@@ -24,13 +24,15 @@ from .views.borrow_views import (
     request_borrow,
     approve_borrow,
     deny_borrow,
+    bulk_borrow_action,
     borrow_overview,
+    circulation_dashboard,
     borrow_request_detail,
     cancel_borrow_request,
     return_item,
     
 )
-from .views.api import search_items, search_users_collections
+from .views.api import search_items, search_users_collections, presign_upload, db_pool_stats
 
 def access_denied(request):
     return render(request, "toolhub/access_denied.html")
@@ -62,6 +64,8 @@ urlpatterns = [
     path("collections/", collections_page, name="collections_page"),
     path("api/search-items/", search_items, name="api_search_items"),
     path("api/search-users/", search_users_collections, name="api_search_users"),
+    path("api/uploads/presign/", presign_upload, name="api_presign_upload"),
+    path("api/ops/db-pool/", db_pool_stats, name="api_db_pool_stats"),
 
     # Borrow
     path("borrow/request/<int:request_id>/", borrow_request_detail, name="borrow_request_detail"),
@@ -69,6 +73,8 @@ urlpatterns = [
     # Borrow-Librarian
     path("borrow/approve/<int:request_id>/", approve_borrow, name="approve_borrow"),
     path("borrow/deny/<int:request_id>/", deny_borrow, name="deny_borrow"),
+    path("borrow/bulk/", bulk_borrow_action, name="bulk_borrow_action"),
+    path("borrow/dashboard/", circulation_dashboard, name="circulation_dashboard"),
 
     # Borrow-Patron
     path("items/<int:item_id>/request-borrow/", request_borrow, name="request_borrow"),
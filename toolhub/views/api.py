@@ -1,36 +1,95 @@
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.core.exceptions import PermissionDenied
 from django.http import JsonResponse
-from django.db.models import Q
+from django.views.decorators.http import require_POST
 from ..models import Item, CustomUser
+from ..search import typeahead
+from mysite import database
+from .. import cache, uploads
 
-def search_items(request):
-    q = request.GET.get("q", "")
-    items = Item.objects.filter(name__icontains=q)[:10]
-
-    data = [
-        {
-            "id":     i.id,
-            "name":   i.name,
-            "title":  i.name,
-            "status": i.status,
-            "status_display": i.status_for_user(request.user),
-        }
-        for i in items
-    ]
-    return JsonResponse(data, safe=False)
-
-
-def search_users_collections(request):
-    q = request.GET.get("q", "")
-    users = CustomUser.objects.filter(
-        Q(username__icontains=q) | Q(email__icontains=q)
-    )[:10]
-
-    data = [
-        {
-            "id":    u.id,
-            "name":  u.full_name or u.username,
-            "email": u.email,
-        }
-        for u in users
-    ]
-    return JsonResponse(data, safe=False)
+
+def _typeahead_query(request):
+    """Return the normalized ``q`` parameter, or None if it is too short to search."""
+    q = request.GET.get("q", "").strip().lower()
+    if len(q) < settings.TOOLHUB_TYPEAHEAD_MIN_LENGTH:
+        return None
+    return q
+
+
+async def search_items(request):
+    q = _typeahead_query(request)
+    if q is None:
+        return JsonResponse([], safe=False)
+    user = await request.auser()
+
+    async def build():
+        items = (
+            typeahead(Item.objects.only("id", "name", "status", "borrower"), ["name"], q)
+            .order_by("name", "pk")
+            .with_user_status(user)[: settings.TOOLHUB_TYPEAHEAD_LIMIT]
+        )
+        return [
+            {
+                "id":     i.id,
+                "name":   i.name,
+                "title":  i.name,
+                "status": i.status,
+                "status_display": i.user_status,
+            }
+            async for i in items
+        ]
+
+    # status_display depends on the user's own borrow requests
+    viewer = cache.viewer_key(user, per_user=True)
+    return JsonResponse(await cache.acached(cache.ITEM_SEARCH, q, viewer, build), safe=False)
+
+
+async def search_users_collections(request):
+    q = _typeahead_query(request)
+    if q is None:
+        return JsonResponse([], safe=False)
+    user = await request.auser()
+
+    async def build():
+        users = (
+            typeahead(CustomUser.objects.all(), ["username", "email"], q)
+            .order_by("username", "pk")
+            .values("id", "username", "first_name", "last_name", "email")[: settings.TOOLHUB_TYPEAHEAD_LIMIT]
+        )
+        return [
+            {
+                "id":    u["id"],
+                "name":  f"{u['first_name']} {u['last_name']}".strip() or u["username"],
+                "email": u["email"],
+            }
+            async for u in users
+        ]
+
+    viewer = cache.viewer_key(user)
+    return JsonResponse(await cache.acached(cache.USER_SEARCH, q, viewer, build), safe=False)
+
+
+@login_required
+@require_POST
+def presign_upload(request):
+    """Presign a direct browser-to-S3 image upload; see toolhub.uploads."""
+    kind = request.POST.get("kind", "")
+    content_type = request.POST.get("content_type", "")
+    if kind not in uploads.DIRECT_UPLOADS or content_type not in uploads.CONTENT_TYPES:
+        return JsonResponse({"error": "Expected kind and a JPEG, PNG, GIF or WebP content_type."}, status=400)
+    if kind == "item" and request.user.role != "librarian":
+        return JsonResponse({"error": "Only librarians can upload item images."}, status=403)
+    try:
+        return JsonResponse(uploads.presign(kind, content_type, request.user))
+    except ValueError as error:
+        # Not on S3 (e.g. local storage): the browser falls back to a form upload.
+        return JsonResponse({"error": str(error)}, status=400)
+
+
+@login_required
+def db_pool_stats(request):
+    """This worker process's database connection reuse, for monitoring."""
+    if not request.user.is_staff:
+        raise PermissionDenied("Only staff can view connection statistics.")
+    return JsonResponse(database.pool_stats())
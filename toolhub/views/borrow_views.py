@@ -1,12 +1,17 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.core.exceptions import PermissionDenied
+from django.core.exceptions import PermissionDenied, ValidationError
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.views.decorators.http import require_POST
+from django.http import HttpResponseBadRequest, JsonResponse
+from django.template.defaultfilters import pluralize
 from django.utils.timezone import now
-from datetime import timedelta
-from ..models import BorrowRequest, Item
+from collections import Counter
+from ..models import ACTIVE_BORROW_STATUSES, BorrowRequest, Item
+from ..borrowing import approve_request, bulk_process, default_due_date
 from ..forms import BorrowRequestForm
+from ..pagination import paginate
+from .. import stats
 
 @login_required
 def request_borrow(request, item_id):
@@ -17,7 +22,7 @@ def request_borrow(request, item_id):
     if BorrowRequest.objects.filter(
             item=item,
             user=request.user,
-            status__in=["pending", "approved"],
+            status__in=ACTIVE_BORROW_STATUSES,
     ).exists():
         messages.warning(request, "You already have an active borrow request for this item.")
         return redirect(request.META.get("HTTP_REFERER", "tools_page"))
@@ -50,19 +55,41 @@ def approve_borrow(request, request_id):
         raise PermissionDenied("Only librarians can approve requests.")
 
     borrow_request = get_object_or_404(BorrowRequest, id=request_id)
-    item = borrow_request.item
 
-    if item.status == "borrowed":
-        messages.warning(request, f"Item '{item.name}' is already borrowed.")
+    try:
+        borrow_request, denied = approve_request(borrow_request.pk, default_due_date())
+    except ValidationError as e:
+        messages.warning(request, e.messages[0])
     else:
-        borrow_request.status = "approved"
-        borrow_request.return_due_date = now().date() + timedelta(days=14)
-        borrow_request.save()
-        item.status = "currently_borrowed"
-        item.borrower = borrow_request.user
-        item.save()
-        messages.success(request, f"Approved request and marked '{item.name}' as borrowed.")
+        message = f"Approved request and marked '{borrow_request.item.name}' as borrowed."
+        if denied:
+            message += f" Denied {denied} other pending request{'s' if denied != 1 else ''} for it."
+        messages.success(request, message)
+
+    return redirect("my_borrow_requests")
+
+
+@login_required
+@require_POST
+def bulk_borrow_action(request):
+    """
+    Approve or deny every request in ``request_ids`` at once. Answers JSON
+    clients with the outcome per id; the request queue page gets a summary message.
+    """
+    if request.user.role != "librarian":
+        raise PermissionDenied("Only librarians can approve or deny requests.")
+
+    try:
+        results = bulk_process(request.POST.getlist("request_ids"), request.POST.get("action"))
+    except ValueError:
+        return HttpResponseBadRequest("Expected action=approve|deny and integer request_ids.")
+
+    if "application/json" in request.headers.get("Accept", ""):
+        return JsonResponse({"results": {str(pk): outcome for pk, outcome in results.items()}})
 
+    outcomes = Counter(results.values())
+    summary = ", ".join(f"{count} {outcome.replace('_', ' ')}" for outcome, count in outcomes.items())
+    messages.info(request, f"Processed {len(results)} request{pluralize(len(results))}: {summary or 'none selected'}.")
     return redirect("my_borrow_requests")
 
 
@@ -103,15 +130,30 @@ def borrow_overview(request):
     """
     if request.user.role == "librarian":
         # Get all borrow requests with related item and user
-        borrow_requests = BorrowRequest.objects.select_related("item", "user").order_by("-request_date")
+        borrow_requests = BorrowRequest.objects.select_related("item", "user")
         template = "toolhub/borrow/borrow_requests.html"
     else:  # patron
-        borrow_requests = BorrowRequest.objects.filter(user=request.user).order_by("-request_date")
+        borrow_requests = BorrowRequest.objects.filter(user=request.user).select_related("item")
         template = "toolhub/borrow/borrow_history.html"
-    
+
+    borrow_requests = paginate(request, borrow_requests, ordering=("-request_date", "-pk"))
     return render(request, template, {"borrow_requests": borrow_requests})
 
 
+@login_required
+def circulation_dashboard(request):
+    """Librarian dashboard of borrowing activity, read from the daily rollups."""
+    if request.user.role != "librarian":
+        raise PermissionDenied("Only librarians can view circulation statistics.")
+
+    try:
+        days = int(request.GET.get("days", 30))
+    except ValueError:
+        days = 30
+    days = max(1, min(days, 365))
+    return render(request, "toolhub/borrow/dashboard.html", stats.dashboard(days))
+
+
 @login_required
 def borrow_request_detail(request, request_id):
     """View details of a specific borrow request."""
@@ -155,10 +197,10 @@ def return_item(request, item_id):
         item.borrower = None
         item.save()
 
-        # Find the most recent approved borrow request
+        # Find the most recent approved (possibly already overdue) borrow request
         borrow_request = (
             BorrowRequest.objects
-            .filter(item=item, user=request.user, status="approved")
+            .filter(item=item, user=request.user, status__in=["approved", "overdue"])
             .order_by('-request_date')
             .first()
         )
@@ -167,7 +209,7 @@ def return_item(request, item_id):
             today = now().date()
             due_date = borrow_request.return_due_date
 
-            if due_date and today > due_date:
+            if borrow_request.status == "overdue" or (due_date and today > due_date):
                 borrow_request.status = "returned_overdue"
             else:
                 borrow_request.status = "returned_on_time"
@@ -1,8 +1,12 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.core.exceptions import PermissionDenied
 from django.contrib.auth.decorators import login_required
-from ..models import Collection, BorrowRequest
+from django.db.models import Prefetch
+from ..models import Collection, Item
 from ..forms import CollectionForm
+from ..pagination import paginate
+from ..search import search, RANKED_ORDERING
+from .. import uploads
 
 @login_required
 def add_collection(request):
@@ -14,10 +18,12 @@ def add_collection(request):
             form.fields["visibility"].choices = [("public", "Public")]
 
         if form.is_valid():
+            staged = uploads.stage(form.instance, "image", request)
             collection = form.save(commit=False)
             collection.creator = request.user
             collection.save()
             form.save_m2m()
+            uploads.process_later(collection, "image", staged)
             return redirect("home")
     else:
         form = CollectionForm()
@@ -36,16 +42,8 @@ def view_collection(request, collection_uuid):
         if not (is_librarian or is_allowed_user or is_creator):
             return redirect("access_denied")
 
-    # Add already_requested logic for items in the collection
-    items = collection.items.all()
-    for item in items:
-        item.already_requested = False
-        if request.user.is_authenticated:
-            item.already_requested = BorrowRequest.objects.filter(
-                item=item,
-                user=request.user,
-                status__in=["pending", "approved"]
-            ).exists()
+    # Annotate already_requested / user_status for every item in one query
+    items = collection.items.with_user_status(request.user)
 
     return render(
         request,
@@ -64,6 +62,7 @@ def edit_collection(request, collection_uuid):
         print(request.POST)  # DEBUG
         form = CollectionForm(request.POST, request.FILES, instance=collection)
         if form.is_valid():
+            staged = uploads.stage(form.instance, "image", request)
             collection = form.save(commit=False)
 
             # Update items and allowed_users before saving
@@ -78,6 +77,7 @@ def edit_collection(request, collection_uuid):
                 collection.allowed_users.clear()
 
             collection.save()  # Save the collection after updating relationships
+            uploads.process_later(collection, "image", staged)
             return redirect("view_collection", collection_uuid=str(collection.uuid))
         else:
             print("Form errors:", form.errors)  # DEBUG
@@ -107,21 +107,15 @@ def collections_page(request):
     query = request.GET.get("q", "")
     collections = Collection.objects.all()
     if query:
-        collections = collections.filter(title__icontains=query)
+        collections = search(collections, query)
     # Only show public collections to anonymous users
     if not request.user.is_authenticated:
         collections = collections.filter(visibility="public")
 
-    # Add already_requested logic for items in each collection
-    for collection in collections:
-        for item in collection.items.all():
-            item.already_requested = False
-            if request.user.is_authenticated:
-                item.user_status = item.status_for_user(request.user)
-                item.already_requested = BorrowRequest.objects.filter(
-                    item=item,
-                    user=request.user,
-                    status__in=["pending", "approved"]
-                ).exists()
+    # Load every collection's items, already annotated for this user, in one query
+    collections = collections.prefetch_related(
+        Prefetch("items", queryset=Item.objects.with_user_status(request.user))
+    )
+    collections = paginate(request, collections, ordering=RANKED_ORDERING if query else ("pk",))
 
     return render(request, "toolhub/collections/collections_page.html", {"collections": collections, "query": query})
\ No newline at end of file
@@ -1,6 +1,7 @@
 from django.shortcuts import render
-from django.db.models import Q
-from ..models import Item, Collection, BorrowRequest
+from ..models import Item, Collection
+from ..pagination import paginate
+from ..search import search, RANKED_ORDERING
 
 def home(request):
     query = request.GET.get("q", "")
@@ -9,32 +10,20 @@ def home(request):
 
     # Filter by search query
     if query:
-        items = items.filter(Q(name__icontains=query) | Q(description__icontains=query))
-        collections = collections.filter(Q(title__icontains=query) | Q(description__icontains=query))
+        items = search(items, query)
+        collections = search(collections, query)
 
-    # Anonymous users: only public collections and items in public collections or not in any collection
+    # Collections: public ones, plus private ones the user created or was given access to
+    collections = collections.accessible_to(request.user)
+
+    # Anonymous users: only items in a public collection or in no collection at all
     if not request.user.is_authenticated:
-        collections = collections.filter(visibility="public")
-        items = items.filter(Q(collections__visibility="public") | Q(collections=None)).distinct()
-    elif request.user.role == "librarian":
-        pass  # Librarians see everything
-    else:
-        # Patrons: see all collections, but not items in private collections unless allowed
-        collections = collections.exclude(visibility="private", allowed_users__isnull=True).distinct()
+        items = items.filter(is_publicly_visible=True)
 
-    # Set already_requested for each item
-    for item in items:
-        item.already_requested = False
-        if request.user.is_authenticated:
-            item.user_status = item.status_for_user(request.user)
-            if request.user.role == "patron":
-                item.already_requested = BorrowRequest.objects.filter(
-                    item=item,
-                    user=request.user,
-                    status__in=["pending", "approved"]
-                ).exists()
-        else:
-            item.user_status = item.status_for_user(None)
+    # Resolve the per-user display status for every item in one pass
+    ordering = RANKED_ORDERING if query else ("pk",)
+    items = paginate(request, items.with_user_status(request.user), ordering=ordering, prefix="items_")
+    collections = paginate(request, collections, ordering=ordering, prefix="collections_")
 
     return render(
         request,
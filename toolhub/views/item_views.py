@@ -1,8 +1,13 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from django.core.exceptions import PermissionDenied
 from django.contrib.auth.decorators import login_required
 from ..forms import ItemForm, ItemReviewForm
-from ..models import Item, BorrowRequest
+from ..models import Item
+from ..pagination import apaginate
+from ..search import search, RANKED_ORDERING
+from ..templatetags.card_tags import aprefetch_cards
+from .. import uploads
 from django.views.decorators.http import require_POST
 from django.contrib import messages
 
@@ -14,7 +19,9 @@ def add_item(request):
     if request.method == "POST":
         form = ItemForm(request.POST, request.FILES)
         if form.is_valid():
-            form.save()
+            staged = uploads.stage(form.instance, "image", request)
+            item = form.save()
+            uploads.process_later(item, "image", staged)
             return redirect("home")
     else:
         form = ItemForm()
@@ -30,7 +37,9 @@ def edit_item(request, item_id):
     if request.method == "POST":
         form = ItemForm(request.POST, request.FILES, instance=item)
         if form.is_valid():
-            form.save()
+            staged = uploads.stage(form.instance, "image", request)
+            item = form.save()
+            uploads.process_later(item, "image", staged)
             return redirect("home")
     else:
         form = ItemForm(instance=item)
@@ -43,39 +52,34 @@ def delete_item(request, item_id):
     item.delete()
     return redirect("home")
 
-def tools_page(request):
+async def tools_page(request):
     """Display all tools (items) with search functionality."""
     query = request.GET.get("q", "").strip()
+    user = await request.auser()
     items = Item.objects.all()
 
     if query:
-        items = items.filter(name__icontains=query)
+        items = search(items, query)
 
-    for item in items:
-        item.already_requested = False
-        if request.user.is_authenticated:
-            item.user_status = item.status_for_user(request.user)
-            item.already_requested = BorrowRequest.objects.filter(
-                item=item,
-                user=request.user,
-                status__in=["pending", "approved"]
-            ).exists()
+    ordering = RANKED_ORDERING if query else ("pk",)
+    items = await apaginate(request, items.with_user_status(user), ordering=ordering)
+    await aprefetch_cards(items, "item", user)
 
-    return render(request, "toolhub/items/tools_page.html", {"items": items, "query": query})
+    return render(request, "toolhub/items/tools_page.html", {"items": items, "query": query, "user": user})
 
 @login_required
-def view_item(request, item_id):
+async def view_item(request, item_id):
     """Public / patron / librarian item detail with reviews & rating."""
-    item = get_object_or_404(Item, pk=item_id)
-    item.user_status = item.status_for_user(request.user)
+    user = await request.auser()
+    item = await aget_object_or_404(Item.objects.with_user_status(user), pk=item_id)
 
-    if request.method == "POST" and request.user.role == "patron":
+    if request.method == "POST" and user.role == "patron":
         review_form = ItemReviewForm(request.POST)
-        if review_form.is_valid():
+        if await sync_to_async(review_form.is_valid)():
             review = review_form.save(commit=False)
-            review.user  = request.user
+            review.user  = user
             review.item  = item
-            review.save()
+            await review.asave()
             messages.success(request, "Thanks for your review!")
             return redirect("view_item", item_id=item.id)
     else:
@@ -83,7 +87,8 @@ def view_item(request, item_id):
 
     context = {
         "item": item,
-        "reviews": item.reviews.select_related("user").order_by("-created_at"),
+        "reviews": [review async for review in item.reviews.select_related("user").order_by("-created_at")],
         "form": review_form,
+        "user": user,
     }
     return render(request, "toolhub/items/view_item.html", context)
@@ -6,6 +6,7 @@ from django.core.exceptions import PermissionDenied
 from django.contrib.auth import get_user_model
 from django.db.models import Q
 from ..forms import ProfilePictureForm, UserProfileForm
+from .. import uploads
 
 User = get_user_model()
 
@@ -18,7 +19,9 @@ def upload_picture(request):
     if request.method == "POST":
         form = ProfilePictureForm(request.POST, request.FILES, instance=request.user)
         if form.is_valid():
-            form.save()
+            staged = uploads.stage(form.instance, "profile_picture", request)
+            user = form.save()
+            uploads.process_later(user, "profile_picture", staged)
             messages.success(request, "Profile picture updated successfully!")
             return redirect("profile")
     else:
@@ -29,8 +32,7 @@ def upload_picture(request):
 @login_required
 def clear_profile_picture(request):
     if request.method == "POST":
-        if request.user.profile_picture:
-            request.user.profile_picture.delete(save=False)
+        # CustomUser.save() queues the old file for deletion.
         request.user.profile_picture = None
         request.user.save()
         messages.success(request, "Your profile picture has been cleared.")
@@ -41,7 +43,9 @@ def update_profile(request):
     if request.method == "POST":
         form = UserProfileForm(request.POST, request.FILES, instance=request.user)
         if form.is_valid():
-            form.save()
+            staged = uploads.stage(form.instance, "profile_picture", request)
+            user = form.save()
+            uploads.process_later(user, "profile_picture", staged)
             messages.success(request, "Your profile information has been updated!")
             return redirect("profile")
         else: